@@ -5,7 +5,7 @@ a = Analysis(
     ['monitor_game_gui.py'],
     pathex=[],
     binaries=[],
-    datas=[('monitor_game.py', '.')],
+    datas=[('monitor_game.py', '.'), ('text_matcher.py', '.'), ('ocr_profile.py', '.'), ('latency_metrics.py', '.'), ('workflow.py', '.'), ('detection_cascade.py', '.'), ('screen_index.py', '.'), ('screen_classifier.py', '.'), ('session_recorder.py', '.'), ('workflow.json', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
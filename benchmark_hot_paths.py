@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark end-to-end các hot path phát hiện + thao tác của GameMonitor, không cần điện thoại
+
+Chạy trên corpus screenshot (thư mục con = trạng thái, giống extract_pixel_patterns.py) và
+thiết bị giả của fake_adb_device.py. Đo từng stage:
+
+    decode                  parse screencap raw + tạo PIL Image dùng chung buffer
+    crop                    tính vùng OCR + lấy vùng pixel liền mạch
+    preprocess              grayscale / contrast / sharpen vùng OCR
+    ocr_psm6/11/3           Tesseract với từng PSM mode (bỏ qua nếu chưa cài tesseract)
+    match                   so khớp fuzzy target trên text OCR
+    check_pixel_pattern     mỗi pattern của workflow trên mỗi screenshot
+    smart_verify_pattern    verify qua ADB giả (chụp, burst, delay)
+    execute_click_sequence  chuỗi bước 1-5 đầy đủ trên thiết bị giả
+
+Kết quả (p50/p95/p99, ms) lưu ra JSON làm baseline; chế độ so sánh đánh dấu stage chậm hơn
+baseline quá ngưỡng và trả về exit code 1 (dùng được trong CI).
+
+Cách dùng:
+    python3 benchmark_hot_paths.py corpus/ --save baseline.json
+    python3 benchmark_hot_paths.py corpus/ --script scenario.json --compare baseline.json
+    python3 benchmark_hot_paths.py corpus/ --stages decode preprocess check_pixel_pattern
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmark_ocr_scale import percentile
+from fake_adb_device import (
+    DeviceFarm,
+    FakeDevice,
+    FolderFrames,
+    StateScenario,
+    shim_command,
+)
+from monitor_game import (
+    NUMPY_AVAILABLE,
+    OCR_AVAILABLE,
+    GameMonitor,
+    parse_raw_screencap,
+)
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+    import pytesseract
+
+STAGES = (
+    "decode",
+    "crop",
+    "preprocess",
+    "ocr_psm6",
+    "ocr_psm11",
+    "ocr_psm3",
+    "match",
+    "check_pixel_pattern",
+    "smart_verify_pattern",
+    "execute_click_sequence",
+)
+PSM_CONFIGS = {"ocr_psm6": 6, "ocr_psm11": 11, "ocr_psm3": 3}  # Config lấy từ monitor (kèm OCR profile)
+DEVICE_STAGES = ("smart_verify_pattern", "execute_click_sequence")
+DEFAULT_THRESHOLD = 0.15  # Chậm hơn baseline 15% (p50 hoặc p95) => regression
+DEFAULT_MIN_DELTA_MS = 0.05  # Bỏ qua chênh lệch tuyệt đối nhỏ hơn mức này (nhiễu đo)
+TAIL_MIN_SAMPLES = 20  # p95 chỉ dùng để đánh giá regression khi đủ số mẫu
+# Text mẫu khi không có tesseract: target bị OCR đọc sai 1 ký tự giữa các dòng UI khác
+SYNTHETIC_FILLER = ["Alliance Help", "Daily Tasks 3/5", "Radar", "Hero Recruit 00:12:45"]
+
+
+class StageTimer:
+    """Gom thời gian (giây) theo tên stage, chỉ ghi các stage được chọn"""
+
+    def __init__(self, selected):
+        self.selected = set(selected)
+        self.samples = {}
+
+    def enabled(self, stage):
+        return stage in self.selected
+
+    def measure(self, stage, function, *args):
+        """Gọi function(*args) (luôn chạy vì stage sau có thể cần kết quả), trả về kết quả"""
+        start = time.perf_counter()
+        result = function(*args)
+        if stage in self.selected:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+
+def summarize(values):
+    """Thống kê (ms) của 1 stage"""
+    ms = sorted(v * 1000 for v in values)
+    return {
+        "count": len(ms),
+        "mean": round(statistics.fmean(ms), 4),
+        "min": round(ms[0], 4),
+        "p50": round(percentile(ms, 50), 4),
+        "p95": round(percentile(ms, 95), 4),
+        "p99": round(percentile(ms, 99), 4),
+        "max": round(ms[-1], 4),
+    }
+
+
+def tesseract_version():
+    """Phiên bản tesseract, None nếu chưa cài (bỏ qua các stage OCR)"""
+    if not OCR_AVAILABLE:
+        return None
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return None
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__ if NUMPY_AVAILABLE else None,
+        "tesseract": tesseract_version(),
+    }
+
+
+def synthetic_texts(targets):
+    """Các text OCR mẫu: mỗi target đọc sai 1 ký tự, chen giữa các dòng UI khác"""
+    texts = ["\n".join(SYNTHETIC_FILLER)]
+    for target in targets:
+        middle = len(target) // 2
+        typo = target[:middle] + target[middle + 1 :]
+        texts.append("\n".join(SYNTHETIC_FILLER[:2] + [typo] + SYNTHETIC_FILLER[2:]))
+    return texts
+
+
+def bench_frames(monitor, frames, timer, repeat, has_tesseract):
+    """Các stage chạy trên từng screenshot (không cần thiết bị)"""
+    texts = []
+    matcher = monitor.get_target_matcher()
+    patterns = list(monitor.pixel_patterns)
+    run_ocr = has_tesseract and any(timer.enabled(stage) for stage in PSM_CONFIGS)
+
+    for payloads in frames.states.values():
+        for payload in payloads:
+            for _ in range(repeat):
+                frame_list, mode = timer.measure("decode", parse_raw_screencap, payload)
+                monitor._set_cached_frame(frame_list[0], mode)
+                img = monitor.cached_screenshot
+                width, height = img.size
+
+                def crop():
+                    box = monitor.get_ocr_box(width, height)
+                    left, top, right, bottom = box
+                    return box, np.ascontiguousarray(monitor.cached_frame[top:bottom, left:right])
+
+                box, _ = timer.measure("crop", crop)
+                left, top, right, bottom = box
+                scale = monitor.resolve_ocr_scale()
+                ocr_size = (
+                    max(1, int(round((right - left) * scale))),
+                    max(1, int(round((bottom - top) * scale))),
+                )
+                if timer.enabled("preprocess") or run_ocr:
+                    processed = timer.measure(
+                        "preprocess", monitor.preprocess_ocr_image, img, box, ocr_size
+                    )
+
+                if run_ocr:
+                    for stage, psm in PSM_CONFIGS.items():
+                        if timer.enabled(stage):
+                            text = timer.measure(
+                                stage,
+                                pytesseract.image_to_string,
+                                processed,
+                                "eng",
+                                monitor.tesseract_config(psm),
+                            )
+                            texts.append(text)
+
+                if timer.enabled("check_pixel_pattern"):
+                    for name in patterns:
+                        timer.measure("check_pixel_pattern", monitor.check_pixel_pattern, name)
+
+    if timer.enabled("match"):
+        texts = texts or synthetic_texts(monitor.target_texts)
+        for _ in range(repeat):
+            for text in texts:
+                timer.measure("match", matcher.search_text, text)
+
+
+def bench_device(frames, script, timer, args):
+    """Các stage đi qua ADB (thiết bị giả trong cùng process)"""
+    registry = os.path.join(tempfile.mkdtemp(prefix="bench_adb_"), "registry.json")
+    device = FakeDevice(
+        "bench-00",
+        StateScenario(frames, script, args.frame_interval),
+        latency=args.latency,
+        jitter=args.jitter,
+        screencap_latency=args.screencap_latency,
+        seed=0,
+    )
+    with DeviceFarm([device], registry):
+        monitor = GameMonitor(
+            args.package,
+            None,
+            auto_click=True,
+            click_duration=args.click_duration,
+            device_serial=device.serial,
+            adb_path=shim_command(registry),
+            workflow=args.workflow,
+            burst_frames=args.burst_frames,
+            pattern_search_radius=args.search_radius,
+        )
+        plan = monitor.get_plan(*frames.size)
+        left, top, right, bottom = plan.ocr_box
+        found_coords = ((left + right) // 2, (top + bottom) // 2)
+
+        # Log của monitor không cần thiết khi đo
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if timer.enabled("smart_verify_pattern"):
+                for _ in range(args.repeat):
+                    for name in monitor.pixel_patterns:
+                        device.reset()
+                        monitor.cached_screenshot = None
+                        timer.measure("smart_verify_pattern", monitor.smart_verify_pattern, name)
+
+            if timer.enabled("execute_click_sequence"):
+                for _ in range(args.sequence_runs):
+                    device.reset()
+                    monitor.last_found_coords = found_coords
+                    timer.measure("execute_click_sequence", monitor.execute_click_sequence)
+            monitor.stop_tap_shell()
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """So sánh với baseline
+
+    Returns:
+        (rows, regressions) - rows: (stage, base_p50, p50, base_p95, p95, change, status)
+    """
+    rows, regressions = [], []
+    base_stages = baseline.get("stages", {})
+    for stage in STAGES:
+        current, base = results.get(stage), base_stages.get(stage)
+        if current is None and base is None:
+            continue
+        if base is None:
+            rows.append((stage, None, current["p50"], None, current["p95"], None, "mới"))
+            continue
+        if current is None:
+            rows.append((stage, base["p50"], None, base["p95"], None, None, "không chạy"))
+            continue
+
+        # Ít mẫu thì p95 gần như là max => chỉ so p50
+        keys = ["p50"]
+        if min(current["count"], base["count"]) >= TAIL_MIN_SAMPLES:
+            keys.append("p95")
+        changes = []
+        for key in keys:
+            delta = current[key] - base[key]
+            ratio = delta / base[key] if base[key] > 0 else 0.0
+            changes.append((ratio, delta))
+        worst_ratio, worst_delta = max(changes)
+        if worst_ratio > threshold and worst_delta > min_delta_ms:
+            status = "❌ CHẬM HƠN"
+            regressions.append(stage)
+        elif all(ratio < -threshold and -delta > min_delta_ms for ratio, delta in changes):
+            status = "🚀 nhanh hơn"
+        else:
+            status = "✅ ok"
+        rows.append(
+            (stage, base["p50"], current["p50"], base["p95"], current["p95"], worst_ratio, status)
+        )
+    return rows, regressions
+
+
+def format_ms(value):
+    return f"{value:>10.2f}" if value is not None else f"{'-':>10}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot path phát hiện + thao tác")
+    parser.add_argument("corpus", help="Thư mục screenshot (thư mục con = trạng thái)")
+    parser.add_argument("--script", help="Kịch bản thiết bị giả (xem fake_adb_device.py)")
+    parser.add_argument("--workflow", help="File workflow (mặc định như monitor_game.py)")
+    parser.add_argument("--package", default="com.fun.lastwar.vn.gp")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=20, help="Số lần lặp mỗi screenshot")
+    parser.add_argument("--sequence-runs", type=int, default=3)
+    parser.add_argument("--click-duration", type=float, default=2.0, help="Thời gian click bước 5")
+    parser.add_argument("--burst-frames", type=int, default=3)
+    parser.add_argument("--search-radius", type=int, default=3)
+    parser.add_argument("--frame-interval", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.0, help="Độ trễ ADB giả (giây)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--screencap-latency", type=float, default=0.0)
+    parser.add_argument("--save", help="Lưu kết quả (baseline) ra file JSON")
+    parser.add_argument("--compare", help="So sánh với baseline JSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS)
+    args = parser.parse_args()
+
+    if not NUMPY_AVAILABLE:
+        print("❌ Cần cài numpy, Pillow và pytesseract (pip install -r requirements.txt)")
+        return 1
+
+    script = None
+    if args.script:
+        with open(args.script, "r") as f:
+            script = json.load(f)
+    frames = FolderFrames(args.corpus)
+    count = sum(len(payloads) for payloads in frames.states.values())
+    if not count:
+        print(f"❌ Không tìm thấy screenshot trong: {args.corpus}")
+        return 1
+
+    env = environment()
+    has_tesseract = env["tesseract"] is not None
+    timer = StageTimer(args.stages)
+    print("⏱️  BENCHMARK HOT PATHS")
+    print("=" * 78)
+    print(f"📁 Corpus: {count} ảnh, {len(frames.states)} trạng thái ({frames.size[0]}x{frames.size[1]})")
+    if not has_tesseract:
+        print("⚠️  Chưa cài tesseract: bỏ qua ocr_psm*, stage match dùng text mẫu")
+
+    monitor = GameMonitor(args.package, None, use_ocr=True, workflow=args.workflow)
+    monitor.pattern_search_radius = args.search_radius
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # Chạy 1 lượt không ghi để compile plan/matcher và cấp phát buffer trước khi đo
+        bench_frames(monitor, frames, StageTimer([]), 1, has_tesseract)
+        bench_frames(monitor, frames, timer, args.repeat, has_tesseract)
+    if any(timer.enabled(stage) for stage in DEVICE_STAGES):
+        print("📱 Đang đo qua thiết bị giả...")
+        bench_device(frames, script, timer, args)
+
+    results = {stage: summarize(values) for stage, values in timer.samples.items()}
+    print("=" * 78)
+    print(f"{'Stage':<24} {'Số lần':>7} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}")
+    print("-" * 78)
+    for stage in STAGES:
+        if stage in results:
+            r = results[stage]
+            print(
+                f"{stage:<24} {r['count']:>7} {r['p50']:>10.2f} {r['p95']:>10.2f}"
+                f" {r['p99']:>10.2f} {r['max']:>10.2f}"
+            )
+
+    report = {
+        "version": 1,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "corpus": os.path.abspath(args.corpus),
+        "images": count,
+        "environment": env,
+        "settings": {
+            "repeat": args.repeat,
+            "sequence_runs": args.sequence_runs,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "burst_frames": args.burst_frames,
+            "search_radius": args.search_radius,
+        },
+        "stages": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Đã lưu baseline: {args.save}")
+
+    if not args.compare:
+        return 0
+    with open(args.compare, "r") as f:
+        baseline = json.load(f)
+    print("=" * 78)
+    print(f"📊 So sánh với baseline {args.compare} ({baseline.get('created', '?')})")
+    for key in ("platform", "cpus", "tesseract"):
+        if baseline.get("environment", {}).get(key) != env[key]:
+            print(f"⚠️  Môi trường khác baseline ({key}): kết quả chỉ mang tính tham khảo")
+    rows, regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    print(f"{'Stage':<24} {'p50 cũ':>10} {'p50 mới':>10} {'p95 cũ':>10} {'p95 mới':>10} {'Đổi':>8}  Kết quả")
+    print("-" * 90)
+    for stage, base_p50, p50, base_p95, p95, change, status in rows:
+        change_str = f"{change*100:+7.1f}%" if change is not None else f"{'-':>8}"
+        print(
+            f"{stage:<24} {format_ms(base_p50)} {format_ms(p50)} {format_ms(base_p95)}"
+            f" {format_ms(p95)} {change_str}  {status}"
+        )
+    if regressions:
+        print(f"❌ {len(regressions)} stage chậm hơn baseline > {args.threshold*100:.0f}%: {', '.join(regressions)}")
+        return 1
+    print("✅ Không có regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark độ chính xác và tốc độ OCR theo từng mức ocr_scale trên bộ screenshot
+
+Cấu trúc corpus:
+    corpus/
+        001.png
+        002.png
+        labels.json   (tùy chọn)
+
+labels.json: {"001.png": {"targets": ["Dig Up Treasure"], "coords": [540, 1900]}, ...}
+- targets: các target text có trên ảnh ([] nếu không có)
+- coords: tọa độ click mong đợi (tùy chọn)
+Nếu không có labels.json, kết quả OCR ở scale 1.0 được dùng làm chuẩn.
+
+Cách dùng:
+    python3 benchmark_ocr_scale.py corpus/ --scales 1.0 0.75 0.5 auto
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import time
+
+from PIL import Image
+
+from monitor_game import GameMonitor
+
+DEFAULT_TARGETS = ["Dig Up Treasure", "Test Flight Failure"]
+DEFAULT_REGION = {"top": "70%", "left": "0", "width": "100%", "height": "30%"}
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg")
+
+
+def load_corpus(corpus_dir):
+    """Load danh sách screenshot và labels của corpus
+
+    Returns:
+        List các tuple (path, label) - label là dict hoặc None nếu chưa gán nhãn
+    """
+    labels = {}
+    labels_path = os.path.join(corpus_dir, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path, "r") as f:
+            labels = json.load(f)
+
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(corpus_dir, pattern)))
+
+    return [(path, labels.get(os.path.basename(path))) for path in sorted(paths)]
+
+
+def percentile(values, percent):
+    """Percentile (0-100) theo nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def run_scale(corpus, targets, region, scale):
+    """Chạy OCR trên toàn bộ corpus với 1 mức scale
+
+    Returns:
+        List kết quả từng ảnh: {name, found, coords, ms}
+    """
+    monitor = GameMonitor(
+        "benchmark", targets, use_ocr=True, ocr_region=region, ocr_scale=scale
+    )
+    results = []
+    for path, _ in corpus:
+        img = Image.open(path).convert("RGBA")
+        monitor.cached_frame = None
+        monitor.target_text = None
+        monitor.last_found_coords = None
+
+        start = time.perf_counter()
+        text = monitor.ocr_screenshot(img)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        found = monitor.get_target_matcher().search_text(text)
+        results.append(
+            {
+                "name": os.path.basename(path),
+                "found": found,
+                "coords": monitor.last_found_coords,
+                "ms": elapsed_ms,
+            }
+        )
+    return results
+
+
+def evaluate(corpus, results, reference):
+    """So sánh kết quả với nhãn (hoặc kết quả chuẩn ở scale 1.0)
+
+    Returns:
+        Dict: accuracy, coord_error_mean, coord_error_max, ms_mean, ms_p95
+    """
+    correct = 0
+    errors = []
+    for (path, label), result, ref in zip(corpus, results, reference):
+        expected_targets = label["targets"] if label else ref["found"]
+        expected_coords = (label or {}).get("coords") or ref["coords"]
+
+        if sorted(result["found"]) == sorted(expected_targets):
+            correct += 1
+
+        if result["coords"] and expected_coords:
+            errors.append(
+                math.hypot(
+                    result["coords"][0] - expected_coords[0],
+                    result["coords"][1] - expected_coords[1],
+                )
+            )
+
+    latencies = [r["ms"] for r in results]
+    return {
+        "accuracy": correct / len(results) if results else 0.0,
+        "coord_error_mean": sum(errors) / len(errors) if errors else 0.0,
+        "coord_error_max": max(errors) if errors else 0.0,
+        "ms_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "ms_p95": percentile(latencies, 95),
+    }
+
+
+def parse_scale(value):
+    return value if value == "auto" else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR theo ocr_scale")
+    parser.add_argument("corpus", help="Thư mục chứa screenshot (+ labels.json)")
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        type=parse_scale,
+        default=[1.0, 0.75, 0.5, 0.35, "auto"],
+        help="Các mức scale cần đo (số 0.25-1.0 hoặc 'auto')",
+    )
+    parser.add_argument(
+        "--targets", nargs="+", default=DEFAULT_TARGETS, help="Target texts"
+    )
+    parser.add_argument("--json", help="Lưu kết quả chi tiết ra file JSON")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"❌ Không tìm thấy screenshot trong: {args.corpus}")
+        return
+
+    labeled = sum(1 for _, label in corpus if label)
+    print(f"📁 Corpus: {len(corpus)} ảnh ({labeled} ảnh có nhãn)")
+    print("=" * 78)
+
+    # Scale 1.0 luôn được chạy để làm chuẩn cho ảnh chưa có nhãn
+    reference = run_scale(corpus, args.targets, DEFAULT_REGION, 1.0)
+    report = {}
+    for scale in args.scales:
+        print(f"🔍 Đang đo scale {scale}...")
+        if scale == 1.0:
+            results = reference
+        else:
+            results = run_scale(corpus, args.targets, DEFAULT_REGION, scale)
+        report[str(scale)] = {
+            "summary": evaluate(corpus, results, reference),
+            "results": results,
+        }
+
+    print("=" * 78)
+    print(
+        f"{'Scale':<8} {'Accuracy':>9} {'Err TB (px)':>12} {'Err max (px)':>13} {'TB (ms)':>9} {'p95 (ms)':>9}"
+    )
+    print("-" * 78)
+    for scale, entry in report.items():
+        summary = entry["summary"]
+        print(
+            f"{scale:<8} {summary['accuracy']*100:>8.1f}% {summary['coord_error_mean']:>12.1f} "
+            f"{summary['coord_error_max']:>13.1f} {summary['ms_mean']:>9.1f} {summary['ms_p95']:>9.1f}"
+        )
+    print("=" * 78)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Đã lưu kết quả chi tiết: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,15 @@ pyinstaller --name="LastWarMonitor" \
     --windowed \
     --onedir \
     --add-data="monitor_game.py:." \
+    --add-data="text_matcher.py:." \
+    --add-data="ocr_profile.py:." \
+    --add-data="latency_metrics.py:." \
+    --add-data="workflow.py:." \
+    --add-data="detection_cascade.py:." \
+    --add-data="screen_index.py:." \
+    --add-data="screen_classifier.py:." \
+    --add-data="session_recorder.py:." \
+    --add-data="workflow.json:." \
     --noconfirm \
     --clean \
     monitor_game_gui.py
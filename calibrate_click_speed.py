@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tool để calibrate click_speed cho từng thiết bị
+Quét các interval click và đo số tap thiết bị thực sự xử lý được,
+lưu interval tốt nhất theo serial để GameMonitor tự load khi chạy
+"""
+
+from monitor_game import GameMonitor, CALIBRATION_INTERVALS, TAP_CALIBRATION_FILE
+
+
+def main():
+    print("⚡ TOOL CALIBRATE CLICK SPEED")
+    print("=" * 60)
+
+    monitor = GameMonitor("dummy", "dummy")
+
+    # Kiểm tra kết nối ADB
+    if not monitor.check_device_connected():
+        print("❌ Không tìm thấy thiết bị Android. Vui lòng kết nối thiết bị!")
+        return
+
+    serial = monitor.get_device_serial()
+    print(f"✅ Đã kết nối thiết bị: {serial}\n")
+
+    print("⚠️  Tool sẽ click liên tục vào 1 tọa độ trong khoảng 30-40 giây.")
+    print("   Hãy mở màn hình mà click vào tọa độ đó không gây tác dụng phụ")
+    print("   (vd: màn hình đếm ngược của bước 5).")
+    print()
+
+    print("📝 Nhập tọa độ click khi đo (Enter = 514,819)")
+    coords_input = input("👉 Tọa độ: ").strip() or "514,819"
+    try:
+        x, y = map(int, coords_input.split(","))
+    except ValueError:
+        print("❌ Tọa độ không hợp lệ! Vui lòng nhập theo format: x,y")
+        return
+
+    duration_input = input("👉 Thời gian đo mỗi mức (giây, Enter=3): ").strip() or "3"
+    try:
+        duration = float(duration_input)
+    except ValueError:
+        print("❌ Thời gian không hợp lệ!")
+        return
+
+    intervals_str = ", ".join(f"{i*1000:.0f}" for i in CALIBRATION_INTERVALS)
+    print(f"\n🔍 Quét các interval (ms): {intervals_str}")
+    print("-" * 60)
+
+    best_interval, results = monitor.calibrate_click_speed(x, y, duration=duration)
+
+    print("-" * 60)
+    if best_interval is None:
+        print("❌ Không có interval nào đạt yêu cầu, giữ nguyên click speed hiện tại.")
+        return
+
+    print(f"🎯 Click speed tốt nhất: {best_interval*1000:.0f}ms")
+    if monitor.save_tap_calibration(best_interval, results):
+        print(f"💾 Đã lưu calibration cho {serial} vào: {TAP_CALIBRATION_FILE}")
+        print("   GameMonitor sẽ tự dùng giá trị này khi chạy trên thiết bị này.")
+
+
+if __name__ == "__main__":
+    main()
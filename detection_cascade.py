@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Detection cascade: chạy các bước kiểm tra rẻ trước, OCR (đắt nhất) sau cùng
+
+Mỗi stage nhận screenshot và trả về True (cho qua stage tiếp theo) hoặc False (loại
+sớm, không cần chạy các stage sau). Thứ tự stage khai báo trong workflow.json
+("detection"), vd:
+
+    "detection": [
+        {"type": "unchanged"},
+        {"type": "screen", "reject": ["map_idle", "countdown"]},
+        {"type": "color", "colors": ["#F5C242"], "min_fraction": 0.002},
+        {"type": "pattern", "patterns": ["step3_dig"]},
+        {"type": "template", "image": "templates/dig.png", "threshold": 0.8},
+        {"type": "ocr"}
+    ]
+
+Thống kê mỗi stage (số lần chạy, tỷ lệ loại, thời gian trung bình) dùng để sắp xếp
+lại thứ tự: stage nên chạy trước khi có tỷ lệ chi phí / tỷ lệ loại thấp.
+"""
+
+import time
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Bước lưới lấy mẫu (px) khi tính chữ ký frame và tỷ lệ màu - đủ để bắt thay đổi UI
+SIGNATURE_STRIDE = 8
+COLOR_STRIDE = 4
+
+
+class StageStats:
+    """Thống kê 1 stage: số lần chạy, số lần cho qua và tổng thời gian"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.passed = 0
+        self.total_time = 0.0
+
+    @property
+    def pass_rate(self):
+        return self.passed / self.calls if self.calls else 0.0
+
+    @property
+    def reject_rate(self):
+        return 1.0 - self.pass_rate if self.calls else 0.0
+
+    @property
+    def mean_cost(self):
+        """Thời gian trung bình mỗi lần chạy (giây)"""
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+class DetectionCascade:
+    """Chuỗi stage kiểm tra, dừng ở stage đầu tiên loại frame
+
+    Args:
+        stages: List (name, check) với check(img) -> bool
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.stats = {name: StageStats(name) for name, _ in self.stages}
+        self.last_rejected_by = None  # Tên stage đã loại frame gần nhất (None = qua hết)
+
+    def run(self, img):
+        """Chạy lần lượt các stage
+
+        Returns:
+            True nếu frame qua mọi stage
+        """
+        for name, check in self.stages:
+            stats = self.stats[name]
+            start = time.perf_counter()
+            passed = bool(check(img))
+            stats.total_time += time.perf_counter() - start
+            stats.calls += 1
+            if not passed:
+                self.last_rejected_by = name
+                return False
+            stats.passed += 1
+        self.last_rejected_by = None
+        return True
+
+    def suggested_order(self):
+        """Thứ tự stage tối ưu theo dữ liệu đã đo (stage cuối - thường là OCR - giữ nguyên)
+
+        Với các bộ lọc độc lập, tổng chi phí kỳ vọng nhỏ nhất khi sắp xếp tăng dần
+        theo mean_cost / reject_rate (stage không bao giờ loại xếp cuối).
+        """
+        names = [name for name, _ in self.stages]
+        if len(names) <= 2:
+            return names
+
+        def rank(name):
+            stats = self.stats[name]
+            if stats.reject_rate == 0:
+                return float("inf")
+            return stats.mean_cost / stats.reject_rate
+
+        return sorted(names[:-1], key=rank) + names[-1:]
+
+    def report(self):
+        """Các dòng báo cáo thống kê từng stage"""
+        lines = [
+            f"{'Stage':<20} {'Lần chạy':>9} {'Cho qua':>8} {'Loại':>7} {'TB (ms)':>9} {'Tổng (s)':>9}",
+            "-" * 67,
+        ]
+        for name, _ in self.stages:
+            stats = self.stats[name]
+            lines.append(
+                f"{name:<20} {stats.calls:>9} {stats.pass_rate*100:>7.1f}% "
+                f"{stats.reject_rate*100:>6.1f}% {stats.mean_cost*1000:>9.2f} {stats.total_time:>9.2f}"
+            )
+        order = self.suggested_order()
+        if order != [name for name, _ in self.stages]:
+            lines.append(f"💡 Thứ tự đề xuất theo dữ liệu: {' -> '.join(order)}")
+        return lines
+
+
+def region_signature(frame, box, stride=SIGNATURE_STRIDE):
+    """Chữ ký rẻ của 1 vùng: ảnh xám lấy mẫu thưa (int16) để so sánh frame không đổi"""
+    left, top, right, bottom = box
+    sample = frame[top:bottom:stride, left:right:stride, :3].astype(np.int16)
+    return sample.sum(axis=2)
+
+
+def signature_distance(a, b):
+    """Sai khác trung bình mỗi điểm mẫu (tổng 3 kênh) giữa 2 chữ ký, inf nếu khác kích thước"""
+    if a is None or b is None or a.shape != b.shape:
+        return float("inf")
+    return float(np.abs(a - b).mean())
+
+
+def color_fraction(frame, box, colors, tolerance, stride=COLOR_STRIDE):
+    """Tỷ lệ điểm mẫu trong vùng có màu gần 1 trong các màu (r, g, b) cho trước"""
+    left, top, right, bottom = box
+    sample = frame[top:bottom:stride, left:right:stride, :3].astype(np.int16)
+    if sample.size == 0:
+        return 0.0
+    matched = np.zeros(sample.shape[:2], dtype=bool)
+    for rgb in colors:
+        matched |= np.abs(sample - np.array(rgb, dtype=np.int16)).sum(axis=2) <= tolerance * 3
+    return float(np.count_nonzero(matched)) / matched.size
+
+
+def to_gray(rgb, step=1):
+    """Ảnh xám float32 từ mảng (H, W, >=3), lấy mẫu mỗi step px"""
+    sample = rgb[::step, ::step, :3].astype(np.float32)
+    return sample @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def match_template(image, template):
+    """Normalized cross-correlation lớn nhất của template trên image (ảnh xám 2D)
+
+    Tử số tính bằng FFT, mẫu số bằng integral image => O(N log N) thay vì O(N * T).
+
+    Returns:
+        (score, (x, y)) - score trong [-1, 1], (x, y) là góc trên trái vị trí khớp nhất
+    """
+    height, width = image.shape
+    t_height, t_width = template.shape
+    if t_height > height or t_width > width:
+        return 0.0, (0, 0)
+
+    t = template.astype(np.float64) - template.mean()
+    t_norm = np.sqrt((t * t).sum())
+    if t_norm == 0:
+        return 0.0, (0, 0)
+
+    image = image.astype(np.float64)
+    shape = (height + t_height - 1, width + t_width - 1)
+    # Tương quan = tích chập với template lật ngược; sum(t) = 0 nên không cần trừ mean ảnh
+    spectrum = np.fft.rfft2(image, shape) * np.fft.rfft2(t[::-1, ::-1], shape)
+    correlation = np.fft.irfft2(spectrum, shape)[
+        t_height - 1 : height, t_width - 1 : width
+    ]
+
+    def window_sums(values):
+        integral = np.pad(values.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+        return (
+            integral[t_height:, t_width:]
+            - integral[:-t_height, t_width:]
+            - integral[t_height:, :-t_width]
+            + integral[:-t_height, :-t_width]
+        )
+
+    count = t_height * t_width
+    sums = window_sums(image)
+    variance = window_sums(image * image) - sums * sums / count
+    denominator = np.sqrt(np.maximum(variance, 0)) * t_norm
+    scores = np.where(denominator > 1e-6, correlation / np.maximum(denominator, 1e-6), 0.0)
+
+    y, x = np.unravel_index(int(np.argmax(scores)), scores.shape)
+    return float(scores[y, x]), (int(x), int(y))
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tool tự tìm pixel pattern phân biệt tốt nhất giữa các trạng thái màn hình
+
+Thay vì lấy 5 pixel cố định quanh 1 điểm (get_pixel_colors.py), tool quét toàn bộ
+corpus screenshot đã gán nhãn và chọn ít pixel nhất sao cho mỗi trạng thái khớp
+chính nó và không khớp các trạng thái khác (theo đúng luật tolerance / match_ratio
+của GameMonitor).
+
+Cấu trúc corpus (mỗi thư mục con là 1 trạng thái màn hình):
+    corpus/
+        step3_dig/      *.png
+        step3_test/     *.png
+        step4/          *.png
+        _other/         *.png   (thư mục bắt đầu bằng "_" chỉ dùng làm mẫu âm)
+
+Cách dùng:
+    python3 extract_pixel_patterns.py corpus/ -o patterns.json
+    python3 extract_pixel_patterns.py corpus/ --states step3_dig step3_test --max-pixels 4
+
+File output dùng được trực tiếp:
+    - workflow.json: "pattern_file": "patterns.json"
+    - GameMonitor(..., pixel_patterns="patterns.json")
+"""
+
+import argparse
+import glob
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg")
+DEFAULT_TOLERANCE = 20  # Giống pattern_tolerance mặc định của GameMonitor
+DEFAULT_MATCH_RATIO = 0.6  # Giống pattern_match_ratio mặc định của GameMonitor
+MAX_CANDIDATES = 2000  # Số pixel ứng viên tốt nhất đưa vào bước chọn greedy
+
+
+def load_corpus(corpus_dir, stride, region):
+    """Load toàn bộ screenshot thành 1 mảng (N, h, w, 3) đã lấy mẫu theo lưới stride
+
+    Returns:
+        (stack, labels, states, size) - labels: index trạng thái của từng ảnh,
+        states: list tên trạng thái, size: (width, height) của screenshot
+    """
+    states = sorted(
+        name
+        for name in os.listdir(corpus_dir)
+        if os.path.isdir(os.path.join(corpus_dir, name))
+    )
+    frames, labels, size = [], [], None
+
+    for index, state in enumerate(states):
+        paths = []
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(glob.glob(os.path.join(corpus_dir, state, pattern)))
+        for path in sorted(paths):
+            img = Image.open(path).convert("RGB")
+            if size is None:
+                size = img.size
+            elif img.size != size:
+                print(f"⚠️  Bỏ qua {path}: kích thước {img.size} khác {size}")
+                continue
+            x0, y0, x1, y1 = region or (0, 0, size[0], size[1])
+            frames.append(np.asarray(img)[y0:y1:stride, x0:x1:stride])
+            labels.append(index)
+
+    if not frames:
+        return None, None, states, None
+    return np.stack(frames), np.array(labels), states, size
+
+
+def select_pixels(matches, positive, min_pixels, max_pixels, match_ratio, min_spacing, grid_xy):
+    """Chọn greedy các pixel để phân loại đúng nhiều ảnh nhất theo luật match_ratio
+
+    Args:
+        matches: Mảng bool (N, K) - ảnh n có khớp màu tham chiếu tại ứng viên k không
+        positive: Mảng bool (N,) - ảnh thuộc trạng thái đang xét
+        grid_xy: Mảng (K, 2) tọa độ gốc của ứng viên (để giữ khoảng cách giữa các pixel)
+
+    Returns:
+        List index ứng viên đã chọn
+    """
+    selected = []
+    counts = np.zeros(len(positive), dtype=np.int32)
+    available = np.ones(matches.shape[1], dtype=bool)
+    sign = np.where(positive, 1.0, -1.0)[:, None]
+
+    for _ in range(max_pixels):
+        k = len(selected) + 1
+        # Ratio của mọi ảnh nếu thêm từng ứng viên - tính 1 lần cho toàn bộ (N, K)
+        ratios = (counts[:, None] + matches) / k
+        accepted = ratios >= match_ratio
+        correct = np.count_nonzero(accepted == positive[:, None], axis=0)
+        # Tie-break: khoảng cách ratio giữa mẫu dương và mẫu âm (càng xa càng chắc)
+        margin = (ratios * sign).mean(axis=0)
+        score = np.where(available, correct + margin * 0.5, -np.inf)
+
+        best = int(np.argmax(score))
+        if not np.isfinite(score[best]):
+            break
+        selected.append(best)
+        counts += matches[:, best]
+
+        # Không chọn các pixel quá gần pixel đã chọn (thường mang cùng thông tin)
+        distance = np.abs(grid_xy - grid_xy[best]).max(axis=1)
+        available &= distance >= min_spacing
+
+        if k >= min_pixels and correct[best] == len(positive):
+            break
+
+    return selected
+
+
+def extract_state_pattern(stack, labels, state_index, args, grid_xy):
+    """Tìm pattern cho 1 trạng thái (one-vs-rest)
+
+    Returns:
+        (pixels, stats) - pixels: list {"coord", "color"}, stats: dict thống kê train
+    """
+    positive = labels == state_index
+    pixels_rgb = stack.reshape(len(stack), -1, 3)
+
+    # Màu tham chiếu = median của các ảnh dương tại từng pixel
+    reference = np.median(pixels_rgb[positive], axis=0).astype(np.int16)  # (C, 3)
+    diff = np.abs(pixels_rgb.astype(np.int16) - reference).sum(axis=2)  # (N, C)
+    matches = diff <= args.tolerance * 3
+
+    # Lọc ứng viên: khớp đủ ổn định trên mẫu dương, xếp theo độ tách biệt với mẫu âm
+    positive_rate = matches[positive].mean(axis=0)
+    negative_rate = matches[~positive].mean(axis=0) if (~positive).any() else 0.0
+    separation = np.where(
+        positive_rate >= args.min_consistency, positive_rate - negative_rate, -np.inf
+    )
+    order = np.argsort(separation)[::-1][:MAX_CANDIDATES]
+    order = order[np.isfinite(separation[order])]
+    if len(order) == 0:
+        return None, None
+
+    chosen = select_pixels(
+        matches[:, order],
+        positive,
+        args.min_pixels,
+        args.max_pixels,
+        args.match_ratio,
+        args.min_spacing,
+        grid_xy[order],
+    )
+    chosen = order[chosen]
+
+    pattern = []
+    for candidate in chosen:
+        x, y = (int(v) for v in grid_xy[candidate])
+        r, g, b = (int(v) for v in reference[candidate])
+        pattern.append({"coord": [x, y], "color": f"#{r:02X}{g:02X}{b:02X}"})
+
+    ratios = matches[:, chosen].mean(axis=1)
+    accepted = ratios >= args.match_ratio
+    stats = {
+        "pixels": len(pattern),
+        "positives": int(positive.sum()),
+        "negatives": int((~positive).sum()),
+        "accuracy": float(np.mean(accepted == positive)),
+        "min_positive_ratio": float(ratios[positive].min()),
+        "max_negative_ratio": float(ratios[~positive].max()) if (~positive).any() else 0.0,
+    }
+    return pattern, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tìm pixel pattern phân biệt các trạng thái màn hình từ screenshot đã gán nhãn"
+    )
+    parser.add_argument("corpus", help="Thư mục corpus (mỗi thư mục con = 1 trạng thái)")
+    parser.add_argument("-o", "--output", default="patterns.json", help="File pattern output")
+    parser.add_argument(
+        "--states", nargs="+", help="Chỉ sinh pattern cho các trạng thái này (mặc định: tất cả)"
+    )
+    parser.add_argument("--stride", type=int, default=4, help="Bước lưới pixel ứng viên (px)")
+    parser.add_argument(
+        "--region", help="Chỉ tìm trong vùng x0,y0,x1,y1 (px, mặc định: toàn màn hình)"
+    )
+    parser.add_argument("--tolerance", type=int, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--match-ratio", type=float, default=DEFAULT_MATCH_RATIO)
+    parser.add_argument("--min-pixels", type=int, default=2, help="Số pixel tối thiểu mỗi pattern")
+    parser.add_argument("--max-pixels", type=int, default=6, help="Số pixel tối đa mỗi pattern")
+    parser.add_argument(
+        "--min-consistency",
+        type=float,
+        default=1.0,
+        help="Tỷ lệ mẫu dương tối thiểu phải khớp tại 1 pixel ứng viên (0-1)",
+    )
+    parser.add_argument(
+        "--min-spacing", type=int, default=8, help="Khoảng cách tối thiểu giữa 2 pixel (px)"
+    )
+    parser.add_argument(
+        "--insets",
+        type=int,
+        nargs=4,
+        metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
+        help="Phần khuyết màn hình (notch) của thiết bị chụp corpus, dùng khi chuyển sang normalized",
+    )
+    args = parser.parse_args()
+
+    region = tuple(map(int, args.region.split(","))) if args.region else None
+
+    print("🎯 TOOL TRÍCH XUẤT PIXEL PATTERN")
+    print("=" * 70)
+    stack, labels, states, size = load_corpus(args.corpus, args.stride, region)
+    if stack is None:
+        print(f"❌ Không tìm thấy screenshot trong: {args.corpus}")
+        return
+
+    print(f"📁 {len(stack)} ảnh {size[0]}x{size[1]}, {len(states)} trạng thái")
+    for index, state in enumerate(states):
+        print(f"   - {state}: {int(np.sum(labels == index))} ảnh")
+
+    # Tọa độ gốc (px) của từng pixel trên lưới lấy mẫu
+    x0, y0 = region[:2] if region else (0, 0)
+    grid_h, grid_w = stack.shape[1:3]
+    gy, gx = np.mgrid[0:grid_h, 0:grid_w]
+    grid_xy = np.stack(
+        [x0 + gx.ravel() * args.stride, y0 + gy.ravel() * args.stride], axis=1
+    )
+
+    wanted = args.states or [s for s in states if not s.startswith("_")]
+    patterns, report = {}, {}
+    print("=" * 70)
+    print(f"{'Trạng thái':<16} {'Pixel':>6} {'Accuracy':>9} {'Min dương':>10} {'Max âm':>8}")
+    print("-" * 70)
+    for state in wanted:
+        if state not in states:
+            print(f"⚠️  Không có thư mục cho trạng thái: {state}")
+            continue
+        pattern, stats = extract_state_pattern(
+            stack, labels, states.index(state), args, grid_xy
+        )
+        if pattern is None:
+            print(f"{state:<16} ❌ Không có pixel nào ổn định trên mọi ảnh của trạng thái")
+            continue
+        patterns[state] = pattern
+        report[state] = stats
+        print(
+            f"{state:<16} {stats['pixels']:>6} {stats['accuracy']*100:>8.1f}% "
+            f"{stats['min_positive_ratio']*100:>9.0f}% {stats['max_negative_ratio']*100:>7.0f}%"
+        )
+    print("=" * 70)
+
+    if not patterns:
+        print("❌ Không sinh được pattern nào.")
+        return
+
+    output = {
+        "version": 1,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "resolution": list(size),
+        "insets": args.insets or [0, 0, 0, 0],
+        "tolerance": args.tolerance,
+        "match_ratio": args.match_ratio,
+        "patterns": patterns,
+        "stats": report,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"💾 Đã lưu pattern file: {args.output}")
+    print(f'   Dùng trong workflow.json: "pattern_file": "{os.path.basename(args.output)}"')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1055 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Thiết bị ADB giả lập để test tải / đo độ trễ GameMonitor trên máy Linux không có điện thoại
+
+Mỗi thiết bị giả là 1 server TCP cục bộ trả lời lệnh giống điện thoại thật: `shell` (cả
+session tương tác dùng cho tap không chặn), `exec-out screencap` (raw, nhiều frame 1 lần),
+`screencap -p` + `pull`, `input tap`, `pidof`, `wm size/density`, `dumpsys window`,
+`uiautomator dump`, `logcat` / `uiautomator events` (stream). Frame lấy từ:
+
+    - thư mục screenshot: mỗi thư mục con = 1 trạng thái màn hình (giống corpus của
+      extract_pixel_patterns.py), thư mục phẳng = 1 trạng thái duy nhất
+    - file session .lws (session_recorder.py): phát lại theo thời gian đã ghi, dừng ở mỗi
+      lần tap đã ghi cho đến khi nhận được tap gần vị trí đó
+
+Kịch bản (JSON) khai báo trạng thái chuyển khi nhận tap đúng vùng hoặc sau 1 khoảng thời gian:
+
+    {
+        "initial": "map_idle",
+        "states": {
+            "map_idle": {"after": 5, "next": "treasure"},
+            "treasure": {
+                "texts": [{"text": "Dig Up Treasure", "bounds": [400, 1100, 680, 1160]}],
+                "taps": [{"region": [400, 1100, 680, 1160], "next": "dig", "delay": 0.3}],
+                "after": 30, "next": "map_idle"
+            },
+            "reward": {"taps": [{"region": [0, 0, 1080, 2400], "count": 20, "next": "map_idle"}]}
+        }
+    }
+
+"texts" là các node trả về trong `uiautomator dump` (chế độ UI Hierarchy không cần OCR),
+"count" = số tap cần nhận (vd: bước 5 click liên tục), "delay" = thời gian chuyển màn hình
+sau tap. Trạng thái không có screenshot được tạo frame 1 màu (kích thước --size).
+
+Lệnh `adb` thay thế (shim) tra serial -> port trong registry, GameMonitor chỉ cần đổi adb_path:
+
+    python3 fake_adb_device.py farm corpus/ --script scenario.json --count 24 --latency 0.03 --jitter 0.01
+    python3 fake_adb_device.py adb devices
+    GameMonitor(..., device_serial="fake-00", adb_path="python3 fake_adb_device.py adb")
+
+    # Farm + 1 GameMonitor mỗi thiết bị trong cùng process, in thống kê độ trễ p50/p95/p99
+    python3 fake_adb_device.py loadtest corpus/ --script scenario.json --count 24 --duration 120
+
+Shim chạy lại cho mỗi lệnh adb nên đầu module chỉ import thư viện chuẩn (PIL, numpy và
+session_recorder chỉ import khi server cần).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shlex
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+FAKE_ADB_REGISTRY = os.environ.get(
+    "LASTWAR_FAKE_ADB_REGISTRY", os.path.join(tempfile.gettempdir(), "lastwar_fake_adb.json")
+)
+DEFAULT_PACKAGE = "com.fun.lastwar.vn.gp"
+DEFAULT_SIZE = (1080, 2400)
+DEFAULT_DENSITY = 420
+DEFAULT_FRAME_INTERVAL = 0.5  # Giây mỗi screenshot khi 1 trạng thái có nhiều ảnh (animation)
+RAW_HEADER = struct.Struct("<IIII")  # width, height, pixel format, colorspace (Android 12+)
+RAW_FORMATS = {"RGBA": 1, "RGBX": 2}
+GATE_MERGE_TIME = 1.0  # Gộp các tap đã ghi cách nhau ít hơn N giây thành 1 điểm chờ
+GATE_TAP_RADIUS = 80  # Tap cách vị trí đã ghi không quá N px coi là đúng tap chờ
+SESSION_CACHE_FRAMES = 8  # Số payload frame session giữ trong cache (dùng chung các thiết bị)
+STREAM_POLL_INTERVAL = 0.1  # Chu kỳ kiểm tra đổi trạng thái của các lệnh stream
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+UI_DUMP_DONE = "UI hierchary dumped to: {}\n"  # Đúng chính tả của uiautomator thật
+COMMAND_KINDS = (
+    ("screencap;", "burst"),
+    ("screencap", "screencap"),
+    ("input tap", "tap"),
+    ("pidof", "pidof"),
+    ("uiautomator", "ui_dump"),
+    ("dumpsys window", "focus"),
+    ("pull", "pull"),
+)
+
+
+def command_kind(command):
+    """Nhóm lệnh adb để thống kê (screencap, burst, tap, pidof, ui_dump, focus, ...)"""
+    for needle, kind in COMMAND_KINDS:
+        if needle in command:
+            return kind
+    return "other"
+
+
+def percentile(values, q):
+    """Percentile q (0-100) của list đã sắp xếp, lấy giá trị gần nhất"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+# ============================================================
+# Nguồn frame (dùng chung giữa các thiết bị, chỉ đọc)
+# ============================================================
+
+
+class FolderFrames:
+    """Screenshot theo trạng thái: {state: [payload raw (header + RGBA), ...]}"""
+
+    def __init__(self, folder=None, size=DEFAULT_SIZE):
+        self.size = None
+        self.states = {}
+        self._png = {}
+        self._lock = threading.Lock()
+        if folder:
+            self.load(folder)
+        if self.size is None:
+            self.size = tuple(size)
+
+    def load(self, folder):
+        from PIL import Image
+
+        def images(path):
+            return sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+
+        groups = {
+            name: images(os.path.join(folder, name))
+            for name in sorted(os.listdir(folder))
+            if os.path.isdir(os.path.join(folder, name))
+        }
+        if not any(groups.values()):
+            groups = {"default": images(folder)}
+        for state, paths in groups.items():
+            for path in paths:
+                image = Image.open(path).convert("RGBA")
+                if self.size is None:
+                    self.size = image.size
+                elif image.size != self.size:
+                    image = image.resize(self.size)
+                self.states.setdefault(state, []).append(
+                    RAW_HEADER.pack(*self.size, RAW_FORMATS["RGBA"], 0) + image.tobytes()
+                )
+
+    def ensure_state(self, state):
+        """Tạo frame 1 màu (màu theo tên) cho trạng thái chưa có screenshot"""
+        if self.states.get(state):
+            return
+        shade = zlib.crc32(state.encode("utf-8"))
+        pixel = bytes([shade & 0xFF, (shade >> 8) & 0xFF, (shade >> 16) & 0xFF, 255])
+        width, height = self.size
+        self.states[state] = [
+            RAW_HEADER.pack(width, height, RAW_FORMATS["RGBA"], 0) + pixel * (width * height)
+        ]
+
+    def count(self, state):
+        return len(self.states.get(state, ()))
+
+    def payload(self, key):
+        state, index = key
+        return self.states[state][index]
+
+    def png(self, key):
+        with self._lock:
+            if key not in self._png:
+                self._png[key] = encode_png(self.payload(key))
+            return self._png[key]
+
+
+class SessionFrames:
+    """Frame của file session .lws, kèm các điểm chờ tap (gate) lấy từ event tap đã ghi"""
+
+    def __init__(self, path):
+        from session_recorder import SessionReader
+
+        self.reader = SessionReader(path)
+        if not len(self.reader):
+            raise ValueError(f"{path}: session không có frame")
+        self.times = [entry["t"] for entry in self.reader.frames]
+        first = self.reader.frames[0]
+        self.size = (first["width"], first["height"])
+        self.duration = self.times[-1]
+        self.gates = []  # [(t, x, y)] - phải nhận tap gần (x, y) mới phát tiếp qua thời điểm t
+        last_tap = None
+        for event in self.reader.events_of("tap"):
+            # Chuỗi tap liên tục (vd: bước 5) chỉ tính là 1 gate
+            if last_tap is None or event["t"] - last_tap >= GATE_MERGE_TIME:
+                self.gates.append((event["t"], event["x"], event["y"]))
+            last_tap = event["t"]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index_at(self, position):
+        """Index frame đang hiển thị tại thời điểm position (giây) của session"""
+        low, high = 0, len(self.times)
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[middle] <= position:
+                low = middle + 1
+            else:
+                high = middle
+        return max(0, low - 1)
+
+    def payload(self, index):
+        # SessionReader dựng frame delta trong 1 buffer dùng chung => phải khóa
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+            entry = self.reader.frames[index]
+            data = RAW_HEADER.pack(
+                entry["width"], entry["height"], RAW_FORMATS.get(entry["mode"], 1), 0
+            ) + self.reader.frame(index).tobytes()
+            self._cache[index] = data
+            if len(self._cache) > SESSION_CACHE_FRAMES:
+                self._cache.popitem(last=False)
+            return data
+
+    def png(self, index):
+        return encode_png(self.payload(index))
+
+
+def encode_png(payload):
+    """PNG (bytes) từ payload screencap raw - cho `screencap -p`"""
+    from PIL import Image
+
+    width, height, pixel_format, _ = RAW_HEADER.unpack_from(payload)
+    mode = "RGBX" if pixel_format == RAW_FORMATS["RGBX"] else "RGBA"
+    image = Image.frombuffer(
+        mode, (width, height), memoryview(payload)[RAW_HEADER.size :], "raw", mode, 0, 1
+    )
+    output = io.BytesIO()
+    image.convert("RGB").save(output, "PNG", compress_level=1)
+    return output.getvalue()
+
+
+# ============================================================
+# Kịch bản: trạng thái màn hình theo thời gian và tap nhận được
+# ============================================================
+
+
+class StateScenario:
+    """Máy trạng thái theo kịch bản JSON (mỗi thiết bị 1 instance, frame dùng chung)"""
+
+    def __init__(self, frames, script=None, frame_interval=DEFAULT_FRAME_INTERVAL, rng=None):
+        script = script or {}
+        self.frames = frames
+        self.frame_interval = frame_interval
+        self.states = script.get("states") or {name: {} for name in frames.states}
+        if not self.states:
+            self.states = {"default": {}}
+        for name, spec in self.states.items():
+            if "after" in spec and (spec["after"] <= 0 or spec.get("next") not in self.states):
+                raise ValueError(f"Trạng thái '{name}': 'after' phải > 0 và 'next' phải tồn tại")
+            for rule in spec.get("taps", []):
+                if rule.get("next") not in self.states:
+                    raise ValueError(f"Trạng thái '{name}': tap tới trạng thái không tồn tại")
+            frames.ensure_state(name)
+        self.initial = script.get("initial") or next(iter(self.states))
+        self.transitions = 0
+        self.visits = Counter()
+
+        now = time.monotonic()
+        # Lệch pha ngẫu nhiên để các thiết bị trong farm không đổi màn hình cùng lúc
+        after = self.states[self.initial].get("after", 0)
+        self.enter(self.initial, now - (rng or random).uniform(0, after))
+
+    def reset(self):
+        """Quay về trạng thái đầu (vd: trước mỗi lần chạy benchmark)"""
+        self.enter(self.initial, time.monotonic())
+
+    def enter(self, state, at):
+        self.state = state
+        self.entered = at
+        self.pending = None  # (thời điểm, trạng thái tiếp) sau tap đúng
+        self.tap_counts = Counter()
+        self.visits[state] += 1
+
+    def advance(self, now):
+        """Áp dụng các chuyển trạng thái đã đến hạn"""
+        while True:
+            spec = self.states[self.state]
+            if self.pending is not None and self.pending[0] <= now:
+                at, state = self.pending
+            elif self.pending is None and "after" in spec and self.entered + spec["after"] <= now:
+                at, state = self.entered + spec["after"], spec["next"]
+            else:
+                return
+            self.enter(state, at)
+            self.transitions += 1
+
+    def frame_key(self, now):
+        index = int((now - self.entered) / self.frame_interval) % self.frames.count(self.state)
+        return (self.state, index)
+
+    def texts(self):
+        return self.states[self.state].get("texts", [])
+
+    def tap(self, x, y, now):
+        """Xử lý 1 tap, True nếu tap khớp 1 vùng của trạng thái hiện tại"""
+        if self.pending is not None:
+            return False  # Đang chuyển màn hình
+        for number, rule in enumerate(self.states[self.state].get("taps", [])):
+            left, top, right, bottom = rule.get("region") or (0, 0, 1 << 30, 1 << 30)
+            if not (left <= x <= right and top <= y <= bottom):
+                continue
+            self.tap_counts[number] += 1
+            if self.tap_counts[number] >= rule.get("count", 1):
+                self.pending = (now + rule.get("delay", 0.0), rule["next"])
+            return True
+        return False
+
+
+class ReplayScenario:
+    """Phát lại session theo thời gian đã ghi, giữ frame tại mỗi gate cho đến khi nhận tap"""
+
+    def __init__(self, frames, any_tap=False):
+        self.frames = frames
+        self.any_tap = any_tap
+        self.transitions = 0
+        self.visits = Counter()
+        self.restart(time.monotonic())
+
+    @property
+    def state(self):
+        return f"gate{self.gate}"
+
+    def reset(self):
+        self.restart(time.monotonic())
+
+    def restart(self, now):
+        self.position = 0.0  # Thời điểm session khi bắt đầu phát tiếp
+        self.resumed = now
+        self.gate = 0
+        self.visits[self.state] += 1
+
+    def position_at(self, now):
+        position = self.position + (now - self.resumed)
+        if self.gate < len(self.frames.gates):
+            position = min(position, self.frames.gates[self.gate][0])
+        return position
+
+    def advance(self, now):
+        if self.gate >= len(self.frames.gates) and self.position_at(now) > self.frames.duration:
+            self.restart(now)  # Hết session => phát lại từ đầu
+
+    def frame_key(self, now):
+        return self.frames.index_at(self.position_at(now))
+
+    def texts(self):
+        return []
+
+    def tap(self, x, y, now):
+        if self.gate >= len(self.frames.gates):
+            return False
+        t, gate_x, gate_y = self.frames.gates[self.gate]
+        # Chỉ nhận tap khi màn hình đã (gần) tới lúc tap trong bản ghi
+        if self.position_at(now) < t - GATE_MERGE_TIME:
+            return False
+        if not self.any_tap and (x - gate_x) ** 2 + (y - gate_y) ** 2 > GATE_TAP_RADIUS**2:
+            return False
+        self.position, self.resumed = t, now
+        self.gate += 1
+        self.transitions += 1
+        self.visits[self.state] += 1
+        return True
+
+
+# ============================================================
+# Thiết bị giả
+# ============================================================
+
+
+class FakeDevice:
+    """1 thiết bị giả: chạy lệnh shell trên kịch bản, kèm độ trễ cấu hình được
+
+    Args:
+        latency / jitter: Độ trễ mỗi lệnh (giây), phân phối chuẩn cắt tại 0
+        screencap_latency: Thời gian chụp thêm cho mỗi frame screencap
+        tap_latency: Thời gian xử lý mỗi `input tap`
+    """
+
+    def __init__(
+        self,
+        serial,
+        scenario,
+        package=DEFAULT_PACKAGE,
+        density=DEFAULT_DENSITY,
+        pid=12345,
+        latency=0.0,
+        jitter=0.0,
+        screencap_latency=0.0,
+        tap_latency=0.0,
+        seed=None,
+    ):
+        self.serial = serial
+        self.scenario = scenario
+        self.frames = scenario.frames
+        self.package = package
+        self.density = density
+        self.pid = pid
+        self.latency = latency
+        self.jitter = jitter
+        self.screencap_latency = screencap_latency
+        self.tap_latency = tap_latency
+        self.files = {}  # "/sdcard/..." -> bytes (screencap -p, uiautomator dump)
+        self.commands = Counter()
+        self.taps = 0
+        self.accepted_taps = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.frames.size
+
+    def reset(self):
+        with self._lock:
+            self.scenario.reset()
+            self.files.clear()
+
+    def wait_latency(self, extra=0.0):
+        delay = extra
+        if self.latency or self.jitter:
+            with self._lock:
+                delay += max(0.0, self._rng.gauss(self.latency, self.jitter))
+        if delay > 0:
+            time.sleep(delay)
+
+    def current_state(self):
+        with self._lock:
+            self.scenario.advance(time.monotonic())
+            return self.scenario.state
+
+    def capture(self, png=False):
+        self.wait_latency(self.screencap_latency)
+        with self._lock:
+            now = time.monotonic()
+            self.scenario.advance(now)
+            key = self.scenario.frame_key(now)
+        return self.frames.png(key) if png else self.frames.payload(key)
+
+    def tap(self, x, y):
+        self.wait_latency(self.tap_latency)
+        with self._lock:
+            now = time.monotonic()
+            self.scenario.advance(now)
+            self.taps += 1
+            if self.scenario.tap(x, y, now):
+                self.accepted_taps += 1
+
+    def ui_dump(self):
+        """XML UI hierarchy của trạng thái hiện tại (các node "texts" của kịch bản)"""
+        with self._lock:
+            self.scenario.advance(time.monotonic())
+            texts = list(self.scenario.texts())
+        width, height = self.size
+        nodes = []
+        for index, node in enumerate(texts):
+            left, top, right, bottom = node["bounds"]
+            text = (
+                node["text"].replace("&", "&amp;").replace('"', "&quot;").replace("<", "&lt;")
+            )
+            nodes.append(
+                f'<node index="{index}" text="{text}" resource-id="" class="android.widget.TextView"'
+                f' package="{self.package}" content-desc="" clickable="true"'
+                f' bounds="[{left},{top}][{right},{bottom}]" />'
+            )
+        return (
+            "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>"
+            f'<hierarchy rotation="0"><node index="0" text="" class="android.widget.FrameLayout"'
+            f' package="{self.package}" bounds="[0,0][{width},{height}]">'
+            + "".join(nodes)
+            + "</node></hierarchy>"
+        ).encode("utf-8")
+
+    def run_shell(self, line):
+        """Chạy 1 dòng lệnh shell (hỗ trợ `;`, `| grep`, `( ... ) &`), trả về stdout dạng bytes"""
+        line = line.strip()
+        if line.endswith("&"):
+            line = line[:-1].strip()
+        if line.startswith("(") and line.endswith(")"):
+            line = line[1:-1]
+        output = bytearray()
+        for command in line.split(";"):
+            stages = command.split("|")
+            try:
+                result = self.run_command(shlex.split(stages[0]))
+            except ValueError:
+                result = b"/system/bin/sh: syntax error\n"
+            for stage in stages[1:]:
+                argv = shlex.split(stage)
+                if argv[:1] == ["grep"] and len(argv) > 1:
+                    pattern = argv[-1].encode("utf-8")
+                    result = b"".join(
+                        row for row in result.splitlines(keepends=True) if pattern in row
+                    )
+            output += result
+        return bytes(output)
+
+    def run_command(self, argv):
+        if not argv:
+            return b""
+        name = argv[0]
+        if name == "input" and argv[1:2] == ["tap"]:
+            self.commands["tap"] += 1
+        else:
+            self.commands[name] += 1
+
+        if name == "screencap":
+            if "-p" not in argv:
+                return self.capture()
+            paths = [arg for arg in argv[1:] if not arg.startswith("-")]
+            if paths:
+                self.files[paths[0]] = self.capture(png=True)
+                return b""
+            return self.capture(png=True)
+        if name == "input":
+            if argv[1:2] == ["tap"] and len(argv) >= 4:
+                self.tap(float(argv[2]), float(argv[3]))
+            return b""  # keyevent, swipe, text: bỏ qua
+        if name == "pidof":
+            return f"{self.pid}\n".encode() if self.package in argv[1:] else b""
+        if name == "wm" and argv[1:2] == ["size"]:
+            return f"Physical size: {self.size[0]}x{self.size[1]}\n".encode()
+        if name == "wm" and argv[1:2] == ["density"]:
+            return f"Physical density: {self.density}\n".encode()
+        if name == "dumpsys" and argv[1:2] == ["window"]:
+            return (
+                f"  mCurrentFocus=Window{{1a2b3c u0 {self.package}/"
+                "com.unity3d.player.UnityPlayerActivity}\n"
+            ).encode()
+        if name == "dumpsys" and argv[1:2] == ["display"]:
+            return (
+                f"  mBaseDisplayInfo=DisplayInfo{{\"Built-in Screen\", real {self.size[0]} x"
+                f" {self.size[1]}, density {self.density}}}\n"
+            ).encode()
+        if name == "uiautomator" and argv[1:2] == ["dump"]:
+            path = argv[2] if len(argv) > 2 else "/sdcard/window_dump.xml"
+            xml = self.ui_dump()
+            if path == "/dev/tty":
+                return xml + UI_DUMP_DONE.format(path).encode()
+            self.files[path] = xml
+            return UI_DUMP_DONE.format(path).encode()
+        if name == "cat" and len(argv) > 1:
+            if argv[1] in self.files:
+                return self.files[argv[1]]
+            return f"cat: {argv[1]}: No such file or directory\n".encode()
+        if name == "echo":
+            return (" ".join(argv[1:]) + "\n").encode()
+        if name == "getprop":
+            props = {"ro.serialno": self.serial, "ro.product.model": "FakeDevice"}
+            return (props.get(argv[1], "") + "\n").encode() if len(argv) > 1 else b""
+        return f"/system/bin/sh: {name}: inaccessible or not found\n".encode()
+
+    def stream(self, command, wfile, stopped):
+        """Lệnh chạy liên tục (logcat, uiautomator events): in 1 dòng mỗi khi màn hình đổi"""
+        previous = self.current_state()
+        while not stopped():
+            time.sleep(STREAM_POLL_INTERVAL)
+            state = self.current_state()
+            if state == previous:
+                continue
+            previous = state
+            if "uiautomator" in command:
+                line = (
+                    f"EventType: TYPE_WINDOW_STATE_CHANGED; EventTime: {int(time.time() * 1000)};"
+                    f" PackageName: {self.package}; Text: [{state}]\n"
+                )
+            elif "--pid" in command:
+                line = f"I/Unity   ({self.pid}): Screen -> {state}\n"
+            elif "logcat" in command:
+                line = f"I/ActivityTaskManager( 1000): Displayed {self.package}/.{state}: +120ms\n"
+            else:
+                continue
+            try:
+                wfile.write(line.encode("utf-8"))
+            except OSError:
+                return  # Client đã ngắt
+
+    def serve(self, args, rfile, wfile, stopped):
+        """Xử lý 1 lệnh adb đã chuyển tiếp (args sau `-s serial`)"""
+        if not args:
+            return
+        if args[0] == "logcat":
+            self.stream(" ".join(args), wfile, stopped)
+            return
+        if args[0] not in ("shell", "exec-out"):
+            wfile.write(f"error: unknown command {args[0]}\n".encode())
+            return
+
+        if len(args) == 1:
+            # Session tương tác: mỗi dòng stdin là 1 lệnh
+            for raw in rfile:
+                line = raw.decode("utf-8", "replace").strip()
+                if not line:
+                    continue
+                if line == "exit":
+                    return
+                self.wait_latency()
+                output = self.run_shell(line)
+                if output:
+                    wfile.write(output)
+            return
+
+        line = " ".join(args[1:])
+        if line.startswith(("logcat", "uiautomator events", "getevent")):
+            self.stream(line, wfile, stopped)
+            return
+        self.wait_latency()
+        wfile.write(self.run_shell(line))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "serial": self.serial,
+                "state": self.scenario.state,
+                "commands": dict(self.commands),
+                "taps": self.taps,
+                "accepted_taps": self.accepted_taps,
+                "transitions": self.scenario.transitions,
+                "visits": dict(self.scenario.visits),
+            }
+
+
+class DeviceRequestHandler(socketserver.StreamRequestHandler):
+    """Dòng đầu tiên là JSON {"args": [...]}, phần còn lại là stdin (session shell)"""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+            self.server.device.serve(
+                request.get("args", []), self.rfile, self.wfile, lambda: self.server.stopped
+            )
+        except (ConnectionError, BrokenPipeError, ValueError):
+            pass
+
+
+class DeviceServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, device, host="127.0.0.1", port=0):
+        super().__init__((host, port), DeviceRequestHandler)
+        self.device = device
+        self.stopped = False
+
+    @property
+    def address(self):
+        return self.server_address
+
+
+# ============================================================
+# Farm: nhiều thiết bị + registry cho shim
+# ============================================================
+
+
+def read_registry(path=FAKE_ADB_REGISTRY):
+    """Registry serial -> {"host", "port", "pid"}, bỏ các thiết bị của process đã chết"""
+    try:
+        with open(path, "r") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    alive = {}
+    for serial, entry in entries.items():
+        try:
+            os.kill(entry["pid"], 0)
+        except ProcessLookupError:
+            continue
+        except PermissionError:
+            pass
+        alive[serial] = entry
+    return alive
+
+
+def write_registry(entries, path=FAKE_ADB_REGISTRY):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(temp_path, path)
+
+
+class DeviceFarm:
+    """Chạy nhiều thiết bị giả (mỗi thiết bị 1 server trên port riêng) và đăng ký vào registry"""
+
+    def __init__(self, devices, registry=FAKE_ADB_REGISTRY):
+        self.devices = list(devices)
+        self.registry = registry
+        self.servers = []
+
+    def start(self):
+        for device in self.devices:
+            server = DeviceServer(device)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers.append(server)
+        entries = read_registry(self.registry)
+        for server in self.servers:
+            host, port = server.address
+            entries[server.device.serial] = {"host": host, "port": port, "pid": os.getpid()}
+        write_registry(entries, self.registry)
+        return self
+
+    def stop(self):
+        entries = read_registry(self.registry)
+        for server in self.servers:
+            server.stopped = True
+            server.shutdown()
+            server.server_close()
+            entries.pop(server.device.serial, None)
+        write_registry(entries, self.registry)
+        self.servers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def build_devices(args):
+    """Tạo args.count thiết bị dùng chung 1 nguồn frame"""
+    script = None
+    if args.script:
+        with open(args.script, "r") as f:
+            script = json.load(f)
+
+    session = args.source and args.source.endswith(".lws")
+    if session:
+        frames = SessionFrames(args.source)
+    else:
+        size = tuple(int(v) for v in args.size.lower().split("x"))
+        frames = FolderFrames(args.source, size)
+
+    devices = []
+    for number in range(args.count):
+        serial = f"{args.serial_prefix}{number:02d}"
+        rng = random.Random(f"{args.seed}-{serial}")
+        if session:
+            scenario = ReplayScenario(frames, args.any_tap)
+        else:
+            scenario = StateScenario(frames, script, args.frame_interval, rng)
+        devices.append(
+            FakeDevice(
+                serial,
+                scenario,
+                package=args.package,
+                density=args.density,
+                pid=10000 + number,
+                latency=args.latency,
+                jitter=args.jitter,
+                screencap_latency=args.screencap_latency,
+                tap_latency=args.tap_latency,
+                seed=f"{args.seed}-{serial}",
+            )
+        )
+    return devices
+
+
+def print_farm_stats(devices):
+    print(f"{'Thiết bị':<12} {'Trạng thái':<16} {'Lệnh':>7} {'Screencap':>10} {'Tap':>7} {'Tap đúng':>9} {'Chuyển':>7}")
+    print("-" * 74)
+    for device in devices:
+        stats = device.stats()
+        commands = stats["commands"]
+        print(
+            f"{stats['serial']:<12} {stats['state']:<16} {sum(commands.values()):>7}"
+            f" {commands.get('screencap', 0):>10} {stats['taps']:>7}"
+            f" {stats['accepted_taps']:>9} {stats['transitions']:>7}"
+        )
+
+
+# ============================================================
+# Shim thay cho lệnh `adb`
+# ============================================================
+
+
+def shim_command(registry=FAKE_ADB_REGISTRY):
+    """Lệnh shell gọi shim (dùng làm adb_path của GameMonitor)"""
+    command = f"{shlex.quote(sys.executable)} {shlex.quote(os.path.abspath(__file__))} adb"
+    if registry != FAKE_ADB_REGISTRY:
+        command = f"LASTWAR_FAKE_ADB_REGISTRY={shlex.quote(registry)} {command}"
+    return command
+
+
+def forward(entry, args):
+    """Gửi lệnh tới server thiết bị, chép stdout (và stdin nếu là session shell)"""
+    sock = socket.create_connection((entry["host"], entry["port"]))
+    sock.sendall(json.dumps({"args": args}).encode("utf-8") + b"\n")
+
+    if args == ["shell"]:
+
+        def pump_stdin():
+            try:
+                for line in sys.stdin.buffer:
+                    sock.sendall(line)
+                sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+        threading.Thread(target=pump_stdin, daemon=True).start()
+
+    stdout = sys.stdout.buffer
+    try:
+        while True:
+            chunk = sock.recv(1 << 20)
+            if not chunk:
+                break
+            stdout.write(chunk)
+            stdout.flush()
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        sock.close()
+
+
+def request(entry, args):
+    """Gửi lệnh và trả về toàn bộ output dạng bytes"""
+    with socket.create_connection((entry["host"], entry["port"])) as sock:
+        sock.sendall(json.dumps({"args": args}).encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(1 << 20)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+
+def adb_main(argv):
+    """Entry point của shim: `fake_adb_device.py adb [-s serial] <lệnh> ...`"""
+    args = list(argv)
+    serial = os.environ.get("ANDROID_SERIAL")
+    while args and args[0] in ("-s", "-d", "-e"):
+        if args[0] == "-s" and len(args) > 1:
+            serial = args[1]
+            args = args[2:]
+        else:
+            args = args[1:]
+    command = args[0] if args else ""
+
+    if command in ("start-server", "kill-server", "wait-for-device"):
+        return 0
+    if command == "version":
+        print("Android Debug Bridge (fake_adb_device.py)")
+        return 0
+    devices = read_registry()
+    if command == "devices":
+        print("List of devices attached")
+        for name in sorted(devices):
+            print(f"{name}\tdevice")
+        print()
+        return 0
+
+    if serial is None:
+        if not devices:
+            print("error: no devices/emulators found", file=sys.stderr)
+            return 1
+        if len(devices) > 1:
+            print("error: more than one device/emulator", file=sys.stderr)
+            return 1
+        serial = next(iter(devices))
+    entry = devices.get(serial)
+    if entry is None:
+        print(f"error: device '{serial}' not found", file=sys.stderr)
+        return 1
+
+    if command == "get-serialno":
+        print(serial)
+        return 0
+    if command == "get-state":
+        print("device")
+        return 0
+    try:
+        if command == "pull" and len(args) >= 3:
+            data = request(entry, ["exec-out", "cat", args[1]])
+            if data.startswith(b"cat: "):
+                print(f"adb: error: failed to stat remote object '{args[1]}'", file=sys.stderr)
+                return 1
+            with open(args[2], "wb") as f:
+                f.write(data)
+            print(f"{args[1]}: 1 file pulled.")
+            return 0
+        forward(entry, args)
+    except ConnectionError:
+        print(f"error: device '{serial}' offline", file=sys.stderr)
+        return 1
+    return 0
+
+
+# ============================================================
+# Load test: 1 GameMonitor mỗi thiết bị giả
+# ============================================================
+
+
+def instrument(monitor, samples, lock):
+    """Đo thời gian mỗi lệnh ADB và mỗi lần check của 1 GameMonitor (theo nhóm lệnh)"""
+
+    def record(kind, elapsed):
+        with lock:
+            samples.setdefault(kind, []).append(elapsed)
+
+    def timed(method, kind=None):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                record(kind or command_kind(args[0]), time.perf_counter() - start)
+
+        return wrapper
+
+    monitor.run_adb_command = timed(monitor.run_adb_command)
+    monitor.run_adb_command_bytes = timed(monitor.run_adb_command_bytes)
+    monitor.stream_ui_dump = timed(monitor.stream_ui_dump, "ui_dump")
+    monitor.search_text_in_screen = timed(monitor.search_text_in_screen, "check")
+
+
+def run_loadtest(args, devices):
+    from monitor_game import GameMonitor
+
+    samples, lock = {}, threading.Lock()
+    monitors = []
+    for device in devices:
+        monitor = GameMonitor(
+            args.package,
+            args.target,
+            use_ocr=not args.ui,
+            auto_click=True,
+            device_serial=device.serial,
+            adb_path=shim_command(args.registry),
+            workflow=args.workflow,
+            burst_frames=args.burst_frames,
+        )
+        instrument(monitor, samples, lock)
+        monitors.append(monitor)
+
+    print(f"🚀 Load test {len(monitors)} GameMonitor trong {args.duration:.0f}s...")
+    start = time.monotonic()
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(output):
+        threads = [
+            threading.Thread(target=monitor.monitor, args=(args.interval,), daemon=True)
+            for monitor in monitors
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while time.monotonic() - start < args.duration:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        for monitor in monitors:
+            monitor.stop_requested = True
+        for thread in threads:
+            thread.join(timeout=30)
+    elapsed = time.monotonic() - start
+
+    print(f"\n📊 KẾT QUẢ ({elapsed:.1f}s, {len(monitors)} thiết bị)")
+    print(f"{'Nhóm lệnh':<12} {'Số lần':>8} {'/giây':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}")
+    print("-" * 74)
+    for kind, values in sorted(samples.items()):
+        values.sort()
+        print(
+            f"{kind:<12} {len(values):>8} {len(values) / elapsed:>8.1f}"
+            f" {percentile(values, 50)*1000:>10.1f} {percentile(values, 95)*1000:>10.1f}"
+            f" {percentile(values, 99)*1000:>10.1f} {values[-1]*1000:>10.1f}"
+        )
+    print()
+    print_farm_stats(devices)
+    visits = Counter()
+    for device in devices:
+        visits.update(device.stats()["visits"])
+    print("\n🔁 Số lần vào từng trạng thái: " + ", ".join(f"{k}: {v}" for k, v in visits.items()))
+
+
+def raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "adb":
+        sys.exit(adb_main(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description="Thiết bị ADB giả lập để test tải GameMonitor")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("adb", help="Shim thay lệnh adb: fake_adb_device.py adb [-s serial] ...")
+
+    for name, help_text in (
+        ("farm", "Chạy các thiết bị giả cho đến khi Ctrl+C"),
+        ("loadtest", "Chạy farm + 1 GameMonitor mỗi thiết bị và đo độ trễ"),
+    ):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("source", nargs="?", help="Thư mục screenshot (thư mục con = trạng thái) hoặc file .lws")
+        sub.add_argument("--script", help="Kịch bản JSON (trạng thái, tap, thời gian)")
+        sub.add_argument("--count", type=int, default=1, help="Số thiết bị")
+        sub.add_argument("--serial-prefix", default="fake-")
+        sub.add_argument("--package", default=DEFAULT_PACKAGE)
+        sub.add_argument("--size", default="x".join(map(str, DEFAULT_SIZE)), help="Kích thước frame tự tạo")
+        sub.add_argument("--density", type=int, default=DEFAULT_DENSITY)
+        sub.add_argument("--frame-interval", type=float, default=DEFAULT_FRAME_INTERVAL)
+        sub.add_argument("--latency", type=float, default=0.0, help="Độ trễ mỗi lệnh (giây)")
+        sub.add_argument("--jitter", type=float, default=0.0, help="Độ lệch chuẩn độ trễ (giây)")
+        sub.add_argument("--screencap-latency", type=float, default=0.0, help="Thời gian chụp mỗi frame")
+        sub.add_argument("--tap-latency", type=float, default=0.0, help="Thời gian xử lý mỗi tap")
+        sub.add_argument("--any-tap", action="store_true", help="Session: tap ở đâu cũng qua gate")
+        sub.add_argument("--seed", default="0")
+        sub.add_argument("--registry", default=FAKE_ADB_REGISTRY)
+        if name == "farm":
+            sub.add_argument("--report", type=float, default=0, help="In thống kê mỗi N giây (0 = tắt)")
+        else:
+            sub.add_argument("--duration", type=float, default=60)
+            sub.add_argument("--interval", type=float, default=2, help="CHECK_INTERVAL của monitor")
+            sub.add_argument("--workflow", help="File workflow (mặc định như monitor_game.py)")
+            sub.add_argument("--target", help="Text cần tìm (mặc định targets của workflow)")
+            sub.add_argument("--ui", action="store_true", help="Dùng UI Hierarchy thay cho OCR")
+            sub.add_argument("--burst-frames", type=int, default=3)
+            sub.add_argument("--verbose", action="store_true", help="Hiện log của các monitor")
+    args = parser.parse_args()
+
+    devices = build_devices(args)
+    with DeviceFarm(devices, args.registry) as farm:
+        print(f"📱 {len(devices)} thiết bị giả ({devices[0].size[0]}x{devices[0].size[1]}), registry: {args.registry}")
+        for server in farm.servers:
+            print(f"   - {server.device.serial}: {server.address[0]}:{server.address[1]}")
+        if args.command == "loadtest":
+            run_loadtest(args, devices)
+            return
+
+        # `kill` / timeout cũng dừng như Ctrl+C (in thống kê, gỡ khỏi registry)
+        signal.signal(signal.SIGTERM, raise_interrupt)
+        print(f"👉 adb_path: {shim_command(args.registry)}")
+        print("⏳ Nhấn Ctrl+C để dừng")
+        try:
+            while True:
+                time.sleep(args.report or 3600)
+                if args.report:
+                    print()
+                    print_farm_stats(devices)
+        except KeyboardInterrupt:
+            print()
+            print_farm_stats(devices)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Đo độ trễ từng stage (ADB, chụp, decode, tiền xử lý, OCR, pattern, tap) theo thiết bị
+
+Mỗi span ghi thời gian (perf_counter) vào 1 histogram kiểu HDR theo (thiết bị, stage):
+bucket log-tuyến tính trên micro giây, sai số tương đối <= 1/2^(HISTOGRAM_SUB_BITS-1)
+(~3%), ghi O(1), bộ nhớ cố định bất kể số mẫu. Chi phí mỗi span cỡ vài µs.
+
+Xuất kết quả:
+    - endpoint Prometheus dạng text (`/metrics`) và JSON (`/snapshot.json`) trên 127.0.0.1
+    - file JSON snapshot ghi định kỳ (ghi đè nguyên tử, đọc lại bằng lệnh `show`)
+
+Cách dùng:
+    metrics = LatencyMetrics()
+    with metrics.span("ocr_psm6", device="emulator-5554"):
+        ...
+    metrics.serve(9464)
+    metrics.start_snapshots("latency.json", interval=60)
+
+    python3 latency_metrics.py show latency.json
+    curl -s 127.0.0.1:9464/metrics
+"""
+
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HISTOGRAM_SUB_BITS = 6  # 2^5 bucket tuyến tính cho mỗi lũy thừa của 2
+HISTOGRAM_HALF = 1 << (HISTOGRAM_SUB_BITS - 1)
+SNAPSHOT_INTERVAL = 60.0  # Giây giữa 2 lần ghi snapshot JSON
+REPORT_QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+# Cận trên bucket (giây) của histogram Prometheus, gộp từ bucket HDR
+PROMETHEUS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+PROMETHEUS_QUANTILES = (0.5, 0.95, 0.99)
+METRIC_NAME = "lastwar_stage_latency_seconds"
+
+
+def bucket_index(value):
+    """Index bucket của 1 giá trị (µs, số nguyên >= 0)"""
+    shift = value.bit_length() - HISTOGRAM_SUB_BITS
+    if shift <= 0:
+        return value
+    return shift * HISTOGRAM_HALF + (value >> shift)
+
+
+def bucket_bounds(index):
+    """Khoảng [low, high) (µs) của 1 bucket"""
+    if index < 2 * HISTOGRAM_HALF:
+        return index, index + 1
+    shift, mantissa = divmod(index - HISTOGRAM_HALF, HISTOGRAM_HALF)
+    mantissa += HISTOGRAM_HALF
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class LatencyHistogram:
+    """Histogram độ trễ kiểu HDR (µs), không thread-safe - LatencyMetrics giữ lock"""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, micros):
+        index = bucket_index(micros)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += micros
+        if self.min is None or micros < self.min:
+            self.min = micros
+        if micros > self.max:
+            self.max = micros
+
+    def quantile(self, q):
+        """Giá trị (µs) ở quantile q (nearest-rank, giữa bucket, kẹp trong [min, max])"""
+        if not self.count:
+            return 0
+        rank = max(1, min(self.count, int(q * self.count + 0.999999)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return min(max((low + high - 1) // 2, self.min), self.max)
+        return self.max
+
+    def count_below(self, micros):
+        """Số mẫu thuộc các bucket có cận trên <= micros (dùng cho bucket Prometheus)"""
+        total = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                low, high = bucket_bounds(index)
+                if high > micros + 1:
+                    break
+                total += count
+        return total
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum_ms": self.total / 1000,
+            "min_ms": (self.min or 0) / 1000,
+            "max_ms": self.max / 1000,
+            "mean_ms": self.total / self.count / 1000 if self.count else 0.0,
+            **{
+                f"p{q * 100:g}_ms": self.quantile(q) / 1000 for q in REPORT_QUANTILES
+            },
+            # [index, count] thưa để gộp / tính lại percentile offline
+            "buckets": [[i, c] for i, c in enumerate(self.counts) if c],
+        }
+
+
+class Span:
+    """Context manager đo 1 lần thực thi của 1 stage"""
+
+    __slots__ = ("metrics", "stage", "device", "start")
+
+    def __init__(self, metrics, stage, device):
+        self.metrics = metrics
+        self.stage = stage
+        self.device = device
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.stage, time.perf_counter() - self.start, self.device)
+        return False
+
+
+class LatencyMetrics:
+    """Tập histogram theo (thiết bị, stage), dùng chung được giữa nhiều GameMonitor
+
+    Endpoint và thread snapshot được đếm tham chiếu: mỗi lần serve / start_snapshots
+    phải đi kèm 1 lần stop_server / stop_snapshots, chỉ người dùng cuối cùng mới dừng.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._owner_lock = threading.Lock()  # Giữ khi mở/dừng endpoint và thread snapshot
+        self.started_at = time.time()
+        self._server = None
+        self._server_refs = 0
+        self._snapshot_thread = None
+        self._snapshot_refs = 0
+        self._snapshot_stop = threading.Event()
+        self.snapshot_path = None
+
+    def span(self, stage, device=""):
+        return Span(self, stage, device or "")
+
+    def record(self, stage, seconds, device=""):
+        """Ghi 1 mẫu (giây)"""
+        micros = max(0, int(round(seconds * 1e6)))
+        key = (device or "", stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(micros)
+
+    def snapshot(self):
+        """Trạng thái hiện tại dạng dict (serialize được JSON)"""
+        with self._lock:
+            stages = [
+                {"device": device, "stage": stage, **histogram.to_dict()}
+                for (device, stage), histogram in sorted(self._histograms.items())
+            ]
+        return {
+            "time": time.time(),
+            "uptime": round(time.time() - self.started_at, 3),
+            "sub_bits": HISTOGRAM_SUB_BITS,
+            "stages": stages,
+        }
+
+    def prometheus_text(self):
+        """Toàn bộ histogram theo định dạng text của Prometheus"""
+        lines = [
+            f"# HELP {METRIC_NAME} Thời gian thực thi từng stage của GameMonitor",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        quantile_lines = []
+        with self._lock:
+            for (device, stage), histogram in sorted(self._histograms.items()):
+                labels = f'device="{escape_label(device)}",stage="{escape_label(stage)}"'
+                for bound in PROMETHEUS_BUCKETS:
+                    count = histogram.count_below(int(bound * 1e6))
+                    lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound:g}"}} {count}')
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{METRIC_NAME}_sum{{{labels}}} {histogram.total / 1e6:.6f}")
+                lines.append(f"{METRIC_NAME}_count{{{labels}}} {histogram.count}")
+                for q in PROMETHEUS_QUANTILES:
+                    quantile_lines.append(
+                        f'{METRIC_NAME}_quantile{{{labels},quantile="{q:g}"}}'
+                        f" {histogram.quantile(q) / 1e6:.6f}"
+                    )
+        lines.append(f"# HELP {METRIC_NAME}_quantile Quantile tính từ histogram HDR")
+        lines.append(f"# TYPE {METRIC_NAME}_quantile gauge")
+        return "\n".join(lines + quantile_lines) + "\n"
+
+    def write_snapshot(self, path=None):
+        """Ghi snapshot JSON (ghi file tạm rồi đổi tên để bên đọc không thấy file ghi dở)"""
+        path = path or self.snapshot_path
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self.snapshot(), f, indent=2)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"⚠️  Lỗi khi lưu latency snapshot: {e}")
+
+    def start_snapshots(self, path, interval=SNAPSHOT_INTERVAL):
+        """Ghi snapshot mỗi `interval` giây trong thread nền (và 1 lần nữa khi dừng)
+
+        Đã chạy rồi thì chỉ tăng số tham chiếu (giữ path / interval đang dùng).
+        """
+        with self._owner_lock:
+            self._snapshot_refs += 1
+            if self._snapshot_thread is not None:
+                return
+            self.snapshot_path = path
+            self._snapshot_stop.clear()
+
+            def loop():
+                while not self._snapshot_stop.wait(interval):
+                    self.write_snapshot()
+
+            self._snapshot_thread = threading.Thread(target=loop, daemon=True)
+            self._snapshot_thread.start()
+
+    def stop_snapshots(self):
+        """Trả 1 tham chiếu của start_snapshots; người cuối cùng dừng thread và ghi snapshot cuối"""
+        with self._owner_lock:
+            if self._snapshot_refs == 0:
+                return
+            self._snapshot_refs -= 1
+            if self._snapshot_refs == 0:
+                self._stop_snapshot_thread()
+
+    def _stop_snapshot_thread(self):
+        if self._snapshot_thread is not None:
+            self._snapshot_stop.set()
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+            self.write_snapshot()
+
+    def serve(self, port, host="127.0.0.1"):
+        """Mở endpoint HTTP `/metrics` (Prometheus) và `/snapshot.json` trong thread nền
+
+        Đã mở rồi thì chỉ tăng số tham chiếu và trả về địa chỉ đang dùng.
+        """
+        with self._owner_lock:
+            if self._server is None:
+                self._server = self._create_server(host, port)
+            self._server_refs += 1
+            return self._server.server_address
+
+    def stop_server(self):
+        """Trả 1 tham chiếu của serve; người cuối cùng đóng endpoint"""
+        with self._owner_lock:
+            if self._server_refs == 0:
+                return
+            self._server_refs -= 1
+            if self._server_refs == 0:
+                self._close_server()
+
+    def _close_server(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _create_server(self, host, port):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics":
+                    body = metrics.prometheus_text().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path.split("?")[0] == "/snapshot.json":
+                    body = json.dumps(metrics.snapshot()).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Không in mỗi lần Prometheus scrape
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def stop(self):
+        """Dừng hẳn endpoint và thread snapshot bất kể còn ai dùng (ghi snapshot cuối cùng)"""
+        with self._owner_lock:
+            self._server_refs = self._snapshot_refs = 0
+            self._close_server()
+            self._stop_snapshot_thread()
+
+
+def escape_label(value):
+    """Escape giá trị label Prometheus"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def timed(stage):
+    """Decorator đo method của object có thuộc tính `metrics` (và `device_serial`)"""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = getattr(self, "metrics", None)
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                metrics.record(
+                    stage, time.perf_counter() - start, getattr(self, "device_serial", "")
+                )
+
+        return wrapper
+
+    return decorator
+
+
+def format_report(snapshot, device=None):
+    """Bảng p50/p95/p99 (ms) từ 1 snapshot, sắp theo tổng thời gian giảm dần
+
+    Stage lồng nhau (vd check chứa capture + OCR) nên cột tổng không cộng dồn được.
+    """
+    stages = [s for s in snapshot["stages"] if device is None or s["device"] == device]
+    stages.sort(key=lambda s: -s["sum_ms"])
+    lines = [
+        f"{'Thiết bị':<16} {'Stage':<24} {'Count':>7} {'Mean':>8} {'p50':>8}"
+        f" {'p95':>8} {'p99':>8} {'Max':>9} {'Tổng (s)':>9}",
+        "-" * 104,
+    ]
+    for s in stages:
+        lines.append(
+            f"{s['device'][:16]:<16} {s['stage'][:24]:<24} {s['count']:>7} {s['mean_ms']:>8.2f}"
+            f" {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['max_ms']:>9.1f}"
+            f" {s['sum_ms'] / 1000:>9.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xem latency snapshot của GameMonitor")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="In bảng độ trễ từ file snapshot JSON")
+    show.add_argument("snapshot")
+    show.add_argument("--device", help="Chỉ hiện 1 thiết bị")
+    args = parser.parse_args()
+
+    with open(args.snapshot, "r") as f:
+        snapshot = json.load(f)
+    taken = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["time"]))
+    print(f"⏱️  Snapshot lúc {taken} (sau {snapshot['uptime']:.0f}s chạy), đơn vị ms")
+    print(format_report(snapshot, args.device))
+
+
+if __name__ == "__main__":
+    main()
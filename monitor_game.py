@@ -9,8 +9,28 @@ import subprocess
 import time
 import os
 import re
+import json
+import struct
 import threading
+import zlib
 from datetime import datetime
+from xml.etree import ElementTree
+
+from detection_cascade import (
+    DetectionCascade,
+    color_fraction,
+    match_template,
+    region_signature,
+    signature_distance,
+    to_gray,
+)
+from latency_metrics import SNAPSHOT_INTERVAL, LatencyMetrics, format_report, timed
+from ocr_profile import OcrProfile
+from screen_classifier import CLASSIFIER_FILE, ScreenClassifier
+from screen_index import SCREEN_INDEX_FILE, ScreenIndex, ScreenMatch
+from session_recorder import SessionRecorder
+from text_matcher import TargetMatcher
+from workflow import WorkflowError, load_pattern_file, load_workflow, parse_dimension
 
 try:
     from PIL import Image, ImageEnhance
@@ -31,6 +51,482 @@ except ImportError:
     NUMPY_AVAILABLE = False
 
 
+# Header của `screencap` raw: width, height, format (4 bytes mỗi trường, little-endian).
+# Từ Android 9 có thêm trường colorspace => header 16 bytes thay vì 12 bytes.
+RAW_SCREENCAP_HEADER_SIZES = (12, 16)
+RAW_SCREENCAP_MODES = {1: "RGBA", 2: "RGBX"}  # PixelFormat 4 bytes/pixel được hỗ trợ
+
+# File lưu click_speed tốt nhất đã calibrate theo serial thiết bị
+TAP_CALIBRATION_FILE = os.path.expanduser("~/.lastwar_monitor_tap_calibration.json")
+# File lưu thời gian chuyển màn hình đo được sau mỗi tap, theo serial thiết bị và bước
+TRANSITION_LOG_FILE = os.path.expanduser("~/.lastwar_monitor_transitions.json")
+TRANSITION_MAX_SAMPLES = 200  # Số mẫu gần nhất giữ lại mỗi bước
+TRANSITION_MIN_SAMPLES = 10  # Số mẫu tối thiểu trước khi dùng delay học được
+TRANSITION_RESAMPLE_EVERY = 10  # Vẫn đo lại 1/N lần để delay theo kịp thiết bị
+TRANSITION_CHANGE_THRESHOLD = 3.0  # Sai khác chữ ký frame để coi là màn hình đã đổi
+TRANSITION_MARGIN = 0.05  # Cộng thêm vào percentile (giây) cho an toàn
+TRANSITION_SIGNATURE_STRIDE = 16
+TRANSITION_STABLE_TIME = 0.2  # Màn hình không đổi trong khoảng này (giây) mới coi là ổn định
+# File lưu thông số màn hình (kích thước, density, insets notch) theo serial thiết bị
+DEVICE_PROFILE_FILE = os.path.expanduser("~/.lastwar_monitor_devices.json")
+# Vùng khuyết màn hình trong `dumpsys display`: DisplayCutout{insets=Rect(left, top - right, bottom) ...}
+DISPLAY_CUTOUT_RE = re.compile(
+    r"DisplayCutout\{insets=Rect\((\d+), (\d+) - (\d+), (\d+)\)"
+)
+# OCR scale: "auto" chọn tỷ lệ để chữ cao khoảng OCR_TARGET_TEXT_HEIGHT px sau khi resize
+OCR_TARGET_TEXT_HEIGHT = 32
+OCR_MIN_SCALE = 0.25
+OCR_SCALE_STEP = 0.05
+
+# OCR tăng dần: chiều cao phần lõi mỗi dải và phần đệm trên/dưới (px, tọa độ gốc).
+# Phần đệm phải >= 1/2 chiều cao chữ lớn nhất để chữ ở ranh giới không bị cắt.
+OCR_TILE_HEIGHT = 96
+OCR_TILE_PADDING = 40
+
+# Các PSM mode thử lần lượt cho đến khi thấy target (cả OCR toàn vùng lẫn OCR tăng dần)
+OCR_PSM_MODES = (
+    (6, "Single uniform block"),  # Phù hợp nhất cho UI game
+    (11, "Sparse text"),  # Backup: text rải rác
+    (3, "Fully automatic"),  # Fallback: tự động
+)
+
+# So khớp fuzzy: số ký tự sai tối đa mỗi token của target (vd "Treasurc" -> "Treasure")
+OCR_MAX_TOKEN_EDITS = 2
+
+# UI dump: kích thước chunk đọc từ exec-out và tuổi tối đa của dump được dùng lại
+# khi window đang focus không đổi (nội dung trong cùng window vẫn có thể thay đổi).
+# Dùng lại tốn thêm 1 lệnh `dumpsys window` mỗi lần check (span "focused_window")
+# nên mặc định tắt (0); chỉ bật khi đã đo thấy rẻ hơn dump trên thiết bị đó
+UI_DUMP_CHUNK_SIZE = 16384
+UI_DUMP_MAX_AGE = 0.0
+# Thuộc tính của node được index: game Unity/WebView hay để chữ trong content-desc
+UI_TEXT_ATTRIBUTES = ("text", "content-desc")
+UI_BOUNDS_RE = re.compile(r"\[(\d+),(\d+)\]\[(\d+),(\d+)\]")
+
+# Trigger theo sự kiện: poll dự phòng khi không có sự kiện và thời gian chờ màn hình render
+EVENT_SAFETY_INTERVAL = 15.0
+EVENT_SETTLE_DELAY = 0.3
+# Tag logcat của hệ thống báo chuyển activity/window (lọc thêm theo package game)
+EVENT_LOGCAT_TAGS = ("ActivityManager", "ActivityTaskManager", "WindowManager")
+# Loại sự kiện accessibility của `uiautomator events` coi là màn hình thay đổi
+EVENT_WINDOW_TYPES = ("TYPE_WINDOW_STATE_CHANGED", "TYPE_WINDOW_CONTENT_CHANGED")
+
+# Số frame chụp liên tiếp khi frame đầu khớp pattern chưa chắc chắn (< 95%), <= 1 = verify
+# tuần tự. Tắt mặc định: mỗi lần burst là 1 lệnh screencap K frame đầy đủ
+BURST_FRAMES = 0
+# Độ lệch UI tối đa (px, theo density của workflow) khi tìm pattern, 0 = đúng tọa độ. Tắt
+# mặc định: chỉ bật cho thiết bị có UI bị dịch (notch, animation) vì chi phí ~(2r+1)^2 lần
+PATTERN_SEARCH_RADIUS = 0
+
+# Giá trị pad cho vùng ngoài ảnh khi tìm pattern chịu lệch (không bao giờ khớp màu nào)
+PATTERN_PAD_VALUE = -1024
+
+# Số tap tối đa đã gửi mà thiết bị chưa xử lý xong (`input tap` chạy nền). Vượt quá thì
+# bỏ tap thay vì để hàng đợi trên thiết bị phình ra và click dồn sau khi đã dừng
+TAP_MAX_IN_FLIGHT = 8
+
+# Các interval (giây) được quét khi calibrate, từ chậm đến nhanh
+CALIBRATION_INTERVALS = [0.15, 0.12, 0.1, 0.085, 0.07, 0.06, 0.05, 0.04, 0.03]
+
+# Đồng hồ đếm ngược ở bước 5: "MM:SS" hoặc "HH:MM:SS" (OCR chỉ cho phép chữ số và ":")
+COUNTDOWN_RE = re.compile(r"(\d{1,2})\s*:\s*(\d{2})(?:\s*:\s*(\d{2}))?")
+COUNTDOWN_OCR_CONFIG = "--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789:"
+COUNTDOWN_LEAD_TIME = 2.0  # Bắt đầu click trước khi hết giờ (giây) để bù sai số đọc
+COUNTDOWN_MAX_DRIFT = 2.0  # Sai lệch tối đa (giây) giữa các lần đọc để coi là tin cậy
+
+
+def parse_raw_screencap(data, count=1):
+    """Tách output của `screencap` (không có -p) thành các frame numpy
+
+    Args:
+        data: Bytes nhận được từ `adb exec-out screencap` (có thể gồm nhiều frame liên tiếp)
+        count: Số frame có trong data
+
+    Returns:
+        Tuple (frames, mode): frames là array (count, H, W, 4) dạng view trên data
+        (không copy), mode là mode PIL tương ứng. (None, None) nếu không parse được.
+    """
+    if not NUMPY_AVAILABLE or not data or count < 1 or len(data) < 12:
+        return None, None
+
+    width, height, pixel_format = struct.unpack_from("<III", data, 0)
+    mode = RAW_SCREENCAP_MODES.get(pixel_format)
+    frame_bytes = width * height * 4
+    if mode is None or frame_bytes == 0 or len(data) % count != 0:
+        return None, None
+
+    # Mỗi frame = header + pixel data, suy ra kích thước header từ tổng độ dài
+    stride = len(data) // count
+    header_size = stride - frame_bytes
+    if header_size not in RAW_SCREENCAP_HEADER_SIZES:
+        return None, None
+
+    buffer = np.frombuffer(data, dtype=np.uint8).reshape(count, stride)
+    frames = buffer[:, header_size:].reshape(count, height, width, 4)
+    return frames, mode
+
+
+def parse_countdown(text):
+    """Đổi text đồng hồ đếm ngược ("09:41", "1:02:03") thành số giây, None nếu không đọc được"""
+    match = COUNTDOWN_RE.search(text or "")
+    if not match:
+        return None
+    first, second, third = match.groups()
+    if third is None:
+        minutes, seconds = int(first), int(second)
+        hours = 0
+    else:
+        hours, minutes, seconds = int(first), int(second), int(third)
+    if minutes >= 60 or seconds >= 60:
+        return None
+    return hours * 3600 + minutes * 60 + seconds
+
+
+class OcrPreprocessor:
+    """Kernel tiền xử lý ảnh cho OCR, chỉ dùng số nguyên và buffer cấp phát sẵn
+
+    RGBA crop -> grayscale -> contrast x1.2 -> sharpen x2 trong 1 lần gọi, cho kết quả
+    giống hệt pipeline PIL (convert("L") -> np.clip(x * 1.2) -> ImageEnhance.Sharpness(2.0))
+    nhưng không tạo ảnh/array trung gian mới cho mỗi frame.
+    """
+
+    def __init__(self):
+        self._shape = None
+        self._gray = None  # int32 (H, W): tích lũy grayscale fixed-point
+        self._channel = None  # int32 (H, W): 1 kênh màu đã nhân hệ số
+        self._contrast = None  # int16 (H, W): ảnh sau khi tăng contrast
+        self._rows = None  # int16 (H, W-2): tổng 3 pixel theo hàng ngang
+        self._smooth = None  # int16 (H-2, W-2): tổng 3x3 + kết quả sharpen
+        self.output = None  # uint8 (H, W): ảnh kết quả
+
+    def _allocate(self, height, width):
+        self._shape = (height, width)
+        self._gray = np.empty((height, width), dtype=np.int32)
+        self._channel = np.empty((height, width), dtype=np.int32)
+        self._contrast = np.empty((height, width), dtype=np.int16)
+        self._rows = np.empty((height, max(width - 2, 0)), dtype=np.int16)
+        self._smooth = np.empty(
+            (max(height - 2, 0), max(width - 2, 0)), dtype=np.int16
+        )
+        self.output = np.empty((height, width), dtype=np.uint8)
+
+    def process(self, rgba):
+        """Tiền xử lý 1 crop
+
+        Args:
+            rgba: Array uint8 (H, W, C) với C >= 3 (RGB/RGBA, có thể là view không liên tục)
+
+        Returns:
+            Array uint8 (H, W) - buffer dùng lại ở lần gọi sau, copy nếu cần giữ lâu
+        """
+        height, width = rgba.shape[:2]
+        if self._shape != (height, width):
+            self._allocate(height, width)
+
+        gray = self._gray
+        contrast = self._contrast
+        out = self.output
+
+        # 1. Grayscale theo ITU-R 601-2 với hệ số fixed-point 16 bit giống PIL
+        channel = self._channel
+        np.multiply(rgba[..., 0], 19595, out=gray, dtype=np.int32)
+        np.multiply(rgba[..., 1], 38470, out=channel, dtype=np.int32)
+        gray += channel
+        np.multiply(rgba[..., 2], 7471, out=channel, dtype=np.int32)
+        gray += channel
+        gray += 0x8000
+        gray >>= 16
+
+        # 2. Contrast x1.2 (floor(g * 6 / 5) == np.clip(g * 1.2).astype(uint8) với mọi g)
+        gray *= 6
+        gray //= 5
+        np.minimum(gray, 255, out=gray)
+        np.copyto(contrast, gray, casting="unsafe")
+
+        if height < 3 or width < 3:
+            np.copyto(out, contrast, casting="unsafe")
+            return out
+
+        # 3. Sharpen x2 = 2 * ảnh - SMOOTH(ảnh), kernel SMOOTH 3x3 [1 1 1; 1 5 1; 1 1 1] / 13
+        rows = self._rows
+        smooth = self._smooth
+        np.add(contrast[:, :-2], contrast[:, 1:-1], out=rows)
+        rows += contrast[:, 2:]
+        np.add(rows[:-2], rows[1:-1], out=smooth)
+        smooth += rows[2:]
+        center = contrast[1:-1, 1:-1]
+        for _ in range(4):
+            smooth += center
+        smooth += 6  # Làm tròn như PIL
+        smooth //= 13
+        np.subtract(center, smooth, out=smooth)
+        smooth += center
+        np.clip(smooth, 0, 255, out=smooth)
+
+        # Viền 1 pixel giữ nguyên (PIL không lọc viền)
+        np.copyto(out, contrast, casting="unsafe")
+        np.copyto(out[1:-1, 1:-1], smooth, casting="unsafe")
+        return out
+
+
+class TapScheduler:
+    """Lập lịch tap theo timeline tuyệt đối (time.monotonic) để chu kỳ không bị trôi
+
+    Tap thứ n được dispatch tại start + n * interval, nên độ trễ của 1 lần dispatch
+    không bị cộng dồn vào các tap sau. Nếu bị trễ quá 1 chu kỳ thì bỏ qua các slot
+    đã lỡ thay vì click dồn một loạt.
+
+    Tốc độ thực tế (achieved_rate) tính theo số tap thiết bị đã xử lý xong nếu có
+    `accepted`, không phải số lần ghi lệnh (ghi nhanh hơn thiết bị xử lý chỉ làm dồn hàng).
+    """
+
+    HISTOGRAM_BUCKET_MS = 5  # Độ rộng mỗi bucket của histogram jitter (ms)
+
+    def __init__(self, dispatch, interval, accepted=None):
+        """
+        Args:
+            dispatch: Hàm gửi 1 tap (nên là non-blocking, vd: GameMonitor.tap_async),
+                trả về False nếu tap bị bỏ (vd: thiết bị còn quá nhiều tap chưa xử lý)
+            interval: Chu kỳ mục tiêu giữa 2 tap (giây), phải > 0
+            accepted: Hàm trả về tổng số tap thiết bị đã xử lý xong (None = coi mọi tap
+                đã dispatch là được xử lý)
+        """
+        if interval <= 0:
+            raise ValueError(f"interval phải > 0 (nhận {interval})")
+        self.dispatch = dispatch
+        self.interval = interval
+        self.accepted = accepted
+        self.tap_count = 0
+        self.dropped_taps = 0  # Số tap dispatch từ chối (thiết bị chưa xử lý kịp)
+        self._accepted_start = None
+        self._accepted_end = None
+        self.skipped_slots = 0  # Số slot bị bỏ qua do dispatch trễ quá 1 chu kỳ
+        self.max_lateness = 0.0  # Độ trễ dispatch lớn nhất so với deadline (giây)
+        self.jitter_histogram = {}  # bucket (ms) -> số lần, jitter = chu kỳ thực tế - interval
+        self.start_time = None
+        self.end_time = None
+
+    def run(self, should_stop, on_tap=None):
+        """Dispatch tap liên tục cho đến khi should_stop() trả về True
+
+        Args:
+            should_stop: Hàm không tham số, trả về True để dừng
+            on_tap: Callback(tap_count) sau mỗi tap (vd: để in progress)
+        """
+        start = time.monotonic()
+        self.start_time = start
+        if self.accepted is not None:
+            self._accepted_start = self.accepted()
+        last_dispatch = None
+        slot = 0
+
+        while not should_stop():
+            deadline = start + slot * self.interval
+            now = time.monotonic()
+            if deadline > now:
+                time.sleep(deadline - now)
+
+            dispatch_time = time.monotonic()
+            if self.dispatch() is False:
+                self.dropped_taps += 1
+            else:
+                self.tap_count += 1
+                self.max_lateness = max(self.max_lateness, dispatch_time - deadline)
+
+                if last_dispatch is not None:
+                    jitter_ms = (dispatch_time - last_dispatch - self.interval) * 1000
+                    bucket = int(jitter_ms // self.HISTOGRAM_BUCKET_MS) * self.HISTOGRAM_BUCKET_MS
+                    self.jitter_histogram[bucket] = self.jitter_histogram.get(bucket, 0) + 1
+                last_dispatch = dispatch_time
+
+                if on_tap:
+                    on_tap(self.tap_count)
+
+            # Bù trễ: bám theo timeline, bỏ các slot đã lỡ nếu bị chậm hơn 1 chu kỳ
+            slot += 1
+            current_slot = int((time.monotonic() - start) / self.interval)
+            if current_slot > slot:
+                self.skipped_slots += current_slot - slot
+                slot = current_slot
+
+        self.end_time = time.monotonic()
+        if self.accepted is not None:
+            self._accepted_end = self.accepted()
+
+    @property
+    def target_rate(self):
+        """Số tap/giây mục tiêu"""
+        return 1.0 / self.interval
+
+    @property
+    def accepted_taps(self):
+        """Số tap thiết bị đã xử lý xong trong lúc chạy (tính đến lúc dừng)"""
+        if self.accepted is None:
+            return self.tap_count
+        if self._accepted_start is None:
+            return 0
+        end = self._accepted_end if self._accepted_end is not None else self.accepted()
+        return end - self._accepted_start
+
+    def _rate(self, count):
+        if self.start_time is None:
+            return 0.0
+        elapsed = (self.end_time or time.monotonic()) - self.start_time
+        return count / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def dispatch_rate(self):
+        """Số tap/giây đã gửi đi"""
+        return self._rate(self.tap_count)
+
+    @property
+    def achieved_rate(self):
+        """Số tap/giây thực tế thiết bị đã xử lý xong"""
+        return self._rate(self.accepted_taps)
+
+    def jitter_percentile(self, percentile):
+        """Jitter (ms) tại percentile (0-100), tính từ histogram (cận trên của bucket)"""
+        total = sum(self.jitter_histogram.values())
+        if total == 0:
+            return 0.0
+        threshold = total * percentile / 100.0
+        seen = 0
+        for bucket in sorted(self.jitter_histogram):
+            seen += self.jitter_histogram[bucket]
+            if seen >= threshold:
+                return float(bucket + self.HISTOGRAM_BUCKET_MS)
+        return float(max(self.jitter_histogram) + self.HISTOGRAM_BUCKET_MS)
+
+    def summary(self):
+        """Thống kê của lần chạy: số tap, tốc độ mục tiêu/thực tế, jitter"""
+        return {
+            "taps": self.tap_count,
+            "accepted_taps": self.accepted_taps,
+            "dropped_taps": self.dropped_taps,
+            "skipped_slots": self.skipped_slots,
+            "target_rate": self.target_rate,
+            "dispatch_rate": self.dispatch_rate,
+            "achieved_rate": self.achieved_rate,
+            "jitter_p50_ms": self.jitter_percentile(50),
+            "jitter_p95_ms": self.jitter_percentile(95),
+            "jitter_p99_ms": self.jitter_percentile(99),
+            "max_lateness_ms": self.max_lateness * 1000,
+            "jitter_histogram": dict(sorted(self.jitter_histogram.items())),
+        }
+
+
+class EventTrigger:
+    """Đánh thức vòng lặp monitor khi có sự kiện từ các stream ADB (logcat, uiautomator events)
+
+    Mỗi nguồn là 1 process `adb` chạy liên tục, được đọc từng dòng trên thread riêng.
+    Dòng nào khớp predicate của nguồn sẽ set cờ wake. wait() trả về khi có sự kiện
+    hoặc khi hết safety_interval (poll dự phòng nếu bỏ lỡ sự kiện).
+    """
+
+    def __init__(self, safety_interval=EVENT_SAFETY_INTERVAL, settle_delay=EVENT_SETTLE_DELAY):
+        """
+        Args:
+            safety_interval: Thời gian tối đa giữa 2 lần kiểm tra dù không có sự kiện (giây)
+            settle_delay: Chờ sau sự kiện để màn hình render xong rồi mới chụp (giây)
+        """
+        self.safety_interval = safety_interval
+        self.settle_delay = settle_delay
+        self.event_counts = {}  # Tên nguồn -> số sự kiện đã nhận
+        self._sources = {}  # Tên nguồn -> (command, predicate, process)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._reasons = []  # Các nguồn đã bắn sự kiện kể từ lần wait() trước
+        self._stopped = False
+
+    def add_source(self, name, command, predicate):
+        """Thêm (hoặc thay thế) 1 nguồn sự kiện và bắt đầu stream
+
+        Args:
+            name: Tên nguồn (vd: "logcat", "window")
+            command: Lệnh shell chạy liên tục, mỗi dòng stdout là 1 sự kiện tiềm năng
+            predicate: Hàm nhận 1 dòng (str), trả về True nếu là sự kiện cần đánh thức
+        """
+        self.remove_source(name)
+        try:
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            )
+        except Exception as e:
+            print(f"⚠️  Không khởi động được nguồn sự kiện {name}: {e}")
+            return
+        with self._lock:
+            self._sources[name] = (command, predicate, process)
+        threading.Thread(
+            target=self._read_source, args=(name, process, predicate), daemon=True
+        ).start()
+
+    def remove_source(self, name):
+        with self._lock:
+            source = self._sources.pop(name, None)
+        if source and source[2].poll() is None:
+            source[2].kill()
+            source[2].wait()
+
+    def _read_source(self, name, process, predicate):
+        for line in process.stdout:
+            if self._stopped:
+                break
+            if predicate(line):
+                with self._lock:
+                    self.event_counts[name] = self.event_counts.get(name, 0) + 1
+                    if name not in self._reasons:
+                        self._reasons.append(name)
+                self._wake.set()
+
+    def restart_dead_sources(self):
+        """Khởi động lại các stream đã thoát (vd: thiết bị mất kết nối tạm thời)"""
+        with self._lock:
+            dead = [
+                (name, command, predicate)
+                for name, (command, predicate, process) in self._sources.items()
+                if process.poll() is not None
+            ]
+        for name, command, predicate in dead:
+            self.add_source(name, command, predicate)
+
+    def wait(self, should_stop=None):
+        """Chờ sự kiện tiếp theo hoặc hết safety_interval
+
+        Returns:
+            List tên nguồn đã bắn sự kiện, [] nếu là safety poll hoặc bị dừng
+        """
+        self.restart_dead_sources()
+        deadline = time.monotonic() + self.safety_interval
+        # Chờ theo từng đoạn ngắn để phản hồi nhanh lệnh dừng
+        while not self._wake.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (should_stop and should_stop()):
+                break
+            self._wake.wait(min(remaining, 0.5))
+
+        if self._wake.is_set() and self.settle_delay > 0:
+            time.sleep(self.settle_delay)
+
+        # Gom các sự kiện đến trong lúc chờ render thành 1 lần đánh thức
+        with self._lock:
+            reasons = self._reasons
+            self._reasons = []
+            self._wake.clear()
+        return reasons
+
+    def stop(self):
+        self._stopped = True
+        for name in list(self._sources):
+            self.remove_source(name)
+        self._wake.set()
+
+
 class GameMonitor:
     def __init__(
         self,
@@ -47,10 +543,56 @@ class GameMonitor:
         pixel_patterns=None,
         pattern_tolerance=20,
         pattern_match_ratio=0.6,
+        burst_frames=BURST_FRAMES,
+        burst_stability=1.0,
+        device_serial=None,
+        auto_click_speed=True,
+        ocr_scale=1.0,
+        incremental_ocr=False,
+        ocr_max_edits=OCR_MAX_TOKEN_EDITS,
+        ocr_profile=False,
+        ui_dump_max_age=UI_DUMP_MAX_AGE,
+        event_sources=None,
+        event_safety_interval=EVENT_SAFETY_INTERVAL,
+        game_log_pattern=None,
+        workflow=None,
+        pattern_search_radius=PATTERN_SEARCH_RADIUS,
+        screen_index_file=None,
+        classifier_file=None,
+        classifier_confidence=0.95,
+        transition_percentile=None,
+        record_session=None,
+        adb_path="adb",
+        metrics=None,
+        metrics_port=None,
+        metrics_snapshot=None,
+        metrics_snapshot_interval=SNAPSHOT_INTERVAL,
     ):
         self.package_name = package_name
-        # Hỗ trợ cả string và list
-        if isinstance(target_text, str):
+        self.adb_path = adb_path  # Lệnh adb (vd: shim của fake_adb_device.py để test không cần điện thoại)
+        # Histogram độ trễ từng stage (truyền chung 1 LatencyMetrics khi chạy nhiều thiết bị)
+        self.metrics = metrics if metrics is not None else LatencyMetrics()
+        self.metrics_port = metrics_port  # Port endpoint Prometheus `/metrics` (None = tắt)
+        self.metrics_snapshot = metrics_snapshot  # File JSON snapshot định kỳ (None = tắt)
+        self.metrics_snapshot_interval = metrics_snapshot_interval
+        self._metrics_serving = False  # Monitor này đang giữ 1 tham chiếu endpoint
+        self._metrics_snapshotting = False  # Monitor này đang giữ 1 tham chiếu thread snapshot
+        # Workflow (steps, vùng OCR, patterns): object Workflow, đường dẫn file hoặc None = mặc định
+        if workflow is None or isinstance(workflow, str):
+            workflow = load_workflow(workflow)
+        if isinstance(pixel_patterns, str):
+            # Pattern file (vd: từ extract_pixel_patterns.py) bổ sung/ghi đè pattern của workflow
+            pixel_patterns = {
+                **workflow.patterns,
+                **load_pattern_file(pixel_patterns, workflow.normalized),
+            }
+        if ocr_region or pixel_patterns:
+            workflow = workflow.override(ocr_region=ocr_region, patterns=pixel_patterns)
+        self.workflow = workflow
+        # Hỗ trợ cả string và list (None = dùng targets của workflow)
+        if target_text is None:
+            self.target_texts = workflow.targets
+        elif isinstance(target_text, str):
             self.target_texts = [target_text]
         else:
             self.target_texts = target_text
@@ -66,77 +608,368 @@ class GameMonitor:
         self.cached_screenshot = None  # Cache screenshot để không phải chụp lại
         self.skip_color_check = skip_color_check  # Bỏ qua kiểm tra màu
         self.ocr_region = (
-            ocr_region or {}
+            workflow.ocr_region
         )  # Vùng để OCR {top, left, width, height} - hỗ trợ % và px
-        self.pixel_patterns = pixel_patterns or {}  # Pixel patterns cho từng bước
+        self.pixel_patterns = workflow.patterns  # Pixel patterns cho từng bước
         self.pattern_tolerance = pattern_tolerance  # Độ sai lệch màu cho phép (0-255)
         self.pattern_match_ratio = (
             pattern_match_ratio  # Tỷ lệ pixel khớp tối thiểu (0.0-1.0)
         )
         self.stop_requested = False  # Flag để dừng monitor từ GUI
-        self._pattern_rgb_cache = {}  # Cache RGB values của patterns
+        self._screen_size = None  # (width, height) của thiết bị, lấy từ `wm size` nếu chưa chụp
+        self._device_profile = None  # {size, density, insets} của thiết bị (cache theo serial)
+        self._device_profile_probed = False  # Đã đọc lại thông số từ thiết bị trong phiên này
+        self._cascade = None  # DetectionCascade của plan hiện tại
+        self._cascade_plan = None
+        self._cascade_text = ""  # Text OCR của lần chạy cascade gần nhất
+        self._pending_signatures = {}  # Chữ ký vùng của frame đang kiểm tra (theo stage)
+        self._negative_signatures = {}  # Chữ ký vùng của frame gần nhất không có target
+        self._template_cache = {}  # (đường dẫn, scale) -> ảnh xám template
+        # Index dHash màn hình đã biết (None = tắt), nhãn là tên pixel pattern của bước
+        self.screen_index_file = screen_index_file
+        self.screen_index = None
+        if screen_index_file and NUMPY_AVAILABLE:
+            try:
+                self.screen_index = ScreenIndex.load(screen_index_file)
+            except Exception as e:
+                print(f"⚠️  Lỗi khi load screen index: {e}")
+        self.last_screen = None  # ScreenMatch của screenshot hiện tại
+        self._screen_frame = None  # Frame đã nhận diện (tránh hash lại cùng 1 frame)
+        # Bộ phân loại màn hình (None = tắt): dùng thay smart_verify_pattern khi đủ tin cậy
+        self.classifier = None
+        if classifier_file and NUMPY_AVAILABLE and os.path.exists(classifier_file):
+            try:
+                self.classifier = ScreenClassifier.load(classifier_file)
+            except Exception as e:
+                print(f"⚠️  Lỗi khi load classifier: {e}")
+        self.classifier_confidence = classifier_confidence  # Ngưỡng tin cậy để bỏ qua pixel check
+        self.last_prediction = None  # (label, confidence) của screenshot hiện tại
+        self._prediction_frame = None
+        self.classifier_stats = {"decided": 0, "fallback": 0}  # Số lần classifier tự quyết định
+        # Delay sau tap học từ thời gian chuyển màn hình đo được (None = dùng delay cố định)
+        self.transition_percentile = transition_percentile if NUMPY_AVAILABLE else None
+        self._transitions = None  # {bước: [giây, ...]} của thiết bị hiện tại
+        self._transition_runs = {}  # {bước: số lần tap}, để đo lại định kỳ từng bước
+        self._transition_observe_next = set()  # Bước cần đo lại ở lần sau (vd: bước sau thất bại)
+        # Ghi session (frame, tap, OCR, thời gian) ra file để phát lại offline (None = tắt)
+        self.session_recorder = None
+        if record_session and NUMPY_AVAILABLE:
+            self.session_recorder = SessionRecorder(
+                record_session, meta={"package": package_name, "targets": list(self.target_texts)}
+            )
+            print(f"📼 Ghi session vào: {record_session}")
+        self.pattern_search_radius = (
+            pattern_search_radius  # Độ lệch UI tối đa (px) khi tìm pattern, 0 = đúng tọa độ
+        )
+        self.last_pattern_offset = (0, 0)  # Offset (dx, dy) khớp nhất của lần tìm gần nhất
+        self.cached_frame = None  # Screenshot dạng numpy (H, W, 4) nếu chụp raw
+        self.burst_frames = burst_frames  # Số frame chụp liên tiếp khi verify (<= 1 = tắt)
+        self.burst_stability = (
+            burst_stability  # Tỷ lệ frame phải khớp để coi pattern là ổn định
+        )
+        self.last_stability = None  # Stability score của lần burst verify gần nhất
+        self._tap_shell = None  # Session `adb shell` dùng chung để gửi tap không chặn
+        self.taps_sent = 0  # Số tap đã gửi qua session tap shell hiện tại
+        self._tap_acks = {"value": 0}  # Số "T" đọc từ session hiện tại (mỗi session 1 bộ đếm)
+        self._taps_acked_closed = 0  # Tổng tap đã ack của các session đã đóng
+        self.last_tap_stats = None  # Thống kê TapScheduler của lần click liên tục gần nhất
+        self.device_serial = device_serial  # Serial thiết bị (None = thiết bị mặc định)
+        self.auto_click_speed = (
+            auto_click_speed  # Tự load click_speed đã calibrate cho thiết bị
+        )
+        self._tap_calibration_loaded = False
+        self._ocr_preprocessor = OcrPreprocessor() if NUMPY_AVAILABLE else None
+        self.ocr_scale = ocr_scale  # Tỷ lệ resize trước OCR (0.25-1.0) hoặc "auto"
+        self._auto_ocr_scale = 1.0  # Tỷ lệ đang dùng ở chế độ "auto"
+        self.incremental_ocr = incremental_ocr  # Chỉ OCR lại các dải có thay đổi
+        self._ocr_tiles = {}  # core_top -> {"hash", "words"} của từng dải
+        self._ocr_tile_geometry = None  # (box, ocr_size) ứng với cache dải
+        self.last_ocr_tile_ratio = None  # Tỷ lệ pixel phải OCR lại ở lần gần nhất
+        self._target_matcher = None  # Automaton compile từ target_texts
+        self.ocr_max_edits = ocr_max_edits  # Số ký tự sai tối đa mỗi token (0 = khớp chính xác)
+        self.use_ocr_profile = ocr_profile  # OCR với profile Tesseract sinh từ target_texts
+        self._ocr_profile = None
+        self.last_match_score = None  # Score của target tìm thấy gần nhất (1.0 = chính xác)
+        self.ui_text_index = None  # Text -> tọa độ tâm của các node trong UI dump gần nhất
+        self.ui_dump_max_age = ui_dump_max_age  # Giây dùng lại UI dump khi window không đổi (0 = tắt)
+        self._ui_focus = None  # Window đang focus ở lần dump gần nhất
+        self._ui_dump_time = 0.0
+        # Nguồn sự kiện đánh thức monitor: "logcat", "window" (None/[] = poll theo interval)
+        self.event_sources = list(event_sources or [])
+        self.event_safety_interval = event_safety_interval  # Poll dự phòng khi không có sự kiện
+        self.game_log_pattern = (
+            re.compile(game_log_pattern) if game_log_pattern else None
+        )  # Regex log của game cần đánh thức (None = không theo dõi log của game)
+        self._event_trigger = None
+        self._event_pid = None  # PID game đang stream logcat
 
     def parse_dimension(self, value, total):
-        """Parse dimension value - hỗ trợ % và px
+        """Parse dimension value - hỗ trợ % và px (xem workflow.parse_dimension)"""
+        return parse_dimension(value, total)
+
+    def get_screen_size(self):
+        """Kích thước màn hình (width, height): từ screenshot đã cache hoặc `wm size`"""
+        if self.cached_screenshot is not None:
+            return self.cached_screenshot.size
+        if self._screen_size is None:
+            self._screen_size = self.read_wm_value("size")
+        return self._screen_size
+
+    def read_wm_value(self, name):
+        """Đọc `wm size` (-> (width, height)) hoặc `wm density` (-> dpi), ưu tiên giá trị Override"""
+        output = self.run_adb_command(self.adb_cmd(f"shell wm {name}"))
+        # "Override ..." (nếu có) là giá trị đang dùng thực tế
+        values = dict(re.findall(rf"(\w+) {name}: (\d+(?:x\d+)?)", output))
+        value = values.get("Override") or values.get("Physical")
+        if not value:
+            return None
+        if name == "size":
+            width, height = map(int, value.split("x"))
+            return (width, height)
+        return int(value)
 
-        Args:
-            value: Giá trị string (vd: '30%', '500', '0.3') hoặc số
-            total: Tổng kích thước (width hoặc height) để tính %
+    def probe_device_profile(self):
+        """Đọc kích thước, density và vùng khuyết (notch/camera) trực tiếp từ thiết bị
 
         Returns:
-            int: Giá trị pixel
+            Dict {"size": [w, h], "density": dpi, "insets": [left, top, right, bottom]}
+            hoặc None nếu không đọc được kích thước
         """
-        if value is None:
+        size = self.read_wm_value("size")
+        if size is None:
             return None
+        density = self.read_wm_value("density")
 
-        # Nếu là số thực trong khoảng 0-1, coi như phần trăm
-        if isinstance(value, (int, float)):
-            if 0 <= value <= 1:
-                return int(value * total)
-            return int(value)
+        # Insets của DisplayCutout (Android 9+), không có = màn hình không khuyết
+        output = self.run_adb_command(self.adb_cmd("shell dumpsys display"))
+        cutout = DISPLAY_CUTOUT_RE.search(output)
+        insets = [int(v) for v in cutout.groups()] if cutout else [0, 0, 0, 0]
 
-        # Nếu là string
-        value_str = str(value).strip()
+        self._device_profile_probed = True
+        return {
+            "size": list(size),
+            "density": density,
+            "insets": insets,
+            "probed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
 
-        # Kiểm tra %
-        if value_str.endswith("%"):
-            percent = float(value_str[:-1]) / 100
-            return int(percent * total)
+    def get_device_profile(self, refresh=False):
+        """Thông số màn hình của thiết bị hiện tại: cache trong bộ nhớ, file theo serial, rồi ADB
 
-        # Kiểm tra số thực 0-1
-        try:
-            num = float(value_str)
-            if 0 <= num <= 1:
-                return int(num * total)
-            return int(num)
-        except ValueError:
-            return None
+        Args:
+            refresh: True = bỏ qua cache, đọc lại từ thiết bị và cập nhật file
+        """
+        if self._device_profile is not None and not refresh:
+            return self._device_profile
+
+        serial = self.get_device_serial()
+        profiles = {}
+        if os.path.exists(DEVICE_PROFILE_FILE):
+            try:
+                with open(DEVICE_PROFILE_FILE, "r") as f:
+                    profiles = json.load(f)
+            except Exception as e:
+                print(f"⚠️  Lỗi khi đọc device profile: {e}")
+
+        profile = None if refresh else profiles.get(serial)
+        if profile is None:
+            profile = self.probe_device_profile()
+            if profile is None:
+                return None
+            if serial:
+                profiles[serial] = profile
+                try:
+                    with open(DEVICE_PROFILE_FILE, "w") as f:
+                        json.dump(profiles, f, indent=2)
+                except Exception as e:
+                    print(f"⚠️  Lỗi khi lưu device profile: {e}")
+            if self.debug:
+                print(
+                    f"[DEBUG] Device profile {serial}: {profile['size'][0]}x{profile['size'][1]}, "
+                    f"density {profile['density']}, insets {profile['insets']}"
+                )
+
+        self._device_profile = profile
+        return profile
+
+    def get_plan(self, width=None, height=None):
+        """ExecutionPlan của workflow cho thiết bị hiện tại (compile 1 lần mỗi thiết bị)
+
+        Insets/density chỉ áp dụng khi kích thước khớp profile của thiết bị (vd: screenshot
+        xoay ngang hoặc `wm size` đã đổi thì đọc lại profile 1 lần).
+        """
+        if width is None or height is None:
+            size = self.get_screen_size()
+            if size is None:
+                raise WorkflowError("Không xác định được kích thước màn hình thiết bị")
+            width, height = size
+
+        insets, density = (0, 0, 0, 0), None
+        # Workflow pixel không có resolution/density gốc thì không cần thông số thiết bị
+        data = self.workflow.data
+        if data["coordinates"] == "normalized" or data["density"]:
+            profile = self.get_device_profile()
+            if (
+                profile
+                and tuple(profile["size"]) != (width, height)
+                and not self._device_profile_probed
+            ):
+                profile = self.get_device_profile(refresh=True)
+            if profile and tuple(profile["size"]) == (width, height):
+                insets, density = tuple(profile["insets"]), profile["density"]
+        return self.workflow.plan_for(width, height, insets, density)
+
+    def adb_stage(self, command):
+        """Tên stage đo độ trễ của 1 lệnh ADB, vd adb_shell_pidof, adb_exec-out_screencap"""
+        words = command.split()[len(self.adb_path.split()) :]
+        if words[:1] == ["-s"]:
+            words = words[2:]
+        if not words:
+            return "adb"
+        stage = f"adb_{words[0]}"
+        if words[0] in ("shell", "exec-out") and len(words) > 1:
+            match = re.match(r"[\w-]+", words[1].lstrip("\"'("))
+            if match:
+                stage += f"_{match.group()}"
+        return stage
 
     def run_adb_command(self, command):
         """Chạy lệnh ADB và trả về kết quả"""
         try:
-            result = subprocess.run(
-                command, shell=True, capture_output=True, text=True, encoding="utf-8"
-            )
+            with self.metrics.span(self.adb_stage(command), self.device_serial):
+                result = subprocess.run(
+                    command, shell=True, capture_output=True, text=True, encoding="utf-8"
+                )
             return result.stdout
         except Exception as e:
             print(f"Lỗi khi chạy lệnh ADB: {e}")
             return ""
 
+    def run_adb_command_bytes(self, command):
+        """Chạy lệnh ADB và trả về stdout dạng bytes (dữ liệu nhị phân như screencap raw)"""
+        try:
+            with self.metrics.span(self.adb_stage(command), self.device_serial):
+                result = subprocess.run(command, shell=True, capture_output=True)
+            return result.stdout
+        except Exception as e:
+            print(f"Lỗi khi chạy lệnh ADB: {e}")
+            return b""
+
+    def adb_cmd(self, args):
+        """Tạo lệnh ADB, thêm `-s <serial>` nếu có chỉ định thiết bị"""
+        if self.device_serial:
+            return f"{self.adb_path} -s {self.device_serial} {args}"
+        return f"{self.adb_path} {args}"
+
     def check_device_connected(self):
         """Kiểm tra xem có thiết bị Android nào được kết nối không"""
-        output = self.run_adb_command("adb devices")
+        output = self.run_adb_command(f"{self.adb_path} devices")
         lines = output.strip().split("\n")
         if len(lines) > 1:
             devices = [line for line in lines[1:] if line.strip() and "device" in line]
+            if self.device_serial:
+                devices = [d for d in devices if d.split()[0] == self.device_serial]
             return len(devices) > 0
         return False
 
+    def get_device_serial(self):
+        """Lấy serial của thiết bị đang dùng (cache lại sau lần đầu)"""
+        if not self.device_serial:
+            serial = self.run_adb_command(f"{self.adb_path} get-serialno").strip()
+            if serial and serial != "unknown":
+                self.device_serial = serial
+        return self.device_serial
+
     def check_app_running(self):
         """Kiểm tra xem ứng dụng có đang chạy không"""
-        output = self.run_adb_command(f"adb shell pidof {self.package_name}")
+        output = self.run_adb_command(self.adb_cmd(f"shell pidof {self.package_name}"))
         return output.strip() != ""
 
+    def record_event(self, kind, **data):
+        """Ghi event vào session (nếu đang ghi)"""
+        if self.session_recorder is not None:
+            self.session_recorder.record_event(kind, **data)
+
+    def close_session(self):
+        """Đóng file session (ghi index), gọi khi kết thúc monitor"""
+        if self.session_recorder is not None:
+            self.session_recorder.close()
+            print(f"📼 Đã lưu session: {self.session_recorder.path}")
+            self.session_recorder = None
+
+    def _set_cached_frame(self, frame, mode):
+        """Cache frame numpy và tạo PIL Image dùng chung buffer (không copy)"""
+        if self.session_recorder is not None:
+            self.session_recorder.record_frame(frame, mode)
+        height, width = frame.shape[:2]
+        self.cached_frame = frame
+        self.cached_screenshot = Image.frombuffer(
+            mode, (width, height), frame, "raw", mode, 0, 1
+        )
+
+    @timed("capture")
+    def capture_screenshot(self):
+        """Chụp 1 screenshot và cache lại (cached_screenshot + cached_frame)
+
+        Ưu tiên `exec-out screencap` raw (không encode PNG trên thiết bị, không ghi /sdcard),
+        fallback về PNG + pull nếu không có numpy hoặc format không hỗ trợ.
+
+        Returns:
+            PIL Image hoặc None nếu lỗi
+        """
+        self.cached_screenshot = None
+        self.cached_frame = None
+
+        if NUMPY_AVAILABLE:
+            data = self.run_adb_command_bytes(self.adb_cmd("exec-out screencap"))
+            with self.metrics.span("decode", self.device_serial):
+                frames, mode = parse_raw_screencap(data)
+            if frames is not None:
+                self._set_cached_frame(frames[0], mode)
+                return self.cached_screenshot
+            if self.debug:
+                print("[DEBUG] Không parse được screencap raw, dùng PNG")
+
+        self.run_adb_command(self.adb_cmd("shell screencap -p /sdcard/screenshot.png"))
+        self.run_adb_command(
+            self.adb_cmd("pull /sdcard/screenshot.png /tmp/screenshot.png 2>/dev/null")
+        )
+        try:
+            self.cached_screenshot = Image.open("/tmp/screenshot.png")
+            if self.session_recorder is not None:
+                self.session_recorder.record_frame(
+                    np.asarray(self.cached_screenshot.convert("RGBA")), "RGBA"
+                )
+        except Exception as e:
+            print(f"⚠️  Lỗi khi mở screenshot: {e}")
+        return self.cached_screenshot
+
+    @timed("capture_burst")
+    def capture_burst(self, count):
+        """Chụp `count` frame liên tiếp trong 1 lần gọi `adb exec-out`
+
+        Returns:
+            Array numpy (count, H, W, 4) hoặc None nếu không chụp được
+        """
+        if not NUMPY_AVAILABLE or count < 1:
+            return None
+
+        command = "; ".join(["screencap"] * count)
+        data = self.run_adb_command_bytes(self.adb_cmd(f'exec-out "{command}"'))
+        with self.metrics.span("decode_burst", self.device_serial):
+            frames, mode = parse_raw_screencap(data, count)
+        if frames is None:
+            if self.debug:
+                print(f"[DEBUG] Burst capture lỗi ({len(data)} bytes)")
+            return None
+
+        if self.session_recorder is not None:
+            for frame in frames[:-1]:
+                self.session_recorder.record_frame(frame, mode)
+        # Frame cuối là trạng thái mới nhất => dùng làm cache cho các bước sau
+        self._set_cached_frame(frames[-1], mode)
+        return frames
+
     def get_screen_content(self):
         """Lấy nội dung từ màn hình (UI hierarchy hoặc OCR)"""
         if self.use_ocr and OCR_AVAILABLE:
@@ -144,134 +977,392 @@ class GameMonitor:
         else:
             return self.get_screen_content_ui()
 
+    @timed("focused_window")
+    def get_focused_window(self):
+        """Tên window đang focus (dòng mCurrentFocus của dumpsys window)"""
+        output = self.run_adb_command(
+            self.adb_cmd("shell \"dumpsys window | grep mCurrentFocus\"")
+        )
+        return output.strip()
+
+    def parse_ui_stream(self, chunks):
+        """Parse UI hierarchy XML theo từng chunk, dừng ngay khi gặp node chứa target
+
+        Args:
+            chunks: Iterable các chunk bytes của XML
+
+        Returns:
+            (index, found) - index: dict text -> tọa độ tâm (theo thứ tự node, gồm cả
+            text lẫn content-desc), found: True nếu đã dừng sớm vì tìm thấy target
+        """
+        parser = ElementTree.XMLPullParser(events=("start",))
+        matcher = self.get_target_matcher()
+        index = {}
+        started = False
+
+        for chunk in chunks:
+            if not started:
+                # Bỏ qua phần rác trước XML (vd: cảnh báo của uiautomator)
+                position = chunk.find(b"<")
+                if position < 0:
+                    continue
+                chunk = chunk[position:]
+                started = True
+            try:
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    texts = [
+                        text
+                        for text in map(element.get, UI_TEXT_ATTRIBUTES)
+                        if text and text not in index
+                    ]
+                    if not texts:
+                        continue
+                    bounds = UI_BOUNDS_RE.match(element.get("bounds", ""))
+                    if not bounds:
+                        continue
+                    x1, y1, x2, y2 = map(int, bounds.groups())
+                    for text in texts:
+                        index[text] = ((x1 + x2) // 2, (y1 + y2) // 2)
+                    if any(matcher.search_text(text) for text in texts):
+                        return index, True
+            except ElementTree.ParseError:
+                # Sau thẻ đóng root, uiautomator in thêm "UI hierchary dumped to: ..."
+                break
+
+        return index, False
+
+    @timed("ui_dump")
+    def stream_ui_dump(self):
+        """Stream `uiautomator dump /dev/tty` qua exec-out vào parser, không ghi /sdcard
+
+        Returns:
+            (index, found) như parse_ui_stream
+        """
+        process = subprocess.Popen(
+            self.adb_cmd("exec-out uiautomator dump /dev/tty"),
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            return self.parse_ui_stream(
+                iter(lambda: process.stdout.read1(UI_DUMP_CHUNK_SIZE), b"")
+            )
+        finally:
+            # Dừng sớm => không cần đọc phần còn lại của dump
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
     def get_screen_content_ui(self):
-        """Lấy nội dung UI hierarchy từ màn hình"""
-        # Dump UI hierarchy vào file trên thiết bị
-        self.run_adb_command("adb shell uiautomator dump /sdcard/window_dump.xml")
+        """Lấy nội dung UI hierarchy từ màn hình
 
-        # Pull file về máy tính
-        output = self.run_adb_command("adb shell cat /sdcard/window_dump.xml")
+        Returns:
+            Text của các node (mỗi node 1 dòng); tọa độ được lưu trong self.ui_text_index
+        """
+        # Bỏ qua dump nếu window đang focus không đổi và dump gần nhất còn mới
+        # (ui_dump_max_age = 0 => tắt, không tốn lệnh dumpsys window)
+        focus = self.get_focused_window() if self.ui_dump_max_age > 0 else None
+        now = time.monotonic()
+        if (
+            focus
+            and focus == self._ui_focus
+            and self.ui_text_index is not None
+            and now - self._ui_dump_time < self.ui_dump_max_age
+        ):
+            if self.debug:
+                print(f"[DEBUG] Window không đổi ({focus}), dùng lại UI dump trước")
+            return "\n".join(self.ui_text_index)
 
-        if self.debug:
-            print(
-                f"\n[DEBUG] UI Content preview (first 500 chars):\n{output[:500]}...\n"
+        try:
+            index, found = self.stream_ui_dump()
+        except Exception as e:
+            print(f"⚠️  Lỗi khi stream UI dump: {e}")
+            index, found = {}, False
+
+        if not index:
+            # Fallback: thiết bị không hỗ trợ dump ra /dev/tty
+            self.run_adb_command(
+                self.adb_cmd("shell uiautomator dump /sdcard/window_dump.xml")
+            )
+            output = self.run_adb_command_bytes(
+                self.adb_cmd("exec-out cat /sdcard/window_dump.xml")
             )
+            index, found = self.parse_ui_stream([output])
 
-        return output
+        self.ui_text_index = index
+        self._ui_focus = focus
+        self._ui_dump_time = now
+
+        content = "\n".join(index)
+        if self.debug:
+            status = "dừng sớm (tìm thấy target)" if found else "đầy đủ"
+            print(f"\n[DEBUG] UI dump {status}: {len(index)} node có text")
+            print(f"[DEBUG] UI Content preview (first 500 chars):\n{content[:500]}...\n")
+
+        return content
 
     def get_screen_content_ocr(self):
-        """Lấy screenshot và nhận dạng text bằng OCR"""
-        # Chụp screenshot và lưu vào thiết bị
-        self.run_adb_command("adb shell screencap -p /sdcard/screenshot.png")
+        """Lấy screenshot, chạy detection cascade và nhận dạng text bằng OCR
 
-        # Pull screenshot về máy (kết hợp 2 lệnh để nhanh hơn)
-        self.run_adb_command(
-            "adb pull /sdcard/screenshot.png /tmp/screenshot.png 2>/dev/null"
-        )
+        Các stage rẻ (frame không đổi, màu, pattern, template) loại frame sớm;
+        OCR chỉ chạy khi frame qua hết các stage trước.
+        """
+        # Chụp screenshot (ảnh gốc được cache để dùng cho get_pixel_color)
+        img = self.capture_screenshot()
+        if img is None:
+            return self.ocr_screenshot(img)
+
+        cascade = self.get_detection_cascade()
+        self._cascade_text = ""
+        self._pending_signatures = {}
+        found = cascade.run(img)
+
+        if found:
+            self._negative_signatures = {}
+        else:
+            # Frame không có target: lần sau frame y hệt sẽ bị stage "unchanged" loại ngay
+            self._negative_signatures.update(self._pending_signatures)
+            if cascade.last_rejected_by != "ocr":
+                self.record_event("cascade", rejected_by=cascade.last_rejected_by)
+            if self.debug and cascade.last_rejected_by != "ocr":
+                print(f"[DEBUG] Detection cascade: loại ở stage '{cascade.last_rejected_by}'")
+        return self._cascade_text
+
+    def get_frame_array(self, img):
+        """Screenshot dạng numpy (dùng lại frame raw nếu có, không copy)"""
+        if self.cached_frame is not None and img is self.cached_screenshot:
+            return self.cached_frame
+        return np.asarray(img)
+
+    def load_template(self, path, scale):
+        """Ảnh xám template đã resize theo thiết bị và bước lấy mẫu (cache)"""
+        key = (path, scale)
+        template = self._template_cache.get(key)
+        if template is None:
+            img = Image.open(path).convert("RGB")
+            if scale != 1.0:
+                size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+                img = img.resize(size, Image.Resampling.BOX)
+            template = to_gray(np.asarray(img))
+            self._template_cache[key] = template
+        return template
+
+    def make_cascade_check(self, stage):
+        """Tạo hàm check(img) -> bool cho 1 stage đã compile trong ExecutionPlan"""
+        kind, name, box = stage["type"], stage["name"], stage["box"]
+
+        if kind == "unchanged":
+
+            def check(img):
+                signature = region_signature(self.get_frame_array(img), box)
+                self._pending_signatures[name] = signature
+                distance = signature_distance(signature, self._negative_signatures.get(name))
+                return distance > stage["threshold"]
+
+        elif kind == "color":
+
+            def check(img):
+                fraction = color_fraction(
+                    self.get_frame_array(img), box, stage["rgb"], stage["tolerance"]
+                )
+                return fraction >= stage["min_fraction"]
 
-        # Mở ảnh và chạy OCR
-        try:
-            img = Image.open("/tmp/screenshot.png")
-            width, height = img.size
+        elif kind == "pattern":
 
-            self.cached_screenshot = img  # Cache ảnh gốc để dùng cho get_pixel_color
+            def check(img):
+                return any(
+                    self.check_pixel_pattern(p, screen_veto=True)[0] for p in stage["patterns"]
+                )
 
-            # Crop vùng cần OCR nếu có chỉ định
-            if self.ocr_region:
-                # Parse các giá trị với hỗ trợ % và px
-                top = self.parse_dimension(self.ocr_region.get("top", 0), height) or 0
-                left = self.parse_dimension(self.ocr_region.get("left", 0), width) or 0
-                ocr_width = self.parse_dimension(self.ocr_region.get("width"), width)
-                ocr_height = self.parse_dimension(self.ocr_region.get("height"), height)
-
-                # Nếu không có width/height, dùng toàn bộ từ left/top đến cuối
-                if ocr_width is None:
-                    ocr_width = width - left
-                if ocr_height is None:
-                    ocr_height = height - top
-
-                # Tính bottom và right
-                right = left + ocr_width
-                bottom = top + ocr_height
-
-                # Đảm bảo không vượt quá kích thước ảnh
-                right = min(right, width)
-                bottom = min(bottom, height)
-
-                img_crop = img.crop((left, top, right, bottom))
-                crop_offset_x = left
-                crop_offset_y = top
+        elif kind == "screen":
 
-                if self.debug:
-                    print(
-                        f"[DEBUG] Crop vùng OCR: x={left}->{right}, y={top}->{bottom} (kích thước: {right-left}x{bottom-top}px)"
-                    )
-            else:
-                img_crop = img
-                crop_offset_x = 0
-                crop_offset_y = 0
+            def check(img):
+                return self.identify_screen().label not in stage["reject"]
+
+        elif kind == "template":
+            # Template và vùng tìm được lấy mẫu cùng bước => so khớp trên ảnh nhỏ
+            step = max(1, round(1 / stage["scale"]))
+
+            def check(img):
+                plan = self.get_plan(*img.size)
+                template = self.load_template(stage["image"], plan.image_scale)[::step, ::step]
+                left, top, right, bottom = box
+                region = to_gray(self.get_frame_array(img)[top:bottom, left:right], step)
+                score, _ = match_template(region, template)
+                return score >= stage["threshold"]
+
+        else:
+
+            def check(img):
+                self._cascade_text = self.ocr_screenshot(img)
+                return self.get_target_matcher().search_text(self._cascade_text) != []
+
+        return check
+
+    def get_detection_cascade(self):
+        """DetectionCascade của plan hiện tại, thống kê được giữ khi plan đổi"""
+        plan = self.get_plan()
+        if self._cascade is None or self._cascade_plan is not plan:
+            stages = []
+            for stage in plan.detection:
+                if stage["type"] in ("unchanged", "color", "template", "screen") and not NUMPY_AVAILABLE:
+                    print(f"⚠️  Bỏ qua stage '{stage['name']}': cần numpy")
+                    continue
+                stages.append((stage["name"], self.make_cascade_check(stage)))
+
+            cascade = DetectionCascade(stages)
+            if self._cascade is not None:
+                for name, stats in self._cascade.stats.items():
+                    if name in cascade.stats:
+                        cascade.stats[name] = stats
+            self._cascade = cascade
+            self._cascade_plan = plan
+        return self._cascade
+
+    def print_cascade_report(self):
+        """In thống kê từng stage của detection cascade (tỷ lệ cho qua/loại, chi phí)"""
+        if self._cascade is None or not any(s.calls for s in self._cascade.stats.values()):
+            return
+        print("\n📊 Thống kê detection cascade:")
+        for line in self._cascade.report():
+            print(f"   {line}")
+
+    def resolve_ocr_scale(self):
+        """Tỷ lệ resize ảnh trước khi OCR (1.0 = giữ nguyên kích thước)"""
+        if self.ocr_scale == "auto":
+            return self._auto_ocr_scale
+        return min(max(float(self.ocr_scale), OCR_MIN_SCALE), 1.0)
+
+    def update_auto_ocr_scale(self, ocr_data):
+        """Chọn tỷ lệ resize từ chiều cao chữ đo được (tọa độ gốc) ở lần OCR gần nhất"""
+        heights = [
+            h
+            for word, h, conf in zip(
+                ocr_data["text"], ocr_data["height"], ocr_data["conf"]
+            )
+            if word.strip() and float(conf) > 0
+        ]
+        if not heights:
+            return
+
+        heights.sort()
+        text_height = heights[len(heights) // 2]
+        scale = min(1.0, max(OCR_MIN_SCALE, OCR_TARGET_TEXT_HEIGHT / text_height))
+        # Làm tròn xuống theo bước cố định để kích thước ảnh (và buffer) ổn định giữa các frame
+        scale = round(max(OCR_MIN_SCALE, int(scale / OCR_SCALE_STEP) * OCR_SCALE_STEP), 2)
+
+        if self.debug and scale != self._auto_ocr_scale:
+            print(
+                f"[DEBUG] Chiều cao chữ ~{text_height}px -> OCR scale {self._auto_ocr_scale:.2f} => {scale:.2f}"
+            )
+        self._auto_ocr_scale = scale
+
+    def map_ocr_data_to_crop(self, ocr_data, scale_x, scale_y):
+        """Đổi tọa độ các box OCR từ ảnh đã resize về tọa độ của crop gốc
 
-            # Không resize để giữ nguyên chi tiết (ưu tiên độ chính xác hơn tốc độ)
-            crop_width, crop_height = img_crop.size
-            img_resized = img_crop  # Giữ nguyên kích thước gốc
+        Map theo cạnh trái/phải của box (không map tâm đã làm tròn) nên tâm tính
+        sau đó khớp với tọa độ thiết bị như khi OCR ở độ phân giải gốc.
+        """
+        mapped = dict(ocr_data)
+        lefts, tops, widths, heights = [], [], [], []
+        for left, top, width, height in zip(
+            ocr_data["left"], ocr_data["top"], ocr_data["width"], ocr_data["height"]
+        ):
+            x0 = int(round(left * scale_x))
+            y0 = int(round(top * scale_y))
+            lefts.append(x0)
+            tops.append(y0)
+            widths.append(int(round((left + width) * scale_x)) - x0)
+            heights.append(int(round((top + height) * scale_y)) - y0)
+        mapped["left"] = lefts
+        mapped["top"] = tops
+        mapped["width"] = widths
+        mapped["height"] = heights
+        return mapped
+
+    def get_ocr_box(self, width, height):
+        """Vùng OCR (left, top, right, bottom) đã tính sẵn trong ExecutionPlan"""
+        return self.get_plan(width, height).ocr_box
+
+    @timed("preprocess")
+    def preprocess_ocr_image(self, img, box, ocr_size):
+        """Crop, resize (nếu cần) và tiền xử lý vùng OCR
 
-            # Preprocessing để cải thiện OCR
+        Returns:
+            PIL Image grayscale sẵn sàng cho Tesseract
+        """
+        left, top, right, bottom = box
+        resized = ocr_size != (right - left, bottom - top)
+
+        if self._ocr_preprocessor is not None:
+            # Kernel số nguyên: crop RGBA -> grayscale -> contrast -> sharpen
+            # ghi thẳng vào buffer cấp phát sẵn (không tạo ảnh trung gian)
+            if resized:
+                crop_array = np.asarray(
+                    img.crop(box).resize(ocr_size, Image.Resampling.BOX)
+                )
+            elif self.cached_frame is not None:
+                crop_array = self.cached_frame[top:bottom, left:right]
+            else:
+                crop_array = np.asarray(img.crop(box))
+            img_final = Image.fromarray(self._ocr_preprocessor.process(crop_array))
+        else:
+            # Fallback: dùng PIL nếu không có numpy
             # 1. Chuyển sang grayscale
-            img_gray = img_resized.convert("L")
+            img_gray = img.crop(box).convert("L")
+            if resized:
+                img_gray = img_gray.resize(ocr_size, Image.Resampling.BOX)
 
             # 2. Tăng contrast
-            if NUMPY_AVAILABLE:
-                img_array = np.array(img_gray)
-                # Simple contrast enhancement: clip and normalize
-                img_array = np.clip(img_array * 1.2, 0, 255).astype(np.uint8)
-                img_enhanced = Image.fromarray(img_array)
-            else:
-                # Fallback: dùng ImageEnhance nếu không có numpy
-                enhancer = ImageEnhance.Contrast(img_gray)
-                img_enhanced = enhancer.enhance(1.5)
+            enhancer = ImageEnhance.Contrast(img_gray)
+            img_enhanced = enhancer.enhance(1.5)
 
             # 3. Sharpen để làm rõ text
             sharpener = ImageEnhance.Sharpness(img_enhanced)
             img_final = sharpener.enhance(2.0)
 
-            # Debug: Lưu ảnh preprocessing để kiểm tra
-            if self.debug:
-                try:
-                    img_final.save("/tmp/ocr_preprocessed.png")
-                    print(
-                        f"[DEBUG] Đã lưu ảnh preprocessing tại: /tmp/ocr_preprocessed.png"
-                    )
-                except:
-                    pass
-
-            # Tesseract config tối ưu cho text detection
-            # Thử nhiều PSM modes để tăng khả năng nhận diện
-            psm_modes = [
-                ("--oem 3 --psm 6", "Single uniform block"),  # Phù hợp nhất cho UI game
-                ("--oem 3 --psm 11", "Sparse text"),  # Backup: text rải rác
-                ("--oem 3 --psm 3", "Fully automatic"),  # Fallback: tự động
-            ]
+        # Debug: Lưu ảnh preprocessing để kiểm tra
+        if self.debug:
+            try:
+                img_final.save("/tmp/ocr_preprocessed.png")
+                print(f"[DEBUG] Đã lưu ảnh preprocessing tại: /tmp/ocr_preprocessed.png")
+            except:
+                pass
 
-            text = ""
-            data = None
+        return img_final
 
-            for tesseract_config, mode_desc in psm_modes:
-                # Nhận dạng text từ ảnh đã preprocessing
-                try:
+    def ocr_full_region(self, img, box, ocr_size):
+        """OCR toàn bộ vùng OCR, thử lần lượt các PSM mode cho đến khi thấy target
+
+        Returns:
+            Tuple (text, data) - box trong data ở tọa độ crop gốc (chưa cộng offset)
+        """
+        img_final = self.preprocess_ocr_image(img, box, ocr_size)
+
+        # Thử nhiều PSM modes để tăng khả năng nhận diện
+        text = ""
+        data = None
+
+        for psm, mode_desc in OCR_PSM_MODES:
+            tesseract_config = self.tesseract_config(psm)
+            # Nhận dạng text từ ảnh đã preprocessing
+            try:
+                with self.metrics.span(f"ocr_psm{psm}", self.device_serial):
                     text_temp = pytesseract.image_to_string(
                         img_final, lang="eng", config=tesseract_config
                     )
 
-                    # Kiểm tra xem có tìm thấy target text không
-                    found_any = any(
-                        target.lower() in text_temp.lower()
-                        for target in self.target_texts
-                    )
+                # Kiểm tra xem có tìm thấy target text không
+                found_any = bool(self.get_target_matcher().search_text(text_temp))
 
-                    if (
-                        found_any or not text
-                    ):  # Dùng result này nếu tìm thấy hoặc chưa có result nào
-                        text = text_temp
+                if (
+                    found_any or not text
+                ):  # Dùng result này nếu tìm thấy hoặc chưa có result nào
+                    text = text_temp
+                    with self.metrics.span(f"ocr_data_psm{psm}", self.device_serial):
                         data = pytesseract.image_to_data(
                             img_final,
                             lang="eng",
@@ -279,38 +1370,271 @@ class GameMonitor:
                             output_type=pytesseract.Output.DICT,
                         )
 
-                        if self.debug:
-                            print(
-                                f"[DEBUG] Sử dụng PSM mode: {mode_desc} ({tesseract_config})"
-                            )
+                    if self.debug:
+                        print(
+                            f"[DEBUG] Sử dụng PSM mode: {mode_desc} ({tesseract_config})"
+                        )
 
-                        if found_any:
-                            break  # Đã tìm thấy, không cần thử mode khác
+                    if found_any:
+                        break  # Đã tìm thấy, không cần thử mode khác
 
-                except Exception as e:
-                    if self.debug:
-                        print(f"[DEBUG] Lỗi khi OCR với mode {mode_desc}: {e}")
-                    continue
+            except Exception as e:
+                if self.debug:
+                    print(f"[DEBUG] Lỗi khi OCR với mode {mode_desc}: {e}")
+                continue
+
+        # Đưa tọa độ các box về crop gốc nếu đã resize
+        left, top, right, bottom = box
+        if data is not None and ocr_size != (right - left, bottom - top):
+            data = self.map_ocr_data_to_crop(
+                data, (right - left) / ocr_size[0], (bottom - top) / ocr_size[1]
+            )
 
-            # Tìm tọa độ cho tất cả target texts
-            for target in self.target_texts:
-                if target in text:
-                    self.target_text = target  # Lưu text đã tìm thấy
-                    # Tính toạ độ cho text này
-                    coords = self.find_text_coordinates_for_target(data, target)
-                    if coords:
-                        # Không cần scale vì không resize nữa, chỉ cần cộng offset (do crop)
-                        self.last_found_coords = (
-                            coords[0] + crop_offset_x,
-                            coords[1] + crop_offset_y,
-                        )
-                        break
+        return text, data
+
+    def ocr_changed_tiles(self, img, box, ocr_size):
+        """OCR tăng dần: chia vùng OCR thành các dải ngang, chỉ OCR lại dải bị thay đổi
+
+        Mỗi dải gồm phần lõi OCR_TILE_HEIGHT px và phần đệm OCR_TILE_PADDING px ở trên/dưới
+        để chữ nằm ở ranh giới vẫn trọn vẹn trong 1 dải. Từ nhận dạng được thuộc về dải
+        có phần lõi chứa tâm của từ, nên khi gộp không bị trùng lặp. Chỉ các dải thay đổi
+        (kèm phần đệm) được tiền xử lý và OCR; giống OCR toàn vùng, PSM 6 không thấy
+        target thì các dải đó được OCR lại với PSM 11 rồi 3 (OCR_PSM_MODES).
+
+        Returns:
+            Tuple (text, data) - box trong data ở tọa độ crop gốc (chưa cộng offset)
+        """
+        left, top, right, bottom = box
+        crop_width, crop_height = right - left, bottom - top
+        scale_x = ocr_size[0] / crop_width
+        scale_y = ocr_size[1] / crop_height
+
+        if self.cached_frame is not None:
+            crop_array = self.cached_frame[top:bottom, left:right]
+        else:
+            crop_array = np.asarray(img.crop(box))
+
+        # Đổi vùng OCR hoặc scale => toàn bộ cache dải không còn dùng được
+        if self._ocr_tile_geometry != (box, ocr_size):
+            self._ocr_tile_geometry = (box, ocr_size)
+            self._ocr_tiles = {}
+
+        # Hash nội dung từng dải (gồm cả phần đệm) trên pixel gốc
+        tiles = []
+        for core_top in range(0, crop_height, OCR_TILE_HEIGHT):
+            core_bottom = min(core_top + OCR_TILE_HEIGHT, crop_height)
+            band_top = max(0, core_top - OCR_TILE_PADDING)
+            band_bottom = min(crop_height, core_bottom + OCR_TILE_PADDING)
+            band = np.ascontiguousarray(crop_array[band_top:band_bottom])
+            tiles.append((core_top, core_bottom, band_top, band_bottom, zlib.crc32(band)))
+
+        changed = [
+            tile
+            for tile in tiles
+            if self._ocr_tiles.get(tile[0], {}).get("hash") != tile[4]
+        ]
+        changed_rows = sum(tile[3] - tile[2] for tile in changed)
+        self.last_ocr_tile_ratio = changed_rows / sum(tile[3] - tile[2] for tile in tiles)
+
+        # Tiền xử lý riêng từng dải thay đổi (copy vì buffer của preprocessor dùng lại)
+        band_images = []
+        for core_top, core_bottom, band_top, band_bottom, tile_hash in changed:
+            y0 = int(round(band_top * scale_y))
+            y1 = max(y0 + 1, int(round(band_bottom * scale_y)))
+            band_box = (left, top + band_top, right, top + band_bottom)
+            band_img = self.preprocess_ocr_image(img, band_box, (ocr_size[0], y1 - y0))
+            band_images.append(band_img.copy())
+
+        unchanged_words = [
+            word
+            for tile in tiles
+            if tile not in changed
+            for word in self._ocr_tiles.get(tile[0], {}).get("words", [])
+        ]
+        results = None
+        for psm, mode_desc in OCR_PSM_MODES if changed else ():
+            tesseract_config = self.tesseract_config(psm)
+            tile_words = {}
+            for tile, band_img in zip(changed, band_images):
+                words = self.ocr_tile(band_img, tile, tesseract_config, scale_x, scale_y)
+                if words is not None:
+                    tile_words[tile[0]] = (tile[4], words)
+            if results is None:
+                results = tile_words  # Không PSM nào thấy target => giữ kết quả PSM 6
+
+            text = self.words_to_ocr_result(
+                unchanged_words + [w for _, words in tile_words.values() for w in words]
+            )[0]
+            if self.get_target_matcher().search_text(text):
+                results = tile_words
+                if self.debug and psm != OCR_PSM_MODES[0][0]:
+                    print(f"[DEBUG] OCR tăng dần: thấy target với PSM mode: {mode_desc}")
+                break
+
+        for core_top, core_bottom, band_top, band_bottom, tile_hash in changed:
+            if core_top in results:
+                tile_hash, words = results[core_top]
+                self._ocr_tiles[core_top] = {"hash": tile_hash, "words": words}
+            else:
+                self._ocr_tiles.pop(core_top, None)  # OCR lỗi => OCR lại ở lần sau
+
+        if self.debug:
+            print(
+                f"[DEBUG] OCR tăng dần: {len(changed)}/{len(tiles)} dải thay đổi ({self.last_ocr_tile_ratio*100:.0f}% pixel)"
+            )
+
+        words = [
+            word
+            for tile in tiles
+            for word in self._ocr_tiles.get(tile[0], {}).get("words", [])
+        ]
+        return self.words_to_ocr_result(words)
+
+    def ocr_tile(self, band_img, tile, tesseract_config, scale_x, scale_y):
+        """OCR 1 dải đã tiền xử lý
+
+        Returns:
+            Danh sách từ (text, left, top, width, height, conf) có tâm nằm trong phần lõi
+            của dải, tọa độ crop gốc; None nếu OCR lỗi
+        """
+        core_top, core_bottom, band_top, band_bottom, _ = tile
+        y0 = int(round(band_top * scale_y))
+        try:
+            with self.metrics.span("ocr_tile", self.device_serial):
+                data = pytesseract.image_to_data(
+                    band_img,
+                    lang="eng",
+                    config=tesseract_config,
+                    output_type=pytesseract.Output.DICT,
+                )
+        except Exception as e:
+            if self.debug:
+                print(f"[DEBUG] Lỗi khi OCR dải y={band_top}->{band_bottom}: {e}")
+            return None
+
+        data["top"] = [t + y0 for t in data["top"]]
+        if (scale_x, scale_y) != (1.0, 1.0):
+            data = self.map_ocr_data_to_crop(data, 1 / scale_x, 1 / scale_y)
+
+        words = []
+        for i, word in enumerate(data["text"]):
+            center_y = data["top"][i] + data["height"][i] / 2
+            if word.strip() and core_top <= center_y < core_bottom:
+                words.append(
+                    (
+                        word,
+                        data["left"][i],
+                        data["top"][i],
+                        data["width"][i],
+                        data["height"][i],
+                        data["conf"][i],
+                    )
+                )
+        return words
+
+    def words_to_ocr_result(self, words):
+        """Gộp các từ (text, left, top, width, height, conf) thành (text, data) như Tesseract
+
+        Từ được nhóm thành dòng theo tâm dọc, mỗi dòng sắp xếp từ trái sang phải.
+        """
+        lines = []
+        for word in sorted(words, key=lambda w: (w[2] + w[4] / 2, w[1])):
+            center_y = word[2] + word[4] / 2
+            if lines and abs(center_y - lines[-1][0]) <= max(word[4], lines[-1][1]) / 2:
+                lines[-1][2].append(word)
+            else:
+                lines.append([center_y, word[4], [word]])
+
+        data = {"text": [], "left": [], "top": [], "width": [], "height": [], "conf": []}
+        text_lines = []
+        for _, _, line_words in lines:
+            line_words.sort(key=lambda w: w[1])
+            # Entry rỗng đánh dấu đầu dòng giống output của Tesseract
+            line_words.insert(0, ("", 0, 0, 0, 0, -1))
+            for word, left, top, width, height, conf in line_words:
+                data["text"].append(word)
+                data["left"].append(left)
+                data["top"].append(top)
+                data["width"].append(width)
+                data["height"].append(height)
+                data["conf"].append(conf)
+            text_lines.append(" ".join(w[0] for w in line_words[1:]))
+
+        return "\n".join(text_lines), data
+
+    def ocr_screenshot(self, img):
+        """Crop, tiền xử lý và chạy OCR trên 1 screenshot, cập nhật last_found_coords
+
+        Returns:
+            Text nhận dạng được ("" nếu lỗi)
+        """
+        try:
+            if img is None:
+                raise ValueError("Không chụp được screenshot")
+            width, height = img.size
+
+            # Crop vùng cần OCR nếu có chỉ định
+            box = self.get_ocr_box(width, height)
+            left, top, right, bottom = box
+            if self.ocr_region and self.debug:
+                print(
+                    f"[DEBUG] Crop vùng OCR: x={left}->{right}, y={top}->{bottom} (kích thước: {right-left}x{bottom-top}px)"
+                )
+
+            crop_offset_x = left
+            crop_offset_y = top
+
+            # Resize trước khi OCR nếu có cấu hình ocr_scale (mặc định 1.0 = giữ nguyên
+            # chi tiết, ưu tiên độ chính xác hơn tốc độ)
+            crop_width, crop_height = right - left, bottom - top
+            scale = self.resolve_ocr_scale()
+            ocr_size = (
+                max(1, int(round(crop_width * scale))),
+                max(1, int(round(crop_height * scale))),
+            )
+            if ocr_size != (crop_width, crop_height) and self.debug:
+                print(
+                    f"[DEBUG] Resize vùng OCR x{scale:.2f}: {crop_width}x{crop_height} -> {ocr_size[0]}x{ocr_size[1]}px"
+                )
+
+            if self.incremental_ocr and NUMPY_AVAILABLE:
+                text, data = self.ocr_changed_tiles(img, box, ocr_size)
+            else:
+                text, data = self.ocr_full_region(img, box, ocr_size)
+
+            if data is not None and self.ocr_scale == "auto":
+                self.update_auto_ocr_scale(data)
+
+            # Tìm tất cả target texts (kèm tọa độ) trong 1 lần duyệt các từ OCR
+            matcher = self.get_target_matcher()
+            hits = matcher.match_ocr_data(data) if data is not None else []
+            if hits:
+                self.target_text = hits[0].target  # Lưu text đã tìm thấy
+                self.last_match_score = hits[0].score
+                # Box đã ở tọa độ crop gốc, chỉ cần cộng offset (do crop)
+                self.last_found_coords = (
+                    hits[0].center[0] + crop_offset_x,
+                    hits[0].center[1] + crop_offset_y,
+                )
+            else:
+                found = matcher.search_text(text)
+                if found:
+                    self.target_text = found[0]  # Có text nhưng không lấy được tọa độ
+
+            self.record_event(
+                "ocr",
+                text=text[:500],
+                target=self.target_text if hits else None,
+                coords=list(self.last_found_coords) if hits else None,
+                score=self.last_match_score if hits else None,
+            )
 
             if self.debug:
                 print(f"\n[DEBUG] OCR detected text:\n{text[:500]}...\n")
                 if self.last_found_coords:
                     print(
-                        f"[DEBUG] Found '{self.target_text}' at coordinates: {self.last_found_coords}\n"
+                        f"[DEBUG] Found '{self.target_text}' at coordinates: {self.last_found_coords}"
+                        f" (score {self.last_match_score or 1.0:.2f})\n"
                     )
 
             return text
@@ -325,69 +1649,83 @@ class GameMonitor:
             return self.find_text_coordinates_for_target(ocr_data, self.target_text)
         return None
 
-    def find_text_coordinates_for_target(self, ocr_data, target_text):
-        """Tìm tọa độ của một text cụ thể từ dữ liệu OCR"""
-        words = ocr_data["text"]
-        n_boxes = len(words)
-
-        # Tìm tất cả các từ trong target text
-        target_words = target_text.split()
-
-        for i in range(n_boxes - len(target_words) + 1):
-            # Kiểm tra nếu các từ liên tiếp khớp với target text
-            match = True
-            for j, target_word in enumerate(target_words):
-                if words[i + j].lower() != target_word.lower():
-                    match = False
-                    break
-
-            if match and ocr_data["conf"][i] > 0:  # Confidence > 0
-                # Lấy tọa độ của từ đầu tiên
-                x = ocr_data["left"][i]
-                y = ocr_data["top"][i]
-                w = ocr_data["width"][i]
-                h = ocr_data["height"][i]
+    def get_target_matcher(self):
+        """Automaton so khớp target_texts, compile lại khi danh sách target thay đổi
 
-                # Tính tọa độ trung tâm của toàn bộ cụm từ
-                last_idx = i + len(target_words) - 1
-                x_end = ocr_data["left"][last_idx] + ocr_data["width"][last_idx]
-                y_end = ocr_data["top"][last_idx] + ocr_data["height"][last_idx]
+        Text OCR được so khớp fuzzy; text từ UI hierarchy là chính xác nên không cần.
+        """
+        targets = tuple(self.target_texts)
+        max_edits = self.ocr_max_edits if self.use_ocr else 0
+        matcher = self._target_matcher
+        if (
+            matcher is None
+            or tuple(matcher.targets) != targets
+            or matcher.max_edits != max_edits
+        ):
+            self._target_matcher = TargetMatcher(targets, max_edits=max_edits)
+        return self._target_matcher
+
+    def get_ocr_profile(self):
+        """Profile Tesseract của target_texts, sinh lại khi danh sách target thay đổi"""
+        targets = tuple(self.target_texts)
+        if self._ocr_profile is None or self._ocr_profile.targets != targets:
+            self._ocr_profile = OcrProfile(targets)
+            if self.debug:
+                print(
+                    f"[DEBUG] OCR profile: whitelist '{self._ocr_profile.whitelist}', "
+                    f"{len(self._ocr_profile.words)} user-words"
+                )
+        return self._ocr_profile
+
+    def tesseract_config(self, psm):
+        """Config Tesseract cho 1 PSM mode (kèm profile target nếu bật)"""
+        if self.use_ocr_profile:
+            try:
+                return self.get_ocr_profile().config(psm=psm)
+            except OSError as e:
+                print(f"⚠️  Không tạo được OCR profile, dùng từ điển mặc định: {e}")
+                self.use_ocr_profile = False
+        return f"--oem 3 --psm {psm}"
 
-                center_x = (x + x_end) // 2
-                center_y = (y + y_end) // 2
+    def find_text_coordinates_for_target(self, ocr_data, target_text):
+        """Tìm tọa độ của một text cụ thể từ dữ liệu OCR"""
+        matcher = self.get_target_matcher()
+        if target_text not in matcher.targets:
+            matcher = TargetMatcher([target_text], max_edits=matcher.max_edits)
 
-                return (center_x, center_y)
+        for hit in matcher.match_ocr_data(ocr_data):
+            if hit.target == target_text:
+                return hit.center  # Tọa độ trung tâm của toàn bộ cụm từ
 
         return None
 
-    def find_text_coordinates_ui(self, xml_content):
-        """Tìm tọa độ của text từ UI hierarchy XML"""
-        # Tìm node có text khớp
-        pattern = rf'text="{re.escape(self.target_text)}"[^>]*bounds="\[(\d+),(\d+)\]\[(\d+),(\d+)\]"'
-        match = re.search(pattern, xml_content)
+    def find_text_coordinates_ui(self):
+        """Tìm tọa độ của target text từ index text -> bounds của UI dump gần nhất"""
+        if not self.ui_text_index or not self.target_text:
+            return None
 
-        if match:
-            x1, y1, x2, y2 = map(int, match.groups())
-            center_x = (x1 + x2) // 2
-            center_y = (y1 + y2) // 2
-            return (center_x, center_y)
+        matcher = TargetMatcher([self.target_text])
+        for text, center in self.ui_text_index.items():
+            if matcher.search_text(text):
+                return center
 
         return None
 
+    @timed("check")
     def search_text_in_screen(self):
         """Tìm kiếm text trong màn hình hiện tại"""
         content = self.get_screen_content()
 
-        # Tìm kiếm tất cả các target texts
-        for target in self.target_texts:
-            if target in content:
-                self.target_text = target  # Lưu text đã tìm thấy
+        # Tìm kiếm tất cả các target texts trong 1 lần duyệt
+        found = self.get_target_matcher().search_text(content)
+        if found:
+            self.target_text = found[0]  # Lưu text đã tìm thấy (theo thứ tự ưu tiên)
 
-                # Nếu dùng UI hierarchy, lấy tọa độ
-                if not self.use_ocr:
-                    self.last_found_coords = self.find_text_coordinates_ui(content)
+            # Nếu dùng UI hierarchy, lấy tọa độ
+            if not self.use_ocr:
+                self.last_found_coords = self.find_text_coordinates_ui()
 
-                return True
+            return True
 
         return False
 
@@ -399,11 +1737,7 @@ class GameMonitor:
                 img = self.cached_screenshot
             else:
                 # Chụp screenshot mới nếu không dùng cache
-                self.run_adb_command("adb shell screencap -p /sdcard/screenshot.png")
-                self.run_adb_command(
-                    "adb pull /sdcard/screenshot.png /tmp/screenshot.png 2>/dev/null"
-                )
-                img = Image.open("/tmp/screenshot.png")
+                img = self.capture_screenshot()
 
             # Lấy màu pixel
             pixel = img.getpixel((x, y))
@@ -419,12 +1753,15 @@ class GameMonitor:
             print(f"⚠️  Lỗi khi lấy màu pixel: {e}")
             return None
 
-    def check_pixel_pattern(self, pattern_name, tolerance=None):
+    @timed("pattern_check")
+    def check_pixel_pattern(self, pattern_name, tolerance=None, screen_veto=False):
         """Kiểm tra pixel pattern có khớp không - OPTIMIZED VERSION
 
         Args:
             pattern_name: Tên pattern cần check (vd: 'step3', 'step4')
             tolerance: Độ sai lệch màu cho phép (0-255), None = dùng self.pattern_tolerance
+            screen_veto: True = screen index chắc chắn là màn hình khác thì FAIL luôn
+                (chỉ dùng để lọc sớm trong detection cascade, không dùng khi verify 1 bước)
 
         Returns:
             Tuple (is_match, match_ratio)
@@ -438,39 +1775,56 @@ class GameMonitor:
         if tolerance is None:
             tolerance = self.pattern_tolerance
 
-        pattern = self.pixel_patterns[pattern_name]
-        total_pixels = len(pattern)
-
         # Chụp screenshot mới nếu chưa có cache
         if not self.cached_screenshot:
-            self.run_adb_command("adb shell screencap -p /sdcard/screenshot.png")
-            self.run_adb_command(
-                "adb pull /sdcard/screenshot.png /tmp/screenshot.png 2>/dev/null"
-            )
-            self.cached_screenshot = Image.open("/tmp/screenshot.png")
+            self.capture_screenshot()
 
         img = self.cached_screenshot
 
-        # ⚡ OPTIMIZATION 1: Parse tất cả expected RGB một lần và cache
-        cache_key = pattern_name
-        if cache_key not in self._pattern_rgb_cache:
-            self._pattern_rgb_cache[cache_key] = [
-                (
-                    p["coord"],
-                    int(p["color"][1:3], 16),
-                    int(p["color"][3:5], 16),
-                    int(p["color"][5:7], 16),
-                    p["color"],
+        # Screen index nhận ra chắc chắn là màn hình khác => không cần check pixel
+        if (
+            screen_veto
+            and self.screen_index is not None
+            and pattern_name in self.screen_index.labels
+        ):
+            screen = self.identify_screen()
+            if screen.label is not None and screen.label != pattern_name:
+                if self.debug:
+                    print(
+                        f"[DEBUG] Pattern '{pattern_name}': màn hình là '{screen.label}' (hash cách {screen.distance}, cách nhãn khác {screen.margin}) -> ❌ FAIL"
+                    )
+                return False, 0.0
+
+        # Chế độ chịu lệch: tìm offset tốt nhất trong cửa sổ ±pattern_search_radius px
+        if self.pattern_search_radius > 0 and NUMPY_AVAILABLE:
+            frame = self.cached_frame if self.cached_frame is not None else np.asarray(img)
+            ratios, offsets = self.search_pattern_frames(
+                pattern_name, frame[None], tolerance=tolerance
+            )
+            match_ratio = float(ratios[0])
+            is_match = match_ratio >= self.pattern_match_ratio
+            if self.debug:
+                dx, dy = self.last_pattern_offset
+                print(
+                    f"[DEBUG] Pattern '{pattern_name}': {match_ratio*100:.1f}% khớp tại offset ({dx:+d}, {dy:+d}) -> {'✅ PASS' if is_match else '❌ FAIL'}"
                 )
-                for p in pattern
-            ]
+            self.record_event(
+                "pattern", name=pattern_name, match=bool(is_match), ratio=round(match_ratio, 3)
+            )
+            if is_match:
+                self.learn_screen(pattern_name)
+            return is_match, match_ratio
 
-        cached_pattern = self._pattern_rgb_cache[cache_key]
+        # ⚡ OPTIMIZATION 1: Tọa độ và RGB của pattern đã compile sẵn trong ExecutionPlan
+        cached_pattern = self.get_plan(*img.size).patterns[pattern_name].pixels
+        total_pixels = len(cached_pattern)
 
         # ⚡ OPTIMIZATION 2: Dùng numpy nếu có (nhanh hơn 3-5x)
         if NUMPY_AVAILABLE:
-            # Convert image sang numpy array một lần
-            img_array = np.array(img)
+            # Convert image sang numpy array một lần (dùng luôn frame raw nếu có)
+            img_array = self.cached_frame
+            if img_array is None:
+                img_array = np.array(img)
             matched_pixels = 0
 
             # Early stopping threshold
@@ -481,106 +1835,563 @@ class GameMonitor:
             for coord, exp_r, exp_g, exp_b, exp_color in cached_pattern:
                 x, y = coord
 
-                # ⚡ OPTIMIZATION 3: Early stopping
-                if failed_pixels > max_allowed_failures:
-                    if self.debug:
-                        print(
-                            f"[DEBUG] ⚡ Early stop: Quá nhiều pixel fail ({failed_pixels}/{max_allowed_failures})"
-                        )
-                    break
+                # ⚡ OPTIMIZATION 3: Early stopping
+                if failed_pixels > max_allowed_failures:
+                    if self.debug:
+                        print(
+                            f"[DEBUG] ⚡ Early stop: Quá nhiều pixel fail ({failed_pixels}/{max_allowed_failures})"
+                        )
+                    break
+
+                try:
+                    # Lấy màu từ numpy array (nhanh hơn getpixel)
+                    actual_r, actual_g, actual_b = img_array[y, x, :3]
+
+                    # Tính độ sai khác
+                    diff = (
+                        abs(int(actual_r) - exp_r)
+                        + abs(int(actual_g) - exp_g)
+                        + abs(int(actual_b) - exp_b)
+                    )
+
+                    if diff <= tolerance * 3:
+                        matched_pixels += 1
+                        if self.debug:
+                            actual_color = (
+                                f"#{actual_r:02x}{actual_g:02x}{actual_b:02x}".upper()
+                            )
+                            print(
+                                f"[DEBUG] ✅ Pixel ({x},{y}): {actual_color} ≈ {exp_color} (diff={diff})"
+                            )
+                    else:
+                        failed_pixels += 1
+                        if self.debug:
+                            actual_color = (
+                                f"#{actual_r:02x}{actual_g:02x}{actual_b:02x}".upper()
+                            )
+                            print(
+                                f"[DEBUG] ❌ Pixel ({x},{y}): {actual_color} ≠ {exp_color} (diff={diff})"
+                            )
+                except Exception as e:
+                    failed_pixels += 1
+                    if self.debug:
+                        print(f"[DEBUG] ⚠️  Lỗi khi check pixel ({x},{y}): {e}")
+        else:
+            # Fallback: Dùng PIL getpixel (chậm hơn)
+            matched_pixels = 0
+            min_required_matches = int(total_pixels * self.pattern_match_ratio)
+            max_allowed_failures = total_pixels - min_required_matches
+            failed_pixels = 0
+
+            for coord, exp_r, exp_g, exp_b, exp_color in cached_pattern:
+                x, y = coord
+
+                if failed_pixels > max_allowed_failures:
+                    break
+
+                try:
+                    actual_pixel = img.getpixel((x, y))
+                    actual_color = "#{:02x}{:02x}{:02x}".format(
+                        actual_pixel[0], actual_pixel[1], actual_pixel[2]
+                    ).upper()
+
+                    diff = (
+                        abs(actual_pixel[0] - exp_r)
+                        + abs(actual_pixel[1] - exp_g)
+                        + abs(actual_pixel[2] - exp_b)
+                    )
+
+                    if diff <= tolerance * 3:
+                        matched_pixels += 1
+                        if self.debug:
+                            print(
+                                f"[DEBUG] ✅ Pixel ({x},{y}): {actual_color} ≈ {exp_color} (diff={diff})"
+                            )
+                    else:
+                        failed_pixels += 1
+                        if self.debug:
+                            print(
+                                f"[DEBUG] ❌ Pixel ({x},{y}): {actual_color} ≠ {exp_color} (diff={diff})"
+                            )
+                except Exception as e:
+                    failed_pixels += 1
+                    if self.debug:
+                        print(f"[DEBUG] ⚠️  Lỗi khi check pixel ({x},{y}): {e}")
+
+        # Dùng match_ratio từ config
+        match_ratio = matched_pixels / total_pixels
+        is_match = match_ratio >= self.pattern_match_ratio
+
+        if self.debug:
+            print(
+                f"[DEBUG] Pattern '{pattern_name}': {matched_pixels}/{total_pixels} pixels khớp ({match_ratio*100:.1f}%) -> {'✅ PASS' if is_match else '❌ FAIL'}"
+            )
+
+        self.record_event(
+            "pattern", name=pattern_name, match=bool(is_match), ratio=round(match_ratio, 3)
+        )
+        if is_match:
+            self.learn_screen(pattern_name)
+        return is_match, match_ratio
+
+    def identify_screen(self):
+        """Nhận diện screenshot hiện tại bằng screen index (hash mỗi frame 1 lần)
+
+        Returns:
+            ScreenMatch(label, distance) - label None nếu không nhận ra / không có index
+        """
+        if self.screen_index is None or not len(self.screen_index):
+            return ScreenMatch(None, None)
+        if not self.cached_screenshot:
+            self.capture_screenshot()
+        img = self.cached_screenshot
+        if img is None:
+            return ScreenMatch(None, None)
+
+        if self._screen_frame is not img:
+            self.last_screen = self.screen_index.identify(self.get_frame_array(img))
+            self._screen_frame = img
+        return self.last_screen
+
+    def learn_screen(self, label):
+        """Thêm hash của screenshot hiện tại vào index với nhãn đã xác nhận bằng pixel check"""
+        if self.screen_index is None or self.cached_screenshot is None:
+            return
+        frame = self.get_frame_array(self.cached_screenshot)
+        if self.screen_index.add(self.screen_index.hash_frame(frame), label) and self.debug:
+            print(f"[DEBUG] Screen index: +1 hash '{label}' ({len(self.screen_index)} hash)")
+
+    def save_screen_index(self):
+        """Lưu screen index nếu có hash mới"""
+        if self.screen_index is None or not self.screen_index.dirty:
+            return
+        try:
+            self.screen_index.save(self.screen_index_file)
+        except Exception as e:
+            print(f"⚠️  Lỗi khi lưu screen index: {e}")
+
+    def start_tap_shell(self):
+        """Mở 1 session `adb shell` dùng chung để gửi tap không chặn
+
+        Mỗi tap chỉ là 1 lần ghi vào stdin thay vì tạo process `adb` mới, và lệnh
+        `input tap` chạy nền trên thiết bị nên không chặn tap tiếp theo. Mỗi tap in
+        `T` khi xử lý xong, được đếm trên thread riêng vào bộ đếm của chính session đó.
+
+        Returns:
+            True nếu mở được session
+        """
+        if self._tap_shell and self._tap_shell.poll() is None:
+            return True
+        self._discard_tap_shell()
+        try:
+            shell = subprocess.Popen(
+                self.adb_cmd("shell"),
+                shell=True,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except Exception as e:
+            print(f"⚠️  Không mở được adb shell cho tap: {e}")
+            self._tap_shell = None
+            return False
+
+        # Bộ đếm riêng cho session mới: dòng "T" còn sót mà thread đọc của session cũ
+        # đếm muộn không làm lệch số tap đang chờ. Tap còn dở của session cũ không bao
+        # giờ được ack => không tính là đang chờ
+        acks = {"value": 0}
+
+        def read_acks():
+            for line in shell.stdout:
+                if line.strip() == b"T":
+                    acks["value"] += 1
+
+        self._taps_acked_closed += self._tap_acks["value"]
+        self._tap_acks = acks
+        self.taps_sent = 0
+        self._tap_shell = shell
+        threading.Thread(target=read_acks, daemon=True).start()
+        return True
+
+    @property
+    def taps_acked(self):
+        """Tổng số tap thiết bị đã xử lý xong qua mọi session tap shell"""
+        return self._taps_acked_closed + self._tap_acks["value"]
+
+    @property
+    def taps_in_flight(self):
+        """Số tap đã gửi qua session hiện tại mà thiết bị chưa xử lý xong"""
+        return self.taps_sent - self._tap_acks["value"]
+
+    @timed("tap_async")
+    def tap_async(self, x, y):
+        """Gửi tap qua session shell dùng chung (không chờ thiết bị xử lý xong)
+
+        Returns:
+            False nếu bỏ tap vì đã có TAP_MAX_IN_FLIGHT tap chưa xử lý xong, ngược lại True
+        """
+        if not self.start_tap_shell():
+            self.click_at_coordinates(x, y)
+            return True
+        if self.taps_in_flight >= TAP_MAX_IN_FLIGHT:
+            return False
+        try:
+            self._tap_shell.stdin.write(f"(input tap {x} {y}; echo T) &\n".encode())
+            self._tap_shell.stdin.flush()
+            self.taps_sent += 1
+            self.record_event("tap", x=x, y=y, mode="async")
+        except (BrokenPipeError, OSError):
+            # Session bị đóng (vd: mất kết nối) => dọn process, mở lại ở lần tap sau
+            self._discard_tap_shell()
+            self.click_at_coordinates(x, y)
+        return True
+
+    def stop_tap_shell(self):
+        """Đóng session shell dùng cho tap"""
+        if self._tap_shell:
+            try:
+                self._tap_shell.stdin.write(b"exit\n")
+                self._tap_shell.stdin.close()
+                self._tap_shell.wait(timeout=2)
+            except Exception:
+                pass
+            self._discard_tap_shell()
+
+    def _discard_tap_shell(self):
+        """Kill session tap shell (nếu còn chạy) và chờ process kết thúc để không bị leak"""
+        shell, self._tap_shell = self._tap_shell, None
+        if shell is None:
+            return
+        if shell.poll() is None:
+            shell.kill()
+        try:
+            shell.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            print("⚠️  adb shell cho tap không thoát sau khi kill")
+
+    def measure_tap_acceptance(self, x, y, interval, duration=3.0, drain_timeout=2.0):
+        """Gửi tap với interval cố định trong `duration` giây và đo số tap thiết bị xử lý xong
+
+        Mỗi tap được gửi kèm `echo T` sau khi `input tap` kết thúc, nên số dòng T đọc về
+        chính là số tap thiết bị đã nhận. Tap hoàn thành sau khi hết thời gian gửi
+        nghĩa là thiết bị đang xếp hàng (lag).
+
+        Returns:
+            Dict kết quả đo, None nếu không mở được adb shell
+        """
+        try:
+            shell = subprocess.Popen(
+                self.adb_cmd("shell"),
+                shell=True,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except Exception as e:
+            print(f"⚠️  Không mở được adb shell: {e}")
+            return None
+
+        acks = []
+
+        def read_acks():
+            for line in shell.stdout:
+                if line.strip() == b"T":
+                    acks.append(time.monotonic())
+
+        reader = threading.Thread(target=read_acks, daemon=True)
+        reader.start()
+
+        def dispatch():
+            shell.stdin.write(f"(input tap {x} {y}; echo T) &\n".encode())
+            shell.stdin.flush()
+
+        scheduler = TapScheduler(dispatch, interval)
+        send_end = time.monotonic() + duration
+        try:
+            scheduler.run(lambda: time.monotonic() >= send_end or self.stop_requested)
+        except (BrokenPipeError, OSError) as e:
+            print(f"⚠️  Mất kết nối adb shell khi calibrate: {e}")
+        window_end = time.monotonic()
+
+        # Chờ các tap còn trong hàng đợi của thiết bị xử lý xong
+        drain_deadline = window_end + drain_timeout
+        while len(acks) < scheduler.tap_count and time.monotonic() < drain_deadline:
+            time.sleep(0.05)
+
+        try:
+            shell.stdin.write(b"exit\n")
+            shell.stdin.close()
+            shell.wait(timeout=2)
+        except Exception:
+            shell.kill()
+
+        dispatched = scheduler.tap_count
+        delivered = len(acks)
+        in_window = sum(1 for t in acks if t <= window_end)
+        lag = max(0.0, acks[-1] - window_end) if acks else drain_timeout
+        return {
+            "interval": interval,
+            "dispatched": dispatched,
+            "delivered": delivered,
+            "acceptance": delivered / dispatched if dispatched else 0.0,
+            "delivered_rate": in_window / (window_end - scheduler.start_time),
+            "lag": lag,
+        }
+
+    def calibrate_click_speed(
+        self, x, y, intervals=None, duration=3.0, min_acceptance=0.95, max_lag=0.5
+    ):
+        """Quét các interval từ chậm đến nhanh để tìm click_speed nhanh nhất thiết bị theo kịp
+
+        Interval đạt yêu cầu khi >= min_acceptance số tap được xử lý và thiết bị
+        không bị dồn hàng quá max_lag giây sau khi ngừng gửi.
+
+        Args:
+            x, y: Tọa độ tap khi đo (nên là vị trí không gây tác dụng phụ)
+            intervals: Danh sách interval (giây), None = CALIBRATION_INTERVALS
+            duration: Thời gian gửi tap cho mỗi interval (giây)
+
+        Returns:
+            Tuple (best_interval, results). best_interval = None nếu không interval nào đạt.
+        """
+        intervals = sorted(intervals or CALIBRATION_INTERVALS, reverse=True)
+        results = []
+        best_interval = None
+
+        for interval in intervals:
+            if self.stop_requested:
+                break
+
+            result = self.measure_tap_acceptance(x, y, interval, duration)
+            if result is None:
+                break
+            results.append(result)
+
+            passed = result["acceptance"] >= min_acceptance and result["lag"] <= max_lag
+            print(
+                f"{'✅' if passed else '❌'} {interval*1000:.0f}ms: {result['delivered']}/{result['dispatched']} tap "
+                f"({result['acceptance']*100:.0f}%), {result['delivered_rate']:.1f} tap/s, lag {result['lag']:.2f}s"
+            )
+
+            if passed:
+                best_interval = interval
+            elif best_interval is not None:
+                break  # Đã quá giới hạn của thiết bị, không cần quét nhanh hơn
+
+            time.sleep(1.0)  # Cho thiết bị xử lý hết trước lần đo tiếp theo
+
+        return best_interval, results
+
+    def save_tap_calibration(self, click_speed, results=None):
+        """Lưu click_speed tốt nhất cho serial thiết bị hiện tại"""
+        serial = self.get_device_serial()
+        if not serial:
+            print("⚠️  Không lấy được serial thiết bị, không lưu calibration")
+            return False
+
+        calibrations = {}
+        if os.path.exists(TAP_CALIBRATION_FILE):
+            try:
+                with open(TAP_CALIBRATION_FILE, "r") as f:
+                    calibrations = json.load(f)
+            except Exception as e:
+                print(f"⚠️  Lỗi khi đọc calibration cũ: {e}")
+
+        calibrations[serial] = {
+            "click_speed": click_speed,
+            "calibrated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "results": results or [],
+        }
+        try:
+            with open(TAP_CALIBRATION_FILE, "w") as f:
+                json.dump(calibrations, f, indent=2)
+            return True
+        except Exception as e:
+            print(f"⚠️  Lỗi khi lưu calibration: {e}")
+            return False
+
+    def load_tap_calibration(self):
+        """Load click_speed đã calibrate cho thiết bị hiện tại (nếu có)
+
+        Returns:
+            True nếu đã áp dụng click_speed từ calibration
+        """
+        if self._tap_calibration_loaded or not self.auto_click_speed:
+            return False
+        self._tap_calibration_loaded = True
+
+        if not os.path.exists(TAP_CALIBRATION_FILE):
+            return False
+
+        serial = self.get_device_serial()
+        try:
+            with open(TAP_CALIBRATION_FILE, "r") as f:
+                calibration = json.load(f).get(serial)
+        except Exception as e:
+            print(f"⚠️  Lỗi khi load calibration: {e}")
+            return False
+
+        if not calibration or not calibration.get("click_speed"):
+            return False
+
+        self.click_speed = calibration["click_speed"]
+        print(
+            f"⚡ Dùng click speed đã calibrate cho {serial}: {self.click_speed*1000:.0f}ms ({calibration.get('calibrated_at', '?')})"
+        )
+        return True
+
+    def get_pattern_arrays(self, pattern_name, size=None):
+        """Trả về (xs, ys, rgb) dạng numpy của pattern, đã compile sẵn trong ExecutionPlan
+
+        Args:
+            size: (width, height) của frame, None = kích thước màn hình hiện tại
+        """
+        plan = self.get_plan(*size) if size else self.get_plan()
+        compiled = plan.patterns[pattern_name]
+        return compiled.xs, compiled.ys, compiled.rgb_array
+
+    def match_pattern_frames(self, pattern_name, frames, tolerance=None):
+        """Tính match ratio của pattern trên nhiều frame trong 1 lần tính vector hóa
+
+        Args:
+            pattern_name: Tên pattern cần check
+            frames: Array numpy (K, H, W, C) với C >= 3
+            tolerance: Độ sai lệch màu cho phép, None = dùng self.pattern_tolerance
+
+        Returns:
+            Array (K,) match ratio của từng frame
+        """
+        if tolerance is None:
+            tolerance = self.pattern_tolerance
+
+        if self.pattern_search_radius > 0:
+            return self.search_pattern_frames(pattern_name, frames, tolerance=tolerance)[0]
+
+        height, width = frames.shape[1:3]
+        xs, ys, rgb = self.get_pattern_arrays(pattern_name, (width, height))
 
-                try:
-                    # Lấy màu từ numpy array (nhanh hơn getpixel)
-                    actual_r, actual_g, actual_b = img_array[y, x, :3]
+        # Pixel nằm ngoài ảnh được tính là không khớp (giống check_pixel_pattern)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        actual = frames[:, ys[inside], xs[inside], :3].astype(np.int16)  # (K, P, 3)
+        diff = np.abs(actual - rgb[inside]).sum(axis=2)  # (K, P)
+        matched = np.count_nonzero(diff <= tolerance * 3, axis=1)
+        return matched / len(xs)
 
-                    # Tính độ sai khác
-                    diff = (
-                        abs(int(actual_r) - exp_r)
-                        + abs(int(actual_g) - exp_g)
-                        + abs(int(actual_b) - exp_b)
-                    )
+    def search_pattern_frames(self, pattern_name, frames, radius=None, tolerance=None):
+        """Tìm offset (dx, dy) trong cửa sổ ±radius px cho match ratio cao nhất
 
-                    if diff <= tolerance * 3:
-                        matched_pixels += 1
-                        if self.debug:
-                            actual_color = (
-                                f"#{actual_r:02x}{actual_g:02x}{actual_b:02x}".upper()
-                            )
-                            print(
-                                f"[DEBUG] ✅ Pixel ({x},{y}): {actual_color} ≈ {exp_color} (diff={diff})"
-                            )
-                    else:
-                        failed_pixels += 1
-                        if self.debug:
-                            actual_color = (
-                                f"#{actual_r:02x}{actual_g:02x}{actual_b:02x}".upper()
-                            )
-                            print(
-                                f"[DEBUG] ❌ Pixel ({x},{y}): {actual_color} ≠ {exp_color} (diff={diff})"
-                            )
-                except Exception as e:
-                    failed_pixels += 1
-                    if self.debug:
-                        print(f"[DEBUG] ⚠️  Lỗi khi check pixel ({x},{y}): {e}")
-        else:
-            # Fallback: Dùng PIL getpixel (chậm hơn)
-            matched_pixels = 0
-            min_required_matches = int(total_pixels * self.pattern_match_ratio)
-            max_allowed_failures = total_pixels - min_required_matches
-            failed_pixels = 0
+        sliding_window_view tạo view (không copy) các cửa sổ (2r+1)x(2r+1) của frame,
+        chỉ lấy ra cửa sổ quanh từng pixel pattern => (K, P, 3, 2r+1, 2r+1) rồi so màu
+        ở mọi offset trong 1 lần tính. Chi phí không phụ thuộc khoảng cách giữa các pixel.
 
-            for coord, exp_r, exp_g, exp_b, exp_color in cached_pattern:
-                x, y = coord
+        Args:
+            pattern_name: Tên pattern cần check
+            frames: Array numpy (K, H, W, C) với C >= 3
+            radius: Độ lệch tối đa (px), None = dùng self.pattern_search_radius
+            tolerance: Độ sai lệch màu cho phép, None = dùng self.pattern_tolerance
 
-                if failed_pixels > max_allowed_failures:
-                    break
+        Returns:
+            (ratios, offsets) - ratios: (K,) match ratio tốt nhất, offsets: (K, 2) (dx, dy)
+        """
+        if radius is None:
+            radius = self.pattern_search_radius
+        if tolerance is None:
+            tolerance = self.pattern_tolerance
 
-                try:
-                    actual_pixel = img.getpixel((x, y))
-                    actual_color = "#{:02x}{:02x}{:02x}".format(
-                        actual_pixel[0], actual_pixel[1], actual_pixel[2]
-                    ).upper()
+        height, width = frames.shape[1:3]
+        xs, ys, rgb = self.get_pattern_arrays(pattern_name, (width, height))
+        # Bán kính khai báo theo density gốc của workflow => đổi sang px của thiết bị
+        radius = self.get_plan(width, height).scale_length(radius)
+        rgb_frames = frames[..., :3]
+
+        # Pixel sát mép ảnh: pad frame bằng giá trị không bao giờ khớp (hiếm gặp)
+        margin = max(
+            0,
+            radius - int(xs.min()),
+            radius - int(ys.min()),
+            int(xs.max()) + radius + 1 - width,
+            int(ys.max()) + radius + 1 - height,
+        )
+        if margin:
+            rgb_frames = np.pad(
+                rgb_frames.astype(np.int16),
+                ((0, 0), (margin, margin), (margin, margin), (0, 0)),
+                constant_values=PATTERN_PAD_VALUE,
+            )
 
-                    diff = (
-                        abs(actual_pixel[0] - exp_r)
-                        + abs(actual_pixel[1] - exp_g)
-                        + abs(actual_pixel[2] - exp_b)
-                    )
+        side = 2 * radius + 1
+        # windows[k, y, x, c, wy, wx] = pixel (x + wx, y + wy) của frame k
+        windows = np.lib.stride_tricks.sliding_window_view(
+            rgb_frames, (side, side), axis=(1, 2)
+        )
+        top_left_y = ys - radius + margin
+        top_left_x = xs - radius + margin
+        actual = windows[:, top_left_y, top_left_x].astype(np.int16)  # (K, P, 3, s, s)
+        diff = np.abs(actual - rgb[None, :, :, None, None]).sum(axis=2)  # (K, P, s, s)
+        ratios = np.count_nonzero(diff <= tolerance * 3, axis=1) / len(xs)  # (K, s, s)
+
+        # Cùng ratio thì ưu tiên offset gần (0, 0) nhất
+        offset = np.arange(side) - radius
+        distance = np.abs(offset)[:, None] + np.abs(offset)[None, :]
+        score = ratios.reshape(len(frames), -1) - distance.ravel() * 1e-6
+        best = np.argmax(score, axis=1)
+        best_ratios = ratios.reshape(len(frames), -1)[np.arange(len(frames)), best]
+        offsets = np.stack([offset[best % side], offset[best // side]], axis=1)
+
+        self.last_pattern_offset = (int(offsets[-1, 0]), int(offsets[-1, 1]))
+        return best_ratios, offsets
+
+    @timed("pattern_burst_verify")
+    def burst_verify_pattern(self, pattern_name, count=None, first_frame=None):
+        """Verify pattern bằng burst capture: K frame liên tiếp, check 1 lần cho tất cả
 
-                    if diff <= tolerance * 3:
-                        matched_pixels += 1
-                        if self.debug:
-                            print(
-                                f"[DEBUG] ✅ Pixel ({x},{y}): {actual_color} ≈ {exp_color} (diff={diff})"
-                            )
-                    else:
-                        failed_pixels += 1
-                        if self.debug:
-                            print(
-                                f"[DEBUG] ❌ Pixel ({x},{y}): {actual_color} ≠ {exp_color} (diff={diff})"
-                            )
-                except Exception as e:
-                    failed_pixels += 1
-                    if self.debug:
-                        print(f"[DEBUG] ⚠️  Lỗi khi check pixel ({x},{y}): {e}")
+        Args:
+            pattern_name: Tên pattern cần check
+            count: Số frame cần chụp, None = dùng self.burst_frames
+            first_frame: Frame (H, W, C) vừa chụp, dùng làm frame đầu => chỉ chụp thêm K-1
 
-        # Dùng match_ratio từ config
-        match_ratio = matched_pixels / total_pixels
-        is_match = match_ratio >= self.pattern_match_ratio
+        Returns:
+            Tuple (is_stable, stability, ratios). stability là tỷ lệ frame khớp pattern.
+            (None, None, None) nếu burst capture không khả dụng.
+        """
+        if not self.pixel_patterns or pattern_name not in self.pixel_patterns:
+            print(f"⚠️  CẢNH BÁO: Không tìm thấy pattern '{pattern_name}' trong config!")
+            return False, 0.0, None
+
+        count = count or self.burst_frames
+        if first_frame is not None and count > 1:
+            frames = self.capture_burst(count - 1)
+            if frames is not None and frames.shape[1:] == first_frame.shape:
+                frames = np.concatenate([first_frame[None], frames])
+            elif frames is not None:
+                frames = self.capture_burst(count)  # Khác format => chụp lại đủ K frame
+        else:
+            frames = self.capture_burst(count)
+        if frames is None:
+            return None, None, None
+
+        ratios = self.match_pattern_frames(pattern_name, frames)
+        stability = float(np.mean(ratios >= self.pattern_match_ratio))
+        is_stable = stability >= self.burst_stability
+        self.last_stability = stability
 
         if self.debug:
+            ratios_str = ", ".join(f"{r*100:.0f}%" for r in ratios)
             print(
-                f"[DEBUG] Pattern '{pattern_name}': {matched_pixels}/{total_pixels} pixels khớp ({match_ratio*100:.1f}%) -> {'✅ PASS' if is_match else '❌ FAIL'}"
+                f"[DEBUG] {'🟢' if is_stable else '🔴'} Burst {count} frame '{pattern_name}': [{ratios_str}] -> stability {stability*100:.0f}%"
             )
 
-        return is_match, match_ratio
+        return is_stable, stability, ratios
 
+    @timed("tap")
     def click_at_coordinates(self, x, y):
         """Click vào tọa độ trên màn hình"""
-        cmd = f"adb shell input tap {x} {y}"
+        cmd = self.adb_cmd(f"shell input tap {x} {y}")
         self.run_adb_command(cmd)
+        self.record_event("tap", x=x, y=y, mode="sync")
         print(f"👆 Đã click vào tọa độ ({x}, {y})")
 
+    @timed("pattern_verify")
     def smart_verify_pattern(self, pattern_name, max_delay=0.3):
         """Smart Adaptive Verification - Tự động quyết định số lần verify dựa trên match ratio
 
@@ -588,6 +2399,8 @@ class GameMonitor:
         - Match ratio >= 95%: Chỉ cần 1 lần check (rất chắc chắn)
         - Match ratio 80-95%: Verify 2 lần với delay 0.1s (khá chắc chắn)
         - Match ratio < 80%: Verify 3 lần với delay 0.15s (không chắc chắn)
+        - Nếu bật burst_frames và frame đầu < 95%: chụp thêm K-1 frame trong 1 lần gọi ADB
+          thay cho verify tuần tự
 
         Args:
             pattern_name: Tên pattern cần check
@@ -596,13 +2409,22 @@ class GameMonitor:
         Returns:
             True nếu pattern ổn định, False nếu không
         """
-        # Chụp screenshot lần đầu
-        self.cached_screenshot = None
-        self.run_adb_command("adb shell screencap -p /sdcard/screenshot.png")
-        self.run_adb_command(
-            "adb pull /sdcard/screenshot.png /tmp/screenshot.png 2>/dev/null"
-        )
-        self.cached_screenshot = Image.open("/tmp/screenshot.png")
+        img = self.capture_screenshot()
+
+        # Classifier là softmax tập đóng: đủ tin cậy thì chỉ được phép loại bỏ. Dự đoán
+        # "có pattern" vẫn phải khớp pixel, nhưng 1 lần check trên frame vừa chụp là đủ
+        # (bỏ qua burst/verify tuần tự)
+        if self.classifier is not None and pattern_name in self.classifier.labels:
+            decision = self.classify_pattern(pattern_name)
+            if decision is False:
+                return False
+            if decision:
+                is_match, match_ratio = self.check_pixel_pattern(pattern_name)
+                if self.debug:
+                    print(
+                        f"[DEBUG] {'🟢' if is_match else '🔴'} Classifier + pixel: {match_ratio*100:.1f}%"
+                    )
+                return is_match
 
         # Check lần đầu và lấy match_ratio
         is_match, match_ratio = self.check_pixel_pattern(pattern_name)
@@ -612,7 +2434,6 @@ class GameMonitor:
                 print(f"[DEBUG] 🔴 Lần 1: Không khớp ({match_ratio*100:.1f}%)")
             return False
 
-        # Quyết định số lần verify dựa trên match_ratio
         if match_ratio >= 0.95:
             # Rất chắc chắn - chỉ cần 1 lần
             if self.debug:
@@ -621,7 +2442,18 @@ class GameMonitor:
                 )
             return True
 
-        elif match_ratio >= 0.80:
+        # Burst mode: frame đầu chưa chắc chắn => chụp thêm K-1 frame trong 1 lần gọi ADB
+        if self.burst_frames > 1 and NUMPY_AVAILABLE and img is not None:
+            is_stable = self.burst_verify_pattern(
+                pattern_name, first_frame=self.get_frame_array(img)
+            )[0]
+            if is_stable is not None:
+                return is_stable
+            if self.debug:
+                print("[DEBUG] Burst capture không khả dụng, verify tuần tự")
+
+        # Quyết định số lần verify dựa trên match_ratio
+        if match_ratio >= 0.80:
             # Khá chắc chắn - verify 2 lần
             num_checks = 2
             delay = 0.1
@@ -643,12 +2475,7 @@ class GameMonitor:
             time.sleep(delay)
 
             # Chụp screenshot mới
-            self.cached_screenshot = None
-            self.run_adb_command("adb shell screencap -p /sdcard/screenshot.png")
-            self.run_adb_command(
-                "adb pull /sdcard/screenshot.png /tmp/screenshot.png 2>/dev/null"
-            )
-            self.cached_screenshot = Image.open("/tmp/screenshot.png")
+            self.capture_screenshot()
 
             # Check
             is_match, match_ratio = self.check_pixel_pattern(pattern_name)
@@ -662,21 +2489,190 @@ class GameMonitor:
 
         return True
 
+    def predict_screen(self):
+        """Dự đoán trạng thái màn hình của screenshot hiện tại bằng classifier (mỗi frame 1 lần)
+
+        Returns:
+            (label, confidence) hoặc None nếu không có classifier / không chụp được
+        """
+        if self.classifier is None:
+            return None
+        if not self.cached_screenshot:
+            self.capture_screenshot()
+        img = self.cached_screenshot
+        if img is None:
+            return None
+
+        if self._prediction_frame is not img:
+            self.last_prediction = self.classifier.predict(self.get_frame_array(img))
+            self._prediction_frame = img
+        return self.last_prediction
+
+    def classify_pattern(self, pattern_name):
+        """Quyết định pattern có đang hiển thị không chỉ bằng classifier
+
+        Dự đoán trên screenshot hiện tại (người gọi chụp frame mới trước); chỉ quyết định
+        khi nhãn của pattern có trong model và độ tin cậy >= classifier_confidence.
+
+        Returns:
+            True/False nếu classifier đủ tin cậy, None = cần verify bằng pixel pattern
+        """
+        if self.classifier is None or pattern_name not in self.classifier.labels:
+            return None
+
+        prediction = self.predict_screen()
+        if prediction is None or prediction[1] < self.classifier_confidence:
+            self.classifier_stats["fallback"] += 1
+            return None
+
+        label, confidence = prediction
+        self.classifier_stats["decided"] += 1
+        if self.debug:
+            print(
+                f"[DEBUG] 🧠 Classifier: '{label}' ({confidence*100:.1f}%) -> '{pattern_name}' {'✅' if label == pattern_name else '❌'}"
+            )
+        return label == pattern_name
+
     def stop(self):
         """Yêu cầu dừng monitor"""
         self.stop_requested = True
 
+    def step_waits(self, step):
+        """Thời gian chờ trước/sau khi click của 1 bước (mặc định theo click_delay)"""
+        wait_before = step.get("wait_before")
+        wait_after = step.get("wait_after")
+        return (
+            self.click_delay if wait_before is None else wait_before,
+            self.click_delay * 2 if wait_after is None else wait_after,
+        )
+
+    def load_transitions(self):
+        """Các mẫu thời gian chuyển màn hình của thiết bị hiện tại {bước: [giây, ...]}"""
+        if self._transitions is None:
+            self._transitions = {}
+            if os.path.exists(TRANSITION_LOG_FILE):
+                try:
+                    with open(TRANSITION_LOG_FILE, "r") as f:
+                        self._transitions = json.load(f).get(self.get_device_serial(), {})
+                except Exception as e:
+                    print(f"⚠️  Lỗi khi đọc transition log: {e}")
+        return self._transitions
+
+    def save_transitions(self):
+        """Ghi các mẫu của thiết bị hiện tại vào file (giữ nguyên thiết bị khác)"""
+        if self._transitions is None:
+            return
+        serial = self.get_device_serial()
+        if not serial:
+            return
+        log = {}
+        if os.path.exists(TRANSITION_LOG_FILE):
+            try:
+                with open(TRANSITION_LOG_FILE, "r") as f:
+                    log = json.load(f)
+            except Exception as e:
+                print(f"⚠️  Lỗi khi đọc transition log: {e}")
+        log[serial] = self._transitions
+        try:
+            with open(TRANSITION_LOG_FILE, "w") as f:
+                json.dump(log, f, indent=2)
+        except Exception as e:
+            print(f"⚠️  Lỗi khi lưu transition log: {e}")
+
+    def learned_delay(self, step_name):
+        """Delay (giây) tại transition_percentile của các mẫu đã đo, None nếu chưa đủ mẫu"""
+        samples = self.load_transitions().get(step_name, [])
+        if self.transition_percentile is None or len(samples) < TRANSITION_MIN_SAMPLES:
+            return None
+        return float(np.percentile(samples, self.transition_percentile)) + TRANSITION_MARGIN
+
+    def transition_signature(self, img):
+        """Chữ ký thưa của toàn màn hình để phát hiện chuyển cảnh"""
+        frame = self.get_frame_array(img)
+        height, width = frame.shape[:2]
+        return region_signature(frame, (0, 0, width, height), TRANSITION_SIGNATURE_STRIDE)
+
+    def observe_transition(self, before, tap_time, max_wait):
+        """Chụp liên tục sau tap đến khi màn hình đổi rồi đứng yên lại
+
+        Màn hình ổn định = chữ ký không đổi trong TRANSITION_STABLE_TIME giây (frame trung
+        gian tĩnh như overlay loading không bị tính là màn hình mới).
+
+        Returns:
+            Thời gian (giây) từ lúc tap đến lúc màn hình mới bắt đầu ổn định,
+            None nếu không thấy màn hình đổi
+        """
+        stable, stable_since = before, tap_time
+        changed = False
+        while time.time() - tap_time < max_wait and not self.stop_requested:
+            captured_at = time.time()
+            img = self.capture_screenshot()
+            if img is None:
+                return None
+            signature = self.transition_signature(img)
+            if signature_distance(signature, stable) > TRANSITION_CHANGE_THRESHOLD:
+                stable, stable_since = signature, captured_at
+                changed = changed or signature_distance(signature, before) > TRANSITION_CHANGE_THRESHOLD
+            elif changed and captured_at - stable_since >= TRANSITION_STABLE_TIME:
+                return stable_since - tap_time
+        return None
+
+    def tap_and_wait(self, step_name, x, y, default_wait):
+        """Tap rồi chờ màn hình chuyển: delay học được (percentile) hoặc đo lại
+
+        Chưa đủ mẫu (hoặc tới lượt đo lại định kỳ) thì chụp liên tục sau tap để đo thời
+        gian chuyển màn hình thật, lưu mẫu và trả về ngay khi màn hình ổn định.
+        """
+        if self.transition_percentile is None:
+            self.click_at_coordinates(x, y)
+            time.sleep(default_wait)
+            return
+
+        runs = self._transition_runs[step_name] = self._transition_runs.get(step_name, 0) + 1
+        delay = self.learned_delay(step_name)
+        observe = (
+            delay is None
+            or step_name in self._transition_observe_next
+            or runs % TRANSITION_RESAMPLE_EVERY == 0
+        )
+        if not observe:
+            if self.debug:
+                print(
+                    f"[DEBUG] {step_name}: chờ {delay:.2f}s (p{self.transition_percentile:g} học được, mặc định {default_wait:.2f}s)"
+                )
+            self.click_at_coordinates(x, y)
+            time.sleep(delay)
+            return
+
+        before_img = self.capture_screenshot()
+        before = self.transition_signature(before_img) if before_img is not None else None
+        tap_time = time.time()
+        self.click_at_coordinates(x, y)
+        observed = None
+        if before is not None:
+            observed = self.observe_transition(before, tap_time, max(default_wait * 5, 2.0))
+
+        if observed is None:
+            # Không thấy màn hình đổi: chờ như mặc định, không ghi mẫu
+            time.sleep(max(0.0, default_wait - (time.time() - tap_time)))
+            return
+
+        samples = self.load_transitions().setdefault(step_name, [])
+        samples.append(round(observed, 3))
+        del samples[:-TRANSITION_MAX_SAMPLES]
+        self._transition_observe_next.discard(step_name)
+        if self.debug:
+            print(f"[DEBUG] {step_name}: màn hình ổn định sau {observed:.2f}s ({len(samples)} mẫu)")
+
     def click_back_and_restart(self):
-        """Click 3 lần vào tọa độ (537, 1910) để quay lại và chuẩn bị chạy lại"""
-        print(f"\n🔄 Click 3 lần vào (537, 1910) để reset...")
-        time.sleep(0.3)
-        self.click_at_coordinates(537, 1910)
-        time.sleep(0.3)
-        self.click_at_coordinates(537, 1910)
-        time.sleep(0.3)
-        self.click_at_coordinates(537, 1910)
-        time.sleep(0.5)
-        self.click_at_coordinates(537, 1910)
+        """Click nhiều lần vào nút reset (theo workflow) để quay lại và chuẩn bị chạy lại"""
+        step = self.get_plan().steps["reset"]
+        x, y = step["tap"]
+        waits = step.get("waits") or [0.3]
+        print(f"\n🔄 Click {len(waits)} lần vào ({x}, {y}) để reset...")
+        for wait in waits:
+            time.sleep(wait)
+            self.click_at_coordinates(x, y)
         print(f"✅ Đã reset, sẵn sàng chạy lại từ bước 1\n")
 
     def step1_click_treasure(self):
@@ -685,8 +2681,7 @@ class GameMonitor:
             x, y = self.last_found_coords
             print(f"🎯 Bước 1: Click vào '{self.target_text}'...")
             time.sleep(self.click_delay)
-            self.click_at_coordinates(x, y)
-            time.sleep(self.click_delay * 2)
+            self.tap_and_wait("step1", x, y, self.click_delay * 2)
             return True
         else:
             print(f"⚠️  Không tìm thấy tọa độ để click")
@@ -694,83 +2689,156 @@ class GameMonitor:
 
     def step2_click_center(self):
         """Bước 2: Click vào tọa độ giữa màn hình"""
+        step = self.get_plan().steps["step2"]
+        wait_before, wait_after = self.step_waits(step)
         print(f"🎯 Bước 2: Click vào tọa độ giữa màn hình...")
-        time.sleep(self.click_delay)
-        self.click_at_coordinates(514, 819)
-        time.sleep(self.click_delay * 2)
+        time.sleep(wait_before)
+        self.tap_and_wait("step2", *step["tap"], wait_after)
         return True
 
     def step3_verify_and_click(self):
-        """Bước 3: Kiểm tra pixel pattern và click (550, 1136)"""
-        print(f"🔍 Bước 3: Kiểm tra pixel pattern tại (550, 1136) (Smart Verify)...")
-        time.sleep(self.click_delay)
-
-        # Chọn pattern dựa trên target_text
-        if "Test Flight" in self.target_text:
-            pattern_name = "step3_test"
-        elif any(
-            word in self.target_text for word in ["Wondrous", "Christmas", "Party"]
-        ):
-            pattern_name = "step3_tiec"
-        else:
-            pattern_name = "step3_dig"
-
-        # Kiểm tra pattern có tồn tại không
-        if pattern_name not in self.pixel_patterns:
-            print(f"⚠️  Pattern '{pattern_name}' không tồn tại trong config!")
-            # Thử dùng pattern còn lại
-            fallback = "step3_dig" if pattern_name == "step3_test" else "step3_test"
-            if fallback in self.pixel_patterns:
-                print(f"🔄 Thử dùng pattern fallback: '{fallback}'")
-                pattern_name = fallback
-            else:
-                print(f"❌ Không có pattern nào cho bước 3. Bỏ qua verify.")
-                return False
+        """Bước 3: Kiểm tra pixel pattern (chọn theo target text) và click"""
+        plan = self.get_plan()
+        step = plan.steps["step3"]
+        x, y = step["tap"]
+        wait_before, wait_after = self.step_waits(step)
+        print(f"🔍 Bước 3: Kiểm tra pixel pattern tại ({x}, {y}) (Smart Verify)...")
+        time.sleep(wait_before)
+
+        # Chọn pattern dựa trên target_text (bảng route của workflow)
+        pattern_name = plan.route_pattern("step3", self.target_text)
+        if pattern_name is None:
+            print(f"❌ Không có pattern nào cho bước 3. Bỏ qua verify.")
+            return False
 
         if self.smart_verify_pattern(pattern_name):
-            print(f"✅ Pattern ổn định! Click vào (550, 1136)...")
-            time.sleep(self.click_delay)
-            self.click_at_coordinates(550, 1136)
-            time.sleep(self.click_delay * 2)
+            print(f"✅ Pattern ổn định! Click vào ({x}, {y})...")
+            time.sleep(wait_before)
+            self.click_at_coordinates(x, y)
+            time.sleep(wait_after)
             return True
         else:
             print(f"⚠️  Pattern không ổn định (có thể bị nhiễu UI).")
             return False
 
     def step4_verify_and_click(self):
-        """Bước 4: Kiểm tra pixel pattern và click (538, 1470)"""
-        print(f"🔍 Bước 4: Kiểm tra pixel pattern tại (538, 1470) (Smart Verify)...")
+        """Bước 4: Kiểm tra pixel pattern và click"""
+        step = self.get_plan().steps["step4"]
+        x, y = step["tap"]
+        wait_before, wait_after = self.step_waits(step)
+        print(f"🔍 Bước 4: Kiểm tra pixel pattern tại ({x}, {y}) (Smart Verify)...")
 
-        max_retries = 2
+        max_retries = step.get("retries", 2)
         for attempt in range(max_retries):
             if self.stop_requested:
                 return False
 
             if attempt > 0:
                 print(f"🔄 Thử lại lần {attempt + 1}/{max_retries}...")
-                time.sleep(0.5)
+                time.sleep(step.get("retry_wait", 0.5))
 
-            if self.smart_verify_pattern("step4"):
-                print(f"✅ Pattern ổn định! Click vào (538, 1470)...")
-                time.sleep(self.click_delay)
-                self.click_at_coordinates(538, 1470)
-                time.sleep(self.click_delay * 2)
+            if self.smart_verify_pattern(step.get("pattern", "step4")):
+                print(f"✅ Pattern ổn định! Click vào ({x}, {y})...")
+                time.sleep(wait_before)
+                self.click_at_coordinates(x, y)
+                time.sleep(wait_after)
                 return True
 
         print(f"⚠️  Pixel pattern không khớp sau {max_retries} lần thử.")
         return False
 
+    def read_countdown(self):
+        """Chụp 1 screenshot và OCR đồng hồ đếm ngược của bước 5
+
+        Returns:
+            (số giây còn lại, thời điểm chụp) hoặc (None, thời điểm chụp)
+        """
+        step = self.get_plan().steps["step5"]
+        captured_at = time.time()
+        img = self.capture_screenshot()
+        if img is None:
+            return None, captured_at
+
+        box = step["countdown_box"]
+        size = (box[2] - box[0], box[3] - box[1])
+        try:
+            processed = self.preprocess_ocr_image(img, box, size)
+            with self.metrics.span("ocr_countdown", self.device_serial):
+                text = pytesseract.image_to_string(
+                    processed, lang="eng", config=COUNTDOWN_OCR_CONFIG
+                )
+        except Exception as e:
+            print(f"⚠️  Lỗi khi OCR đồng hồ đếm ngược: {e}")
+            return None, captured_at
+
+        remaining = parse_countdown(text)
+        if self.debug:
+            print(f"[DEBUG] Đồng hồ đếm ngược: {text.strip()!r} -> {remaining}s")
+        return remaining, captured_at
+
+    def estimate_countdown_end(self):
+        """Ước lượng thời điểm (time.time()) đồng hồ đếm ngược của bước 5 kết thúc
+
+        Đọc đồng hồ vài lần; các lần đọc phải nhất quán (thời điểm kết thúc lệch nhau
+        không quá max_drift giây). Lấy thời điểm sớm nhất để không click trễ.
+
+        Returns:
+            Thời điểm kết thúc, None nếu không có cấu hình countdown / không đọc được
+        """
+        countdown = self.get_plan().steps["step5"].get("countdown")
+        if countdown is None or not OCR_AVAILABLE:
+            return None
+
+        reads = max(1, int(countdown.get("reads", 2)))
+        read_interval = countdown.get("read_interval", 1.0)
+        max_drift = countdown.get("max_drift", COUNTDOWN_MAX_DRIFT)
+
+        ends = []
+        for i in range(reads):
+            if i:
+                time.sleep(read_interval)
+            remaining, captured_at = self.read_countdown()
+            if remaining is not None:
+                ends.append(captured_at + remaining)
+
+        if not ends or max(ends) - min(ends) > max_drift:
+            if ends:
+                print(f"⚠️  Các lần đọc đồng hồ không khớp nhau ({max(ends) - min(ends):.1f}s)")
+            return None
+        return min(ends)
+
+    def idle_until(self, deadline):
+        """Chờ đến deadline (không chụp, không click), dừng sớm nếu có lệnh dừng
+
+        Returns:
+            False nếu bị dừng giữa chừng
+        """
+        while not self.stop_requested:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, 0.5))
+        return False
+
+    @timed("step5")
     def step5_auto_click(self):
         """Bước 5: Kiểm tra pixel pattern và auto-click liên tục cho đến khi quà xuất hiện"""
-        print(f"🔍 Bước 5: Kiểm tra pixel pattern tại (514, 819)...")
+        step = self.get_plan().steps["step5"]
+        tap_x, tap_y = step["tap"]
+        pattern_name = step.get("pattern", "step5")
+        max_wait_time = step.get("timeout", 600)  # Mặc định 10 phút
+        check_interval = step.get("check_interval", 1.5)
+
+        print(f"🔍 Bước 5: Kiểm tra pixel pattern tại ({tap_x}, {tap_y})...")
         print(
-            f"⏰  Sẽ click liên tục và kiểm tra đến khi quà xuất hiện (timeout: 10 phút)..."
+            f"⏰  Sẽ click liên tục và kiểm tra đến khi quà xuất hiện (timeout: {max_wait_time/60:.0f} phút)..."
         )
 
-        max_wait_time = 600  # 10 phút
-        check_interval = 1.5
+        self.load_tap_calibration()
+
         step5_start_time = time.time()
         attempt = 0
+        countdown_checked = False
 
         while time.time() - step5_start_time < max_wait_time:
             if self.stop_requested:
@@ -786,10 +2854,32 @@ class GameMonitor:
                     f"🔄 Lần thử #{attempt} - Còn {remaining_time:.0f}s (đã chờ {elapsed_step5:.0f}s)..."
                 )
 
-            if self.smart_verify_pattern("step5"):
+            if self.smart_verify_pattern(pattern_name):
                 print(
                     f"✅ Pattern ổn định sau {attempt} lần thử ({elapsed_step5:.1f}s)!"
                 )
+
+                # Đọc đồng hồ đếm ngược (nếu có cấu hình) và nghỉ hẳn đến gần lúc hết giờ
+                if not countdown_checked:
+                    countdown_checked = True
+                    countdown_end = self.estimate_countdown_end()
+                    if countdown_end is not None:
+                        lead_time = step["countdown"].get("lead_time", COUNTDOWN_LEAD_TIME)
+                        wake_at = min(
+                            countdown_end - lead_time, step5_start_time + max_wait_time
+                        )
+                        idle_seconds = wake_at - time.time()
+                        if idle_seconds > 0:
+                            print(
+                                f"⏳ Đồng hồ còn {countdown_end - time.time():.0f}s, "
+                                f"nghỉ {idle_seconds:.0f}s rồi mới click..."
+                            )
+                            if not self.idle_until(wake_at):
+                                print("\n🛑 Nhận lệnh dừng tại Bước 5")
+                                return False
+                            self.cached_screenshot = None
+                            continue  # Verify lại pattern sau khi nghỉ
+
                 print(f"🎯 Bắt đầu click liên tục cho đến khi quà xuất hiện...")
 
                 click_start_time = time.time()
@@ -798,32 +2888,36 @@ class GameMonitor:
                 should_stop_clicking = {"value": False}  # Flag để dừng click thread
                 gift_appeared = {"value": False}  # Flag đánh dấu quà đã xuất hiện
 
-                # Thread 1: Click liên tục không nghỉ
-                def click_continuously():
-                    while not should_stop_clicking["value"]:
-                        if self.stop_requested:
-                            should_stop_clicking["value"] = True
-                            return
+                # Thread 1: Click liên tục theo timeline cố định (bù trễ dispatch)
+                scheduler = TapScheduler(
+                    lambda: self.tap_async(tap_x, tap_y),
+                    click_interval,
+                    accepted=lambda: self.taps_acked,
+                )
 
-                        if time.time() - step5_start_time > max_wait_time:
-                            should_stop_clicking["value"] = True
-                            return
+                def should_stop_scheduler():
+                    if self.stop_requested:
+                        should_stop_clicking["value"] = True
+                    if time.time() - step5_start_time > max_wait_time:
+                        should_stop_clicking["value"] = True
+                    return should_stop_clicking["value"]
 
-                        self.click_at_coordinates(514, 819)
-                        click_count["value"] += 1
+                def on_tap(tap_count):
+                    click_count["value"] = tap_count
 
-                        # Hiển thị progress mỗi 20 lần click
-                        if click_count["value"] % 20 == 0:
-                            elapsed_click = time.time() - click_start_time
-                            print(
-                                f"⚡ Đã click {click_count['value']} lần ({elapsed_click:.1f}s)..."
-                            )
+                    # Hiển thị progress mỗi 20 lần click
+                    if tap_count % 20 == 0:
+                        elapsed_click = time.time() - click_start_time
+                        print(
+                            f"⚡ Đã click {tap_count} lần ({elapsed_click:.1f}s, {scheduler.achieved_rate:.1f}/{scheduler.target_rate:.1f} click/s)..."
+                        )
 
-                        time.sleep(click_interval)
+                def click_continuously():
+                    scheduler.run(should_stop_scheduler, on_tap)
 
                 # Thread 2: Kiểm tra pattern định kỳ
                 def check_pattern_periodically():
-                    check_every_seconds = 2.0
+                    check_every_seconds = step.get("gift_check_interval", 2.0)
                     last_check_time = time.time()
 
                     while not should_stop_clicking["value"]:
@@ -841,7 +2935,7 @@ class GameMonitor:
 
                                 # Kiểm tra xem pattern step5 còn không
                                 is_match, match_ratio = self.check_pixel_pattern(
-                                    "step5"
+                                    pattern_name
                                 )
 
                                 if not is_match:
@@ -876,12 +2970,29 @@ class GameMonitor:
                     target=check_pattern_periodically, daemon=True
                 )
 
-                click_thread.start()
-                check_thread.start()
-
-                # Đợi cả 2 threads hoàn thành
-                click_thread.join()
-                check_thread.join()
+                try:
+                    click_thread.start()
+                    check_thread.start()
+
+                    # Đợi cả 2 threads hoàn thành
+                    click_thread.join()
+                    check_thread.join()
+                finally:
+                    # Kể cả khi bị Ctrl+C: dừng click thread rồi mới đóng shell
+                    should_stop_clicking["value"] = True
+                    if click_thread.is_alive():
+                        click_thread.join(timeout=1)
+                    self.stop_tap_shell()
+
+                self.last_tap_stats = scheduler.summary()
+                stats = self.last_tap_stats
+                print(
+                    f"📊 Tốc độ click: {stats['achieved_rate']:.1f}/{stats['target_rate']:.1f} click/s "
+                    f"(thiết bị xử lý {stats['accepted_taps']}/{stats['taps']} tap, "
+                    f"bỏ {stats['dropped_taps']} tap do dồn hàng), "
+                    f"jitter p50={stats['jitter_p50_ms']:.0f}ms p95={stats['jitter_p95_ms']:.0f}ms, "
+                    f"bỏ qua {stats['skipped_slots']} slot"
+                )
 
                 # Kiểm tra kết quả
                 if gift_appeared["value"]:
@@ -900,6 +3011,7 @@ class GameMonitor:
         print(f"⚠️  Pixel pattern không khớp sau {attempt} lần thử ({max_wait_time}s).")
         return False
 
+    @timed("click_sequence")
     def execute_click_sequence(self):
         """Thực hiện chuỗi click theo thứ tự"""
         start_time = time.time()
@@ -921,6 +3033,9 @@ class GameMonitor:
         # Bước 3
         print()
         if not self.step3_verify_and_click():
+            # Có thể do delay học được của bước 1/2 quá ngắn => lần sau đo lại cả 2
+            self._transition_observe_next.update(("step1", "step2"))
+            self.save_transitions()
             print(f"Bỏ qua bước 3 và 4.")
             self.click_back_and_restart()
             return
@@ -930,6 +3045,8 @@ class GameMonitor:
 
         # Bước 4
         print()
+        self.save_transitions()
+
         if not self.step4_verify_and_click():
             elapsed_time = time.time() - start_time
             print(f"Bỏ qua bước 4 và 5.")
@@ -1003,11 +3120,130 @@ class GameMonitor:
 
         return user_response["value"]
 
+    def start_event_trigger(self):
+        """Khởi động các stream sự kiện theo self.event_sources
+
+        Returns:
+            EventTrigger hoặc None nếu không dùng chế độ sự kiện
+        """
+        if not self.event_sources:
+            return None
+
+        trigger = EventTrigger(safety_interval=self.event_safety_interval)
+        package = self.package_name
+
+        if "logcat" in self.event_sources:
+            tags = " ".join(f"{tag}:I" for tag in EVENT_LOGCAT_TAGS)
+            trigger.add_source(
+                "logcat",
+                self.adb_cmd(f"logcat -v brief -T 1 {tags} *:S"),
+                lambda line: package in line,
+            )
+            self._event_trigger = trigger
+            self.refresh_game_log_source()
+
+        if "window" in self.event_sources:
+            if self.use_ocr:
+                trigger.add_source(
+                    "window",
+                    self.adb_cmd("shell uiautomator events"),
+                    lambda line: package in line
+                    and any(event in line for event in EVENT_WINDOW_TYPES),
+                )
+            else:
+                # `uiautomator events` và `uiautomator dump` không chạy đồng thời được
+                print("⚠️  Bỏ qua nguồn sự kiện 'window' khi dùng UI Hierarchy")
+
+        self._event_trigger = trigger
+        return trigger
+
+    def refresh_game_log_source(self):
+        """Stream logcat của process game (theo PID), khởi động lại khi game đổi PID"""
+        if not self._event_trigger or not self.game_log_pattern:
+            return
+        pid = self.run_adb_command(self.adb_cmd(f"shell pidof {self.package_name}"))
+        pid = pid.split()[0] if pid.split() else None
+        if pid == self._event_pid:
+            return
+
+        self._event_pid = pid
+        if pid is None:
+            self._event_trigger.remove_source("game")
+            return
+        pattern = self.game_log_pattern
+        self._event_trigger.add_source(
+            "game",
+            self.adb_cmd(f"logcat -v brief -T 1 --pid={pid}"),
+            lambda line: pattern.search(line) is not None,
+        )
+
+    def wait_for_next_check(self, interval):
+        """Chờ đến lần kiểm tra tiếp theo: theo sự kiện nếu có trigger, ngược lại sleep"""
+        if self._event_trigger is None:
+            time.sleep(interval)
+            return
+
+        self.refresh_game_log_source()
+        reasons = self._event_trigger.wait(lambda: self.stop_requested)
+        if self.debug:
+            reason = ", ".join(reasons) if reasons else "safety poll"
+            print(f"[DEBUG] Đánh thức bởi: {reason}")
+
+    def stop_event_trigger(self):
+        if self._event_trigger:
+            self._event_trigger.stop()
+            counts = self._event_trigger.event_counts
+            if counts:
+                summary = ", ".join(f"{name}: {count}" for name, count in counts.items())
+                print(f"📡 Số sự kiện đã nhận - {summary}")
+        self._event_trigger = None
+        self._event_pid = None
+
+    def start_metrics(self):
+        """Mở endpoint Prometheus / snapshot JSON định kỳ nếu có cấu hình"""
+        self.get_device_serial()  # Gắn nhãn thiết bị thống nhất cho mọi span
+        if self.metrics_port and not self._metrics_serving:
+            try:
+                host, port = self.metrics.serve(self.metrics_port)
+                self._metrics_serving = True
+                print(f"📊 Latency metrics: http://{host}:{port}/metrics")
+            except OSError as e:
+                print(f"⚠️  Không mở được endpoint metrics port {self.metrics_port}: {e}")
+        if self.metrics_snapshot and not self._metrics_snapshotting:
+            self.metrics.start_snapshots(
+                self.metrics_snapshot, self.metrics_snapshot_interval
+            )
+            self._metrics_snapshotting = True
+            print(f"📊 Latency snapshot: {self.metrics_snapshot}")
+
+    def stop_metrics(self):
+        """Trả endpoint / snapshot đã mở và in bảng độ trễ của thiết bị này
+
+        Metrics dùng chung giữa nhiều monitor chỉ dừng hẳn khi monitor cuối cùng trả lại.
+        """
+        if self._metrics_serving:
+            self.metrics.stop_server()
+            self._metrics_serving = False
+        if self._metrics_snapshotting:
+            self.metrics.stop_snapshots()
+            self._metrics_snapshotting = False
+        snapshot = self.metrics.snapshot()
+        device = self.device_serial or ""
+        if any(stage["device"] == device for stage in snapshot["stages"]):
+            print("\n⏱️  Độ trễ từng stage (ms):")
+            print(format_report(snapshot, device))
+
     def monitor(self, interval=5):
         """Theo dõi liên tục"""
         print(f"🎮 Bắt đầu theo dõi game: {self.package_name}")
         print(f"🔍 Tìm kiếm text: {self.target_texts}")
-        print(f"⏱️  Kiểm tra mỗi {interval} giây")
+        if self.event_sources:
+            print(
+                f"📡 Kiểm tra khi có sự kiện ({', '.join(self.event_sources)}),"
+                f" poll dự phòng mỗi {self.event_safety_interval} giây"
+            )
+        else:
+            print(f"⏱️  Kiểm tra mỗi {interval} giây")
         print(
             f"📷 Phương thức: {'OCR (nhận dạng hình ảnh)' if self.use_ocr else 'UI Hierarchy'}"
         )
@@ -1024,6 +3260,16 @@ class GameMonitor:
             return
 
         print("✅ Đã kết nối thiết bị Android")
+        if self.auto_click:
+            # Compile workflow cho thiết bị ngay: tọa độ ngoài màn hình báo lỗi từ đầu
+            try:
+                self.get_plan()
+            except WorkflowError as e:
+                print(f"❌ Workflow không dùng được cho thiết bị này: {e}")
+                return
+        self.load_tap_calibration()
+        self.start_event_trigger()
+        self.start_metrics()
 
         check_count = 0
         try:
@@ -1040,7 +3286,16 @@ class GameMonitor:
                 print(f"[{timestamp}] 🔍 Kiểm tra lần #{check_count}...", end=" ")
 
                 # Tìm kiếm text
-                if self.search_text_in_screen():
+                check_start = time.time()
+                found = self.search_text_in_screen()
+                self.record_event(
+                    "check",
+                    number=check_count,
+                    found=found,
+                    target=self.target_text if found else None,
+                    duration=round(time.time() - check_start, 4),
+                )
+                if found:
                     print("✅ Tìm thấy!")
                     response = self.send_notification()
                     self.found = True
@@ -1055,7 +3310,10 @@ class GameMonitor:
                 else:
                     print("❌ Chưa tìm thấy")
 
-                time.sleep(interval)
+                if self.debug and self.use_ocr and check_count % 20 == 0:
+                    self.print_cascade_report()
+
+                self.wait_for_next_check(interval)
 
             if self.stop_requested:
                 print("\n🛑 Đã nhận lệnh dừng từ GUI.")
@@ -1064,17 +3322,26 @@ class GameMonitor:
             print("\n\n🛑 Đã dừng theo dõi bởi người dùng.")
         except Exception as e:
             print(f"\n❌ Lỗi: {e}")
+        finally:
+            self.stop_event_trigger()
+            self.stop_metrics()
+            self.print_cascade_report()
+            self.save_screen_index()
+            self.save_transitions()
+            self.close_session()
+            if sum(self.classifier_stats.values()):
+                decided = self.classifier_stats["decided"]
+                print(
+                    f"🧠 Classifier tự quyết định {decided}/{sum(self.classifier_stats.values())} lần verify"
+                )
 
 
 def main():
     # Cấu hình
     PACKAGE_NAME = "com.fun.lastwar.vn.gp"
-    # Có thể truyền 1 chuỗi hoặc list nhiều chuỗi
-    TARGET_TEXT = [
-        "Dig Up Treasure",
-        "Test Flight Failure",
-    ]  # Tìm 1 trong các text này
-    # Hoặc dùng chuỗi đơn: TARGET_TEXT = "Dig Up Treasure"
+    # Workflow: targets, vùng OCR, pixel patterns, tọa độ và thời gian chờ của từng bước
+    # None = ~/.lastwar_monitor_workflow.json nếu có, ngược lại dùng workflow.json đi kèm
+    WORKFLOW_FILE = None
     CHECK_INTERVAL = 2  # giây - Giảm xuống 2s để check nhanh hơn
 
     # Tùy chọn
@@ -1083,7 +3350,10 @@ def main():
     SKIP_COLOR_CHECK = True  # Đặt True để bỏ qua kiểm tra màu, click thẳng (nhanh hơn!)
     CLICK_DELAY = 0.2  # Thời gian delay giữa các lần click (giây) - Giảm để nhanh hơn
     DEBUG_MODE = False  # Đổi thành True để xem tool đang "nhìn thấy" gì
-    OCR_REGION = (0.7, 1.0)  # Chỉ OCR 30% phần dưới màn hình (từ 70% đến 100%)
+    OCR_SCALE = 1.0  # Resize trước OCR (0.25-1.0), "auto" = chọn theo chiều cao chữ
+    INCREMENTAL_OCR = False  # True = chỉ OCR lại các dải có nội dung thay đổi
+    EVENT_SOURCES = []  # ["logcat", "window"] = chỉ kiểm tra khi game/window có sự kiện
+    OCR_PROFILE = False  # True = OCR chỉ với ký tự/từ của target (đo bằng test_ocr_improvement.py trước)
 
     # Pixel Pattern - Tăng độ linh hoạt
     PATTERN_TOLERANCE = (
@@ -1092,31 +3362,15 @@ def main():
     PATTERN_MATCH_RATIO = (
         0.6  # Tỷ lệ pixel khớp tối thiểu (0.0-1.0). 0.6 = 60% pixel khớp là pass
     )
-
-    # ⭐ PIXEL PATTERNS - Định nghĩa các pixel đặc trưng cho mỗi bước
-    # Để lấy pixel patterns: Bật DEBUG_MODE=True, chạy 1 lần, xem tọa độ, rồi dùng get_pixel_color()
-    PIXEL_PATTERNS = {
-        "step3_dig": [  # Pattern cho "Dig Up Treasure"
-            {"coord": (550, 1136), "color": "#FFFFFF"},  # Pixel chính
-            {"coord": (545, 1136), "color": "#F8FBF9"},  # Trái
-        ],
-        "step3_test": [  # Pattern cho "Test Flight Failure"
-            {"coord": (550, 1136), "color": "#FFFFFF"},  # Pixel chính
-            {"coord": (545, 1136), "color": "#308E4D"},  # Trái (màu khác)
-        ],
-        "step3_tiec": [  # Pattern cho "Wondrous Christmas Party"
-            {"coord": (552, 1723), "color": "#FFFFFF"},  # Pixel chính
-            {"coord": (547, 1723), "color": "#FFFFFF"},  # Trái
-        ],
-        "step4": [
-            {"coord": (538, 1470), "color": "#10B2FB"},  # Pixel chính
-            {"coord": (533, 1470), "color": "#10B3FB"},  # Trái
-        ],
-        "step5": [
-            {"coord": (514, 819), "color": "#94C03D"},  # Pixel chính
-            {"coord": (509, 819), "color": "#A7F200"},  # Trái
-        ],
-    }
+    # Index dHash nhận diện màn hình: SCREEN_INDEX_FILE để bật (mặc định tắt, cần đo trên corpus trước)
+    SCREEN_INDEX = None
+    CLASSIFIER = CLASSIFIER_FILE  # Model từ screen_classifier.py (chưa train = tắt)
+    CLASSIFIER_CONFIDENCE = 0.95  # Độ tin cậy tối thiểu để bỏ qua verify pixel pattern
+    TRANSITION_PERCENTILE = 90  # Delay sau tap bước 1-2 = p90 thời gian chuyển màn hình đo được
+    RECORD_SESSION = None  # Đường dẫn file .lws để ghi lại phiên chạy (None = không ghi)
+    ADB_PATH = "adb"  # Lệnh adb, vd: "python3 fake_adb_device.py adb" để chạy với thiết bị giả
+    METRICS_PORT = None  # vd 9464: endpoint Prometheus http://127.0.0.1:9464/metrics
+    METRICS_SNAPSHOT = None  # vd "latency.json": ghi histogram độ trễ ra JSON mỗi 60 giây
 
     if USE_OCR and not OCR_AVAILABLE:
         print("⚠️  Cần cài đặt thư viện OCR:")
@@ -1124,19 +3378,39 @@ def main():
         print("   pip3 install Pillow pytesseract")
         return
 
+    try:
+        workflow = load_workflow(WORKFLOW_FILE)
+    except WorkflowError as e:
+        print(f"❌ Workflow không hợp lệ: {e}")
+        return
+    print(f"📋 Workflow: {workflow.path}")
+
     # Tạo monitor và bắt đầu theo dõi
     monitor = GameMonitor(
         PACKAGE_NAME,
-        TARGET_TEXT,
+        workflow.targets,
         use_ocr=USE_OCR,
         debug=DEBUG_MODE,
         auto_click=AUTO_CLICK,
         click_delay=CLICK_DELAY,
         skip_color_check=SKIP_COLOR_CHECK,
-        ocr_region=OCR_REGION,
-        pixel_patterns=PIXEL_PATTERNS,
         pattern_tolerance=PATTERN_TOLERANCE,
         pattern_match_ratio=PATTERN_MATCH_RATIO,
+        burst_frames=BURST_FRAMES,
+        pattern_search_radius=PATTERN_SEARCH_RADIUS,
+        screen_index_file=SCREEN_INDEX,
+        classifier_file=CLASSIFIER,
+        classifier_confidence=CLASSIFIER_CONFIDENCE,
+        transition_percentile=TRANSITION_PERCENTILE,
+        record_session=RECORD_SESSION,
+        adb_path=ADB_PATH,
+        metrics_port=METRICS_PORT,
+        metrics_snapshot=METRICS_SNAPSHOT,
+        ocr_scale=OCR_SCALE,
+        incremental_ocr=INCREMENTAL_OCR,
+        ocr_profile=OCR_PROFILE,
+        event_sources=EVENT_SOURCES,
+        workflow=workflow,
     )
     monitor.monitor(interval=CHECK_INTERVAL)
 
@@ -11,7 +11,9 @@ import threading
 import sys
 import json
 import os
-from monitor_game import GameMonitor
+from monitor_game import BURST_FRAMES, PATTERN_SEARCH_RADIUS, GameMonitor
+from screen_classifier import CLASSIFIER_FILE
+from workflow import WorkflowError
 from datetime import datetime
 
 try:
@@ -625,46 +627,31 @@ class GameMonitorGUI:
         # Lưu config
         self.save_config()
 
-        # Pixel patterns
-        PIXEL_PATTERNS = {
-            "step3_dig": [  # Pattern cho "Dig Up Treasure"
-                {"coord": (550, 1136), "color": "#FFFFFF"},
-                {"coord": (545, 1136), "color": "#F8FBF9"},
-            ],
-            "step3_test": [  # Pattern cho "Test Flight Failure"
-                {"coord": (550, 1136), "color": "#FFFFFF"},
-                {"coord": (545, 1136), "color": "#308E4D"},  # Màu khác
-            ],
-            "step3_tiec": [  # Pattern cho "Wondrous Christmas Party"
-                {"coord": (552, 1723), "color": "#FFFFFF"},  # Pixel chính
-                {"coord": (547, 1723), "color": "#FFFFFF"},  # Trái
-            ],
-            "step4": [
-                {"coord": (542, 1472), "color": "#10B1FB"},
-                {"coord": (537, 1472), "color": "#10B2FC"},
-            ],
-            "step5": [
-                {"coord": (514, 819), "color": "#94C03D"},
-                {"coord": (509, 819), "color": "#A7F200"},
-            ],
-        }
-
-        # Create monitor instance
-        self.monitor = GameMonitor(
-            package,
-            target_texts,
-            use_ocr=True,
-            debug=debug,
-            auto_click=auto_click,
-            click_delay=0.2,
-            click_speed=click_speed,
-            click_duration=click_duration,
-            skip_color_check=True,
-            ocr_region=ocr_region,
-            pixel_patterns=PIXEL_PATTERNS,
-            pattern_tolerance=20,
-            pattern_match_ratio=0.6,
-        )
+        # Create monitor instance (tọa độ, patterns, thời gian chờ lấy từ workflow)
+        try:
+            self.monitor = GameMonitor(
+                package,
+                target_texts,
+                use_ocr=True,
+                debug=debug,
+                auto_click=auto_click,
+                click_delay=0.2,
+                click_speed=click_speed,
+                click_duration=click_duration,
+                skip_color_check=True,
+                ocr_region=ocr_region,
+                pattern_tolerance=20,
+                pattern_match_ratio=0.6,
+                burst_frames=BURST_FRAMES,
+                pattern_search_radius=PATTERN_SEARCH_RADIUS,
+                classifier_file=CLASSIFIER_FILE,
+                transition_percentile=90,
+            )
+        except WorkflowError as e:
+            self.log(f"❌ Workflow không hợp lệ: {e}\n")
+            self.is_running = False
+            self.reset_controls()
+            return
 
         # Start in thread
         self.monitor_thread = threading.Thread(
@@ -703,7 +690,11 @@ class GameMonitorGUI:
         self.status_label.config(text="⏸️  Đang chờ...", fg="#7f8c8d")
 
     def create_manual_monitor(self):
-        """Tạo monitor instance cho manual control nếu chưa có"""
+        """Tạo monitor instance cho manual control nếu chưa có
+
+        Returns:
+            True nếu monitor sẵn sàng, False nếu workflow không hợp lệ
+        """
         if self.monitor is None:
             package = self.package_entry.get().strip()
             target_texts = [t.strip() for t in self.target_entry.get().split(",")]
@@ -718,43 +709,37 @@ class GameMonitorGUI:
                 "height": self.height_entry.get().strip() or "100%",
             }
 
-            PIXEL_PATTERNS = {
-                "step3": [
-                    {"coord": (550, 1136), "color": "#FFFFFF"},
-                    {"coord": (545, 1136), "color": "#F8FBF9"},
-                ],
-                "step4": [
-                    {"coord": (542, 1472), "color": "#10B1FB"},
-                    {"coord": (537, 1472), "color": "#10B2FC"},
-                ],
-                "step5": [
-                    {"coord": (514, 819), "color": "#94C03D"},
-                    {"coord": (509, 819), "color": "#A7F200"},
-                ],
-            }
-
-            self.monitor = GameMonitor(
-                package,
-                target_texts,
-                use_ocr=True,
-                debug=debug,
-                auto_click=False,
-                click_delay=0.2,
-                click_speed=click_speed,
-                click_duration=click_duration,
-                skip_color_check=True,
-                ocr_region=ocr_region,
-                pixel_patterns=PIXEL_PATTERNS,
-                pattern_tolerance=20,
-                pattern_match_ratio=0.6,
-            )
+            try:
+                self.monitor = GameMonitor(
+                    package,
+                    target_texts,
+                    use_ocr=True,
+                    debug=debug,
+                    auto_click=False,
+                    click_delay=0.2,
+                    click_speed=click_speed,
+                    click_duration=click_duration,
+                    skip_color_check=True,
+                    ocr_region=ocr_region,
+                    pattern_tolerance=20,
+                    pattern_match_ratio=0.6,
+                    burst_frames=BURST_FRAMES,
+                    pattern_search_radius=PATTERN_SEARCH_RADIUS,
+                    classifier_file=CLASSIFIER_FILE,
+                    transition_percentile=90,
+                )
+            except WorkflowError as e:
+                self.log(f"❌ Workflow không hợp lệ: {e}")
+                return False
 
         # Reset stop flag trước khi chạy manual steps
         self.monitor.stop_requested = False
+        return True
 
     def manual_step1(self):
         """Thực hiện bước 1 thủ công"""
-        self.create_manual_monitor()
+        if not self.create_manual_monitor():
+            return
         threading.Thread(target=self._run_manual_step1, daemon=True).start()
 
     def _run_manual_step1(self):
@@ -772,7 +757,8 @@ class GameMonitorGUI:
 
     def manual_step2(self):
         """Thực hiện bước 2 thủ công"""
-        self.create_manual_monitor()
+        if not self.create_manual_monitor():
+            return
         threading.Thread(target=self._run_manual_step2, daemon=True).start()
 
     def _run_manual_step2(self):
@@ -784,7 +770,8 @@ class GameMonitorGUI:
 
     def manual_step3(self):
         """Thực hiện bước 3 thủ công"""
-        self.create_manual_monitor()
+        if not self.create_manual_monitor():
+            return
         threading.Thread(target=self._run_manual_step3, daemon=True).start()
 
     def _run_manual_step3(self):
@@ -796,7 +783,8 @@ class GameMonitorGUI:
 
     def manual_step4(self):
         """Thực hiện bước 4 thủ công"""
-        self.create_manual_monitor()
+        if not self.create_manual_monitor():
+            return
         threading.Thread(target=self._run_manual_step4, daemon=True).start()
 
     def _run_manual_step4(self):
@@ -808,7 +796,8 @@ class GameMonitorGUI:
 
     def manual_step5(self):
         """Thực hiện bước 5 thủ công"""
-        self.create_manual_monitor()
+        if not self.create_manual_monitor():
+            return
         threading.Thread(target=self._run_manual_step5, daemon=True).start()
 
     def _run_manual_step5(self):
@@ -820,7 +809,8 @@ class GameMonitorGUI:
 
     def manual_reset(self):
         """Thực hiện reset thủ công"""
-        self.create_manual_monitor()
+        if not self.create_manual_monitor():
+            return
         threading.Thread(target=self._run_manual_reset, daemon=True).start()
 
     def _run_manual_reset(self):
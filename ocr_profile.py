@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Profile Tesseract thu hẹp theo danh sách target text
+
+Target chỉ là vài cụm từ tiếng Anh nên không cần cả bộ từ điển `eng`. Profile gồm:
+
+    whitelist       chỉ các ký tự có trong target (cả hoa lẫn thường)
+    user-words      các token của target (giữ nguyên, chữ thường, Title, HOA)
+    user-patterns   hình dạng từng token theo cú pháp Tesseract (\\A\\a\\a = "Dig")
+    dawg            tắt từ điển hệ thống / từ điển tần suất và phạt từ ngoài từ điển
+
+File user-words / user-patterns được ghi vào OCR_PROFILE_DIR, tên file theo hash của
+danh sách target nên đổi target là sinh profile mới, không ghi đè profile đang dùng.
+
+Cách dùng:
+    profile = OcrProfile(["Dig Up Treasure"])
+    pytesseract.image_to_string(img, lang="eng", config=profile.config(psm=6))
+    python3 ocr_profile.py "Dig Up Treasure" "Test Flight Failure"
+"""
+
+import argparse
+import hashlib
+import os
+import shlex
+
+from text_matcher import tokenize
+
+OCR_PROFILE_DIR = os.path.expanduser("~/.lastwar_monitor_ocr_profiles")
+
+# Tắt từ điển có sẵn của `eng` và bỏ phạt từ không có trong từ điển: chữ trong game
+# không phải văn xuôi, từ điển chỉ kéo kết quả về từ tiếng Anh phổ biến
+DICTIONARY_PARAMS = (
+    ("load_system_dawg", "0"),
+    ("load_freq_dawg", "0"),
+    ("language_model_penalty_non_dict_word", "0"),
+    ("language_model_penalty_non_freq_dict_word", "0"),
+)
+
+
+def whitelist_chars(targets):
+    """Các ký tự xuất hiện trong target (cả hoa lẫn thường, bỏ khoảng trắng)"""
+    chars = set()
+    for target in targets:
+        chars.update(target.lower())
+        chars.update(target.upper())
+    return "".join(sorted(c for c in chars if not c.isspace()))
+
+
+def target_words(targets):
+    """Từ của target theo các kiểu viết hoa thường gặp trên UI game"""
+    words = set()
+    for target in targets:
+        for word in target.split():
+            words.update((word, word.lower(), word.capitalize(), word.upper()))
+        words.update(tokenize(target))
+    return sorted(w for w in words if w)
+
+
+def word_pattern(word):
+    """Hình dạng 1 từ theo cú pháp user-patterns: \\A hoa, \\a thường, \\d số, \\p dấu câu"""
+    pattern = []
+    for char in word:
+        if char.isdigit():
+            pattern.append("\\d")
+        elif char.isupper():
+            pattern.append("\\A")
+        elif char.islower():
+            pattern.append("\\a")
+        elif char == "\\":
+            pattern.append("\\\\")
+        else:
+            pattern.append("\\p")
+    return "".join(pattern)
+
+
+class OcrProfile:
+    """Profile Tesseract (whitelist + user-words + user-patterns) sinh từ target"""
+
+    def __init__(self, targets, directory=OCR_PROFILE_DIR):
+        self.targets = tuple(targets)
+        self.whitelist = whitelist_chars(self.targets)
+        self.words = target_words(self.targets)
+        self.patterns = sorted({word_pattern(word) for word in self.words})
+
+        key = hashlib.sha1("\n".join(self.targets).encode("utf-8")).hexdigest()[:12]
+        self.user_words_path = os.path.join(directory, f"{key}.user-words")
+        self.user_patterns_path = os.path.join(directory, f"{key}.user-patterns")
+        self.write(directory)
+
+    def write(self, directory):
+        """Ghi file user-words / user-patterns (bỏ qua nếu đã có nội dung giống hệt)"""
+        os.makedirs(directory, exist_ok=True)
+        for path, lines in (
+            (self.user_words_path, self.words),
+            (self.user_patterns_path, self.patterns),
+        ):
+            content = "\n".join(lines) + "\n"
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    if f.read() == content:
+                        continue
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(temp_path, path)  # Monitor khác đang đọc không thấy file ghi dở
+
+    def config(self, psm=6, oem=3):
+        """Chuỗi config cho pytesseract (đã quote để qua được shlex.split)"""
+        args = [
+            f"--oem {oem}",
+            f"--psm {psm}",
+            f"--user-words {shlex.quote(self.user_words_path)}",
+            f"--user-patterns {shlex.quote(self.user_patterns_path)}",
+        ]
+        if self.whitelist:
+            args.append(f"-c {shlex.quote('tessedit_char_whitelist=' + self.whitelist)}")
+        args.extend(f"-c {name}={value}" for name, value in DICTIONARY_PARAMS)
+        return " ".join(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh profile Tesseract từ target text")
+    parser.add_argument("targets", nargs="+", help="Các target text")
+    parser.add_argument("--dir", default=OCR_PROFILE_DIR, help="Thư mục lưu profile")
+    parser.add_argument("--psm", type=int, default=6)
+    args = parser.parse_args()
+
+    profile = OcrProfile(args.targets, directory=args.dir)
+    print(f"🔤 Whitelist: {profile.whitelist}")
+    print(f"📖 User-words ({len(profile.words)}): {profile.user_words_path}")
+    print(f"🧩 User-patterns ({len(profile.patterns)}): {profile.user_patterns_path}")
+    print(f"⚙️  Config: {profile.config(psm=args.psm)}")
+
+
+if __name__ == "__main__":
+    main()
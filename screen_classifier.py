@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bộ phân loại màn hình siêu nhẹ (thuần NumPy) train từ frame đã gán nhãn
+
+Frame được thu nhỏ thành thumbnail RGB (THUMB_ROWS x THUMB_COLS) bằng lấy mẫu thưa,
+rồi phân loại bằng logistic regression (softmax) hoặc nearest-centroid. Dự đoán
+chỉ là 1 phép nhân ma trận nhỏ => dưới 1ms, trả về nhãn (tên pixel pattern của bước:
+step3_dig, step4, step5...) kèm độ tin cậy.
+
+Cấu trúc corpus giống extract_pixel_patterns.py (mỗi thư mục con = 1 nhãn).
+
+Cách dùng:
+    python3 screen_classifier.py train corpus/
+    python3 screen_classifier.py train corpus/ --kind centroid -o model.npz
+    python3 screen_classifier.py predict screenshot.png
+
+Model lưu dạng .npz (mặc định ~/.lastwar_monitor_classifier.npz), GameMonitor load
+bằng classifier_file=... và dùng thay cho smart_verify_pattern khi đủ tin cậy.
+"""
+
+import argparse
+import glob
+import os
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+CLASSIFIER_FILE = os.path.expanduser("~/.lastwar_monitor_classifier.npz")
+THUMB_ROWS = 32
+THUMB_COLS = 16
+SAMPLES_PER_CELL = 2  # Số điểm mẫu mỗi chiều của 1 ô thumbnail (lấy trung bình)
+MODEL_KINDS = ("logistic", "centroid")
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg")
+
+
+def thumbnail(frame, rows=THUMB_ROWS, cols=THUMB_COLS):
+    """Vector đặc trưng float32 (rows * cols * 3) từ frame (H, W, >=3), giá trị 0-1"""
+    height, width = frame.shape[:2]
+    ys = ((np.arange(rows * SAMPLES_PER_CELL) + 0.5) * height / (rows * SAMPLES_PER_CELL))
+    xs = ((np.arange(cols * SAMPLES_PER_CELL) + 0.5) * width / (cols * SAMPLES_PER_CELL))
+    sample = frame.take(ys.astype(np.intp), axis=0).take(xs.astype(np.intp), axis=1)
+    cells = (
+        sample[..., :3]
+        .astype(np.float32)
+        .reshape(rows, SAMPLES_PER_CELL, cols, SAMPLES_PER_CELL, 3)
+        .mean(axis=(1, 3))
+    )
+    return cells.ravel() / 255.0
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class ScreenClassifier:
+    """Model đã train: chuẩn hóa đặc trưng + tham số của logistic / nearest-centroid
+
+    Với nearest-centroid, logits = -khoảng cách² / (2 * scale) với scale là khoảng
+    cách² trung bình của mẫu tới tâm lớp của nó lúc train.
+    """
+
+    def __init__(self, kind, labels, mean, std, weights, bias, scale=1.0, size=None):
+        self.kind = kind
+        self.labels = list(labels)
+        self.mean = mean.astype(np.float32)
+        self.std = std.astype(np.float32)
+        self.weights = weights.astype(np.float32)  # logistic: (D, C), centroid: (C, D)
+        self.bias = bias.astype(np.float32)
+        self.scale = float(scale)
+        self.size = tuple(size or (THUMB_ROWS, THUMB_COLS))
+
+    def features(self, frames):
+        """Ma trận đặc trưng đã chuẩn hóa (N, D) từ list frame"""
+        x = np.stack([thumbnail(frame, *self.size) for frame in frames])
+        return (x - self.mean) / self.std
+
+    def logits(self, x):
+        if self.kind == "logistic":
+            return x @ self.weights + self.bias
+        distances = (
+            (x * x).sum(axis=1, keepdims=True)
+            - 2 * x @ self.weights.T
+            + (self.weights * self.weights).sum(axis=1)
+        )
+        return -distances / (2 * self.scale)
+
+    def predict_proba(self, frames):
+        return softmax(self.logits(self.features(frames)))
+
+    def predict(self, frame):
+        """Dự đoán 1 frame
+
+        Returns:
+            (label, confidence) - confidence là xác suất softmax của nhãn (0-1)
+        """
+        proba = self.predict_proba([frame])[0]
+        best = int(np.argmax(proba))
+        return self.labels[best], float(proba[best])
+
+    def save(self, path=CLASSIFIER_FILE):
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=np.array(1),
+                kind=np.array(self.kind),
+                labels=np.array(self.labels),
+                mean=self.mean,
+                std=self.std,
+                weights=self.weights,
+                bias=self.bias,
+                scale=np.array(self.scale),
+                size=np.array(self.size),
+            )
+
+    @classmethod
+    def load(cls, path=CLASSIFIER_FILE):
+        with np.load(path) as data:
+            return cls(
+                str(data["kind"]),
+                [str(label) for label in data["labels"]],
+                data["mean"],
+                data["std"],
+                data["weights"],
+                data["bias"],
+                float(data["scale"]),
+                tuple(int(v) for v in data["size"]),
+            )
+
+
+def train(x, y, labels, kind="logistic", epochs=300, learning_rate=0.5, l2=1e-3):
+    """Train model từ đặc trưng thô x (N, D) và index nhãn y (N,)
+
+    Logistic regression: gradient descent toàn batch, trọng số mẫu cân bằng theo lớp.
+    """
+    mean = x.mean(axis=0)
+    std = x.std(axis=0) + 1e-3
+    xs = (x - mean) / std
+    classes = len(labels)
+
+    if kind == "centroid":
+        centroids = np.stack([xs[y == c].mean(axis=0) for c in range(classes)])
+        scale = float(((xs - centroids[y]) ** 2).sum(axis=1).mean()) or 1.0
+        return ScreenClassifier(
+            kind, labels, mean, std, centroids, np.zeros(classes), scale
+        )
+
+    onehot = np.eye(classes, dtype=np.float32)[y]
+    counts = np.bincount(y, minlength=classes)
+    sample_weight = (len(y) / (classes * counts[y]))[:, None]
+    weights = np.zeros((xs.shape[1], classes), dtype=np.float32)
+    bias = np.zeros(classes, dtype=np.float32)
+    for _ in range(epochs):
+        error = (softmax(xs @ weights + bias) - onehot) * sample_weight / len(y)
+        weights -= learning_rate * (xs.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+    return ScreenClassifier(kind, labels, mean, std, weights, bias)
+
+
+def load_corpus(corpus_dir):
+    """Đặc trưng thô (N, D), nhãn (N,) và list tên nhãn từ corpus (mỗi thư mục con = 1 nhãn)"""
+    from PIL import Image
+
+    labels = sorted(
+        name for name in os.listdir(corpus_dir) if os.path.isdir(os.path.join(corpus_dir, name))
+    )
+    features, targets = [], []
+    for index, label in enumerate(labels):
+        paths = []
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(glob.glob(os.path.join(corpus_dir, label, pattern)))
+        for path in sorted(paths):
+            features.append(thumbnail(np.asarray(Image.open(path).convert("RGB"))))
+            targets.append(index)
+    if not features:
+        return None, None, labels
+    return np.stack(features), np.array(targets), labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bộ phân loại màn hình thuần NumPy")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = commands.add_parser("train", help="Train model từ corpus đã gán nhãn")
+    train_parser.add_argument("corpus", help="Thư mục corpus (mỗi thư mục con = 1 nhãn)")
+    train_parser.add_argument("-o", "--output", default=CLASSIFIER_FILE, help="File model .npz")
+    train_parser.add_argument("--kind", choices=MODEL_KINDS, default="logistic")
+    train_parser.add_argument("--epochs", type=int, default=300)
+    train_parser.add_argument("--learning-rate", type=float, default=0.5)
+    train_parser.add_argument("--l2", type=float, default=1e-3)
+    train_parser.add_argument(
+        "--holdout", type=float, default=0.2, help="Tỷ lệ ảnh giữ lại để đánh giá (0 = không)"
+    )
+
+    predict_parser = commands.add_parser("predict", help="Dự đoán nhãn của screenshot")
+    predict_parser.add_argument("images", nargs="+")
+    predict_parser.add_argument("-m", "--model", default=CLASSIFIER_FILE)
+    args = parser.parse_args()
+
+    if args.command == "predict":
+        from PIL import Image
+
+        classifier = ScreenClassifier.load(args.model)
+        for path in args.images:
+            label, confidence = classifier.predict(np.asarray(Image.open(path).convert("RGB")))
+            print(f"{path}: {label} ({confidence*100:.1f}%)")
+        return
+
+    print("🧠 TRAIN BỘ PHÂN LOẠI MÀN HÌNH")
+    print("=" * 60)
+    x, y, labels = load_corpus(args.corpus)
+    if x is None:
+        print(f"❌ Không tìm thấy screenshot trong: {args.corpus}")
+        return
+    for index, label in enumerate(labels):
+        print(f"   - {label}: {int(np.sum(y == index))} ảnh")
+
+    # Đánh giá trên phần holdout (chia ngẫu nhiên cố định), sau đó train lại trên toàn bộ
+    if args.holdout > 0 and len(y) >= 2 * len(labels):
+        order = np.random.default_rng(0).permutation(len(y))
+        split = max(1, int(len(y) * args.holdout))
+        test, train_idx = order[:split], order[split:]
+        if len(np.unique(y[train_idx])) == len(labels):
+            model = train(
+                x[train_idx], y[train_idx], labels, args.kind, args.epochs, args.learning_rate, args.l2
+            )
+            proba = softmax(model.logits((x[test] - model.mean) / model.std))
+            predicted = proba.argmax(axis=1)
+            confidence = proba.max(axis=1)
+            print(f"📊 Holdout {len(test)} ảnh: accuracy {np.mean(predicted == y[test])*100:.1f}%")
+            for threshold in (0.9, 0.95, 0.99):
+                confident = confidence >= threshold
+                if confident.any():
+                    print(
+                        f"   confidence >= {threshold:.2f}: {confident.mean()*100:.0f}% ảnh,"
+                        f" accuracy {np.mean(predicted[confident] == y[test][confident])*100:.1f}%"
+                    )
+
+    model = train(x, y, labels, args.kind, args.epochs, args.learning_rate, args.l2)
+    model.save(args.output)
+    print(f"💾 Đã lưu model {args.kind} ({len(labels)} nhãn): {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Nhận diện màn hình bằng perceptual hash (dHash) + BK-tree
+
+Mỗi màn hình đã biết (map, popup kho báu, hộp thoại đào, đếm ngược, nhận thưởng...)
+được lưu dưới dạng dHash của frame thu nhỏ, nhãn là tên pixel pattern của bước
+tương ứng (step3_dig, step4, step5...) hoặc tên tự đặt (vd: map_idle). Frame mới được
+nhận diện bằng tìm hash gần nhất (khoảng cách Hamming) trong BK-tree - vài chục µs,
+chạy trước mọi bước check pattern hay OCR.
+
+Cách dùng:
+    # Tạo index từ corpus screenshot (mỗi thư mục con = 1 nhãn, giống extract_pixel_patterns.py)
+    python3 screen_index.py build corpus/
+    # Nhận diện 1 screenshot
+    python3 screen_index.py identify screenshot.png
+
+GameMonitor(screen_index_file=...) dùng index này và tự bổ sung hash mỗi khi 1 pattern
+được xác nhận bằng pixel check.
+"""
+
+import argparse
+import glob
+import json
+import os
+from collections import namedtuple
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SCREEN_INDEX_FILE = os.path.expanduser("~/.lastwar_monitor_screens.json")
+DEFAULT_HASH_SIZE = 16  # Hash 16x16 = 256 bit
+DEFAULT_MAX_DISTANCE = 24  # Khoảng cách Hamming tối đa để coi là cùng màn hình (~9%)
+DEDUPE_DISTANCE = 4  # Không thêm hash gần hash cùng nhãn đã có hơn mức này
+# Nhãn gần nhất phải gần hơn nhãn khác gần thứ 2 ít nhất N bit mới coi là chắc chắn
+# (vd popup đè lên cùng 1 map chỉ khác map vài bit => không đủ chắc để kết luận)
+DEFAULT_MIN_MARGIN = 8
+SAMPLES_PER_CELL = 4  # Số điểm mẫu mỗi chiều của 1 ô hash (lấy trung bình)
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg")
+
+# margin: khoảng cách tới nhãn khác gần nhất trừ distance (None = không có nhãn khác đủ gần)
+ScreenMatch = namedtuple("ScreenMatch", "label distance margin", defaults=(None,))
+
+
+def dhash(frame, hash_size=DEFAULT_HASH_SIZE):
+    """dHash của frame (H, W, >=3): so sánh độ sáng các ô liền kề theo chiều ngang
+
+    Frame được lấy mẫu thưa thành lưới (hash_size x hash_size+1) ô, mỗi ô là trung bình
+    SAMPLES_PER_CELL^2 điểm => không cần resize cả ảnh, không phụ thuộc độ phân giải.
+
+    Returns:
+        Hash dạng int (hash_size^2 bit)
+    """
+    height, width = frame.shape[:2]
+    rows = hash_size * SAMPLES_PER_CELL
+    cols = (hash_size + 1) * SAMPLES_PER_CELL
+    ys = ((np.arange(rows) + 0.5) * height / rows).astype(np.intp)
+    xs = ((np.arange(cols) + 0.5) * width / cols).astype(np.intp)
+
+    # take() theo từng trục nhanh hơn fancy index 2 chiều; tổng thay cho trung bình (cùng thứ tự)
+    sample = frame.take(ys, axis=0).take(xs, axis=1)
+    gray = sample[..., 0].astype(np.uint16) + sample[..., 1] + sample[..., 2]
+    cells = (
+        gray.reshape(hash_size, SAMPLES_PER_CELL, hash_size + 1, SAMPLES_PER_CELL)
+        .sum(axis=3)
+        .sum(axis=1)
+    )
+    bits = cells[:, 1:] > cells[:, :-1]
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def hamming(a, b):
+    """Khoảng cách Hamming giữa 2 hash"""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """BK-tree theo khoảng cách Hamming: tìm mọi hash trong bán kính d mà không duyệt hết
+
+    Mỗi node là [hash, labels, children] với children: khoảng cách -> node con.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, label):
+        """Thêm hash với nhãn (hash trùng thì gộp nhãn)"""
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [label], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                if label not in node[1]:
+                    node[1].append(label)
+                self.size -= 1
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [label], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Các (distance, hash, labels) trong bán kính max_distance, sắp xếp theo distance"""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[0], node[1]))
+            # Bất đẳng thức tam giác: chỉ nhánh có khoảng cách trong [d - r, d + r] mới có thể khớp
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in node[2].items() if low <= d <= high)
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def items(self):
+        """Duyệt mọi (hash, label)"""
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            for label in node[1]:
+                yield node[0], label
+            stack.extend(node[2].values())
+
+
+class ScreenIndex:
+    """Index hash màn hình đã biết -> nhãn, lưu/đọc dạng JSON"""
+
+    def __init__(
+        self,
+        hash_size=DEFAULT_HASH_SIZE,
+        max_distance=DEFAULT_MAX_DISTANCE,
+        min_margin=DEFAULT_MIN_MARGIN,
+    ):
+        self.hash_size = hash_size
+        self.max_distance = max_distance
+        self.min_margin = min_margin
+        self.tree = BKTree()
+        self.labels = set()
+        self.dirty = False  # Có hash mới chưa lưu
+
+    def __len__(self):
+        return self.tree.size
+
+    def hash_frame(self, frame):
+        return dhash(frame, self.hash_size)
+
+    def add(self, value, label):
+        """Thêm hash, bỏ qua nếu đã có hash cùng nhãn rất gần (tránh index phình to)
+
+        Returns:
+            True nếu đã thêm
+        """
+        for _, _, labels in self.tree.search(value, DEDUPE_DISTANCE):
+            if label in labels:
+                return False
+        self.tree.add(value, label)
+        self.labels.add(label)
+        self.dirty = True
+        return True
+
+    def identify_hash(self, value, max_distance=None, min_margin=None):
+        """Nhãn của hash gần nhất trong bán kính max_distance
+
+        Returns:
+            ScreenMatch(label, distance, margin), label = None nếu không có hash nào đủ gần
+            hoặc nhãn khác gần thứ 2 không xa hơn ít nhất min_margin bit (không chắc chắn)
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        if min_margin is None:
+            min_margin = self.min_margin
+        # Tìm rộng thêm min_margin để thấy cả nhãn cạnh tranh nằm ngay ngoài bán kính
+        results = self.tree.search(value, max_distance + min_margin)
+        if not results or results[0][0] > max_distance:
+            return ScreenMatch(None, results[0][0] if results else None)
+
+        best_distance = results[0][0]
+        nearest = {label for d, _, labels in results if d == best_distance for label in labels}
+        if len(nearest) != 1:
+            return ScreenMatch(None, best_distance, 0)
+        label = nearest.pop()
+        margin = next(
+            (d - best_distance for d, _, labels in results if set(labels) - {label}), None
+        )
+        if margin is not None and margin < min_margin:
+            return ScreenMatch(None, best_distance, margin)
+        return ScreenMatch(label, best_distance, margin)
+
+    def identify(self, frame, max_distance=None):
+        """Nhận diện frame numpy (H, W, >=3)"""
+        return self.identify_hash(self.hash_frame(frame), max_distance)
+
+    def save(self, path=SCREEN_INDEX_FILE):
+        data = {
+            "version": 1,
+            "hash_size": self.hash_size,
+            "max_distance": self.max_distance,
+            "min_margin": self.min_margin,
+            "screens": [
+                {"label": label, "hash": f"{value:x}"} for value, label in self.tree.items()
+            ],
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path=SCREEN_INDEX_FILE):
+        """Load index từ file JSON (file chưa có => index rỗng)"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r") as f:
+            data = json.load(f)
+        index = cls(
+            data.get("hash_size", DEFAULT_HASH_SIZE),
+            data.get("max_distance", DEFAULT_MAX_DISTANCE),
+            data.get("min_margin", DEFAULT_MIN_MARGIN),
+        )
+        for screen in data.get("screens", []):
+            index.tree.add(int(screen["hash"], 16), screen["label"])
+            index.labels.add(screen["label"])
+        return index
+
+
+def load_image_array(path):
+    from PIL import Image
+
+    return np.asarray(Image.open(path).convert("RGB"))
+
+
+def build_index(corpus_dir, index):
+    """Thêm hash mọi screenshot trong corpus (mỗi thư mục con = 1 nhãn)
+
+    Returns:
+        Dict nhãn -> số hash đã thêm
+    """
+    added = {}
+    for label in sorted(os.listdir(corpus_dir)):
+        folder = os.path.join(corpus_dir, label)
+        if not os.path.isdir(folder):
+            continue
+        paths = []
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(glob.glob(os.path.join(folder, pattern)))
+        added[label] = sum(
+            index.add(index.hash_frame(load_image_array(path)), label) for path in sorted(paths)
+        )
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index perceptual hash các màn hình game")
+    parser.add_argument("-i", "--index", default=SCREEN_INDEX_FILE, help="File index")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Thêm screenshot từ corpus vào index")
+    build.add_argument("corpus", help="Thư mục corpus (mỗi thư mục con = 1 nhãn)")
+    build.add_argument("--reset", action="store_true", help="Xóa index cũ trước khi thêm")
+
+    identify = commands.add_parser("identify", help="Nhận diện screenshot")
+    identify.add_argument("images", nargs="+")
+    identify.add_argument("--max-distance", type=int, help="Khoảng cách Hamming tối đa")
+    args = parser.parse_args()
+
+    index = ScreenIndex() if getattr(args, "reset", False) else ScreenIndex.load(args.index)
+
+    if args.command == "build":
+        added = build_index(args.corpus, index)
+        for label, count in added.items():
+            print(f"   - {label}: +{count} hash")
+        index.save(args.index)
+        print(f"💾 Đã lưu {len(index)} hash ({len(index.labels)} nhãn): {args.index}")
+        return
+
+    if not len(index):
+        print(f"❌ Index rỗng: {args.index}")
+        return
+    for path in args.images:
+        match = index.identify(load_image_array(path), args.max_distance)
+        margin = "∞" if match.margin is None else match.margin
+        if match.label:
+            print(f"✅ {path}: {match.label} (khoảng cách {match.distance}, cách nhãn khác {margin})")
+        else:
+            print(
+                f"❓ {path}: không nhận diện được (gần nhất: {match.distance}, cách nhãn khác {margin})"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Ghi lại 1 phiên chạy GameMonitor (frame, tap, kết quả OCR, thời gian) để phát lại offline
+
+Định dạng file session (.lws), 1 file duy nhất, đọc bằng mmap:
+
+    [MAGIC 8 bytes]
+    [record ...]                 mỗi record: [tag 4 bytes][độ dài JSON: uint32 LE][JSON]
+                                 META: meta của phiên, EVNT: 1 event,
+                                 FRAM: 1 frame, JSON theo sau là dữ liệu pixel -
+                                   keyframe: nguyên buffer raw (H * W * 4 bytes)
+                                   delta: chỉ các dải hàng thay đổi so với frame trước
+    [index JSON (utf-8)]         danh sách frame (offset, dải hàng) + event + meta
+    [offset index: uint64 LE][MAGIC 8 bytes]
+
+Index + footer chỉ được ghi khi close(). Mỗi record được flush ngay khi ghi nên nếu
+process bị kill / crash giữa chừng, SessionReader dựng lại index bằng cách duyệt các
+record (bỏ record cuối nếu ghi dở).
+
+Dữ liệu pixel không nén (raw) nên bên đọc trả về view numpy trên mmap, không copy:
+keyframe và frame không đổi so với frame trước là zero-copy hoàn toàn; frame delta chỉ
+copy các hàng thay đổi vào buffer làm việc. UI game phần lớn đứng yên giữa các lần chụp
+nên file nhỏ hơn nhiều so với lưu mọi frame.
+
+Cách dùng:
+    GameMonitor(..., record_session="run.lws")   # hoặc RECORD_SESSION trong main()
+    python3 session_recorder.py info run.lws
+    python3 session_recorder.py export run.lws frames/ --every 10
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SESSION_MAGIC = b"LWSESS02"
+FOOTER = struct.Struct("<Q8s")
+RECORD = struct.Struct("<4sI")
+KEYFRAME_INTERVAL = 60  # Ghi keyframe ít nhất mỗi N frame (giới hạn chi phí dựng lại frame)
+KEYFRAME_CHANGE_RATIO = 0.5  # Thay đổi quá tỷ lệ hàng này thì ghi keyframe luôn
+BAND_MERGE_GAP = 8  # Gộp 2 dải hàng thay đổi cách nhau ít hơn N hàng
+
+
+def changed_bands(frame, previous):
+    """Các dải hàng (start, stop) khác nhau giữa 2 frame cùng kích thước"""
+    changed = np.flatnonzero(
+        (frame != previous).reshape(frame.shape[0], -1).any(axis=1)
+    )
+    if len(changed) == 0:
+        return []
+    # Tách thành các dải liên tiếp, gộp khoảng trống nhỏ
+    breaks = np.flatnonzero(np.diff(changed) > BAND_MERGE_GAP)
+    starts = np.concatenate(([changed[0]], changed[breaks + 1]))
+    stops = np.concatenate((changed[breaks], [changed[-1]])) + 1
+    return [(int(a), int(b)) for a, b in zip(starts, stops)]
+
+
+class SessionRecorder:
+    """Ghi frame + event vào file session, an toàn khi gọi từ nhiều thread"""
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(SESSION_MAGIC)
+        self._lock = threading.Lock()
+        self._previous = None  # Frame trước (bản copy) để tính delta
+        self._since_key = 0
+        self.start_time = time.time()
+        self.frames = []
+        self.events = []
+        self.meta = dict(meta or {})
+        self.meta["started_at"] = self.start_time
+        self.bytes_raw = 0  # Tổng kích thước nếu lưu nguyên mọi frame
+        self.closed = False
+        self._write_record(b"META", self.meta)
+        self._file.flush()
+
+    def _write_record(self, tag, header):
+        """Ghi header của 1 record (tag + JSON), trả về offset ngay sau header"""
+        payload = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        self._file.write(RECORD.pack(tag, len(payload)))
+        self._file.write(payload)
+        return self._file.tell()
+
+    def record_frame(self, frame, mode, timestamp=None):
+        """Ghi 1 frame numpy (H, W, 4)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        frame = np.ascontiguousarray(frame)
+        with self._lock:
+            if self.closed:
+                return
+            height, width = frame.shape[:2]
+            entry = {
+                "t": round(timestamp - self.start_time, 4),
+                "width": width,
+                "height": height,
+                "mode": mode,
+            }
+            self.bytes_raw += frame.nbytes
+
+            previous = self._previous
+            same_shape = previous is not None and previous.shape == frame.shape
+            bands = changed_bands(frame, previous) if same_shape else None
+            changed_rows = sum(stop - start for start, stop in bands or [])
+
+            if (
+                bands is None
+                or self._since_key >= KEYFRAME_INTERVAL
+                or changed_rows > height * KEYFRAME_CHANGE_RATIO
+            ):
+                entry["kind"] = "key"
+                entry["offset"] = self._write_record(b"FRAM", entry)
+                self._file.write(frame.tobytes())
+                self._since_key = 0
+                self._previous = frame.copy()
+            else:
+                entry["kind"] = "delta"
+                # Header chỉ có dải hàng, offset của từng dải suy ra được khi đọc lại
+                offset = self._write_record(b"FRAM", dict(entry, bands=bands))
+                entry["bands"] = []
+                for start, stop in bands:
+                    entry["bands"].append([start, stop, offset])
+                    self._file.write(frame[start:stop].tobytes())
+                    self._previous[start:stop] = frame[start:stop]
+                    offset += frame[start:stop].nbytes
+                self._since_key += 1
+            self._file.flush()
+            self.frames.append(entry)
+
+    def record_event(self, kind, **data):
+        """Ghi 1 event (tap, ocr, check, ...) kèm thời điểm tương đối"""
+        with self._lock:
+            if self.closed:
+                return
+            event = {"t": round(time.time() - self.start_time, 4), "type": kind}
+            event.update(data)
+            self._write_record(b"EVNT", event)
+            self._file.flush()
+            self.events.append(event)
+
+    def close(self):
+        """Ghi index + footer và đóng file"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.meta["duration"] = round(time.time() - self.start_time, 3)
+            index_offset = self._file.tell()
+            index = {"version": 1, "meta": self.meta, "frames": self.frames, "events": self.events}
+            self._file.write(json.dumps(index, ensure_ascii=False).encode("utf-8"))
+            self._file.write(FOOTER.pack(index_offset, SESSION_MAGIC))
+            self._file.close()
+
+
+class SessionReader:
+    """Đọc file session qua mmap, trả về frame dạng view numpy không copy
+
+    File chưa được đóng đúng cách (thiếu index) được khôi phục từ các record,
+    khi đó `recovered` = True.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(SESSION_MAGIC)] != SESSION_MAGIC:
+            raise ValueError(f"{path}: không phải file session")
+        magic = None
+        if len(self._mmap) >= len(SESSION_MAGIC) + FOOTER.size:
+            index_offset, magic = FOOTER.unpack_from(self._mmap, len(self._mmap) - FOOTER.size)
+        self.recovered = magic != SESSION_MAGIC
+        if not self.recovered:
+            index = json.loads(
+                self._mmap[index_offset : len(self._mmap) - FOOTER.size].decode("utf-8")
+            )
+        else:
+            index = self._scan_records()
+        self.meta = index["meta"]
+        self.frames = index["frames"]
+        self.events = index["events"]
+        self._buffer = np.frombuffer(self._mmap, dtype=np.uint8)
+        self._work = None  # Buffer dựng frame delta
+        self._work_index = None  # Frame đang nằm trong _work
+
+    def _scan_records(self):
+        """Dựng lại index từ các record (file bị ngắt trước khi close)"""
+        data = self._mmap
+        meta, frames, events = {}, [], []
+        position = len(SESSION_MAGIC)
+        while position + RECORD.size <= len(data):
+            tag, length = RECORD.unpack_from(data, position)
+            start = position + RECORD.size
+            if tag not in (b"META", b"FRAM", b"EVNT") or start + length > len(data):
+                break
+            try:
+                header = json.loads(data[start : start + length].decode("utf-8"))
+            except ValueError:
+                break  # JSON ghi dở
+            position = start + length
+
+            if tag == b"META":
+                meta = header
+            elif tag == b"EVNT":
+                events.append(header)
+            else:
+                row_bytes = header["width"] * 4
+                if header["kind"] == "key":
+                    header["offset"] = position
+                    position += header["height"] * row_bytes
+                else:
+                    bands = []
+                    for band_start, band_stop in header["bands"]:
+                        bands.append([band_start, band_stop, position])
+                        position += (band_stop - band_start) * row_bytes
+                    header["bands"] = bands
+                if position > len(data):
+                    break  # Dữ liệu pixel ghi dở
+                frames.append(header)
+
+        times = [entry["t"] for entry in frames + events]
+        meta["duration"] = max(times, default=0.0)
+        return {"meta": meta, "frames": frames, "events": events}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _key_view(self, entry):
+        size = entry["height"] * entry["width"] * 4
+        return self._buffer[entry["offset"] : entry["offset"] + size].reshape(
+            entry["height"], entry["width"], 4
+        )
+
+    def frame(self, i):
+        """Frame thứ i dạng array (H, W, 4)
+
+        Keyframe và frame không thay đổi trả về view trên mmap (read-only, không copy).
+        Frame delta được dựng trong 1 buffer dùng chung - copy ra nếu cần giữ lại.
+        """
+        # Frame delta không có dải nào = giống frame trước
+        while self.frames[i]["kind"] == "delta" and not self.frames[i]["bands"]:
+            i -= 1
+        entry = self.frames[i]
+        if entry["kind"] == "key":
+            return self._key_view(entry)
+        if self._work_index == i:
+            return self._work
+
+        # Tìm keyframe gốc, dựng tiếp từ frame đang có trong buffer nếu được
+        if self._work_index is not None and self._work_index < i:
+            start = self._work_index + 1
+            if any(self.frames[j]["kind"] == "key" for j in range(start, i)):
+                start = None
+        else:
+            start = None
+        if start is None:
+            key = i
+            while self.frames[key]["kind"] != "key":
+                key -= 1
+            self._work = self._key_view(self.frames[key]).copy()
+            start = key + 1
+
+        width = entry["width"] * 4
+        for j in range(start, i + 1):
+            for row_start, row_stop, offset in self.frames[j].get("bands", ()):
+                rows = row_stop - row_start
+                self._work[row_start:row_stop] = self._buffer[
+                    offset : offset + rows * width
+                ].reshape(rows, entry["width"], 4)
+        self._work_index = i
+        return self._work
+
+    def image(self, i):
+        """Frame thứ i dạng PIL Image (dùng chung buffer)"""
+        from PIL import Image
+
+        entry = self.frames[i]
+        frame = self.frame(i)
+        return Image.frombuffer(
+            entry["mode"], (entry["width"], entry["height"]), frame, "raw", entry["mode"], 0, 1
+        )
+
+    def iter_frames(self):
+        """Duyệt (thời điểm, frame, mode) theo thứ tự ghi"""
+        for i, entry in enumerate(self.frames):
+            yield entry["t"], self.frame(i), entry["mode"]
+
+    def events_of(self, kind):
+        return [event for event in self.events if event["type"] == kind]
+
+    def close(self):
+        self._buffer = None
+        self._work = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # Còn view frame đang được dùng, mmap tự đóng khi view được giải phóng
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xem / xuất file session đã ghi")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="Thống kê session")
+    info.add_argument("session")
+    export = commands.add_parser("export", help="Xuất frame ra PNG (vd: làm corpus)")
+    export.add_argument("session")
+    export.add_argument("output_dir")
+    export.add_argument("--every", type=int, default=1, help="Lấy 1 frame mỗi N frame")
+    args = parser.parse_args()
+
+    reader = SessionReader(args.session)
+    if args.command == "info":
+        keys = sum(1 for entry in reader.frames if entry["kind"] == "key")
+        size = os.path.getsize(args.session)
+        raw = sum(entry["width"] * entry["height"] * 4 for entry in reader.frames)
+        print(f"📼 Session: {args.session}")
+        if reader.recovered:
+            print("   ⚠️  File chưa được đóng đúng cách, đã khôi phục từ các record")
+        print(f"   Thời lượng: {reader.meta.get('duration', 0):.1f}s")
+        print(f"   Frame: {len(reader)} ({keys} keyframe, {len(reader) - keys} delta)")
+        print(f"   Kích thước: {size/1e6:.1f} MB (raw {raw/1e6:.1f} MB, x{raw/max(size, 1):.1f})")
+        counts = {}
+        for event in reader.events:
+            counts[event["type"]] = counts.get(event["type"], 0) + 1
+        for kind, count in sorted(counts.items()):
+            print(f"   Event {kind}: {count}")
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for i in range(0, len(reader), args.every):
+            reader.image(i).convert("RGB").save(os.path.join(args.output_dir, f"frame_{i:06d}.png"))
+        print(f"💾 Đã xuất {len(range(0, len(reader), args.every))} frame vào {args.output_dir}")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
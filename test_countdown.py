@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test cho đồng hồ đếm ngược bước 5 - parse_countdown và estimate_countdown_end
+"""
+
+import sys
+
+import pytest
+
+import monitor_game
+from monitor_game import COUNTDOWN_MAX_DRIFT, GameMonitor, parse_countdown
+from workflow import Workflow
+
+REGION = {"top": "30%", "left": "30%", "width": "40%", "height": "5%"}
+
+
+def test_parse_minutes_seconds():
+    assert parse_countdown("09:41") == 9 * 60 + 41
+    assert parse_countdown("0:05") == 5
+    assert parse_countdown(" 12 : 00 \n") == 720  # Tesseract hay chèn khoảng trắng
+    assert parse_countdown("59:59") == 59 * 60 + 59
+
+
+def test_parse_hours_minutes_seconds():
+    assert parse_countdown("1:02:03") == 3600 + 2 * 60 + 3
+    assert parse_countdown("10:00:00") == 36000
+    assert parse_countdown("00:59:59") == 59 * 60 + 59
+
+
+def test_parse_rejects_out_of_range_and_garbage():
+    assert parse_countdown("09:60") is None
+    assert parse_countdown("60:00") is None
+    assert parse_countdown("1:60:00") is None
+    assert parse_countdown("1:00:60") is None
+    assert parse_countdown("") is None
+    assert parse_countdown(None) is None
+    assert parse_countdown("0941") is None
+
+
+def make_monitor(results, countdown=True, **options):
+    """Monitor có read_countdown trả lần lượt các (giây còn lại, thời điểm chụp) cho trước"""
+    step5 = {"tap": [10, 10]}
+    if countdown:
+        step5["countdown"] = dict({"region": REGION, "read_interval": 0}, **options)
+    steps = {name: {"tap": [10, 10]} for name in ("step2", "step3", "step4", "reset")}
+    steps["step5"] = step5
+    workflow = Workflow(
+        {
+            "targets": ["Dig Up Treasure"],
+            "patterns": {"step4": [{"coord": [10, 10], "color": "#10B2FB"}]},
+            "steps": steps,
+        }
+    )
+    monitor = GameMonitor("test", workflow.targets, workflow=workflow)
+    monitor.get_screen_size = lambda: (1080, 2400)
+    pending = list(results)
+    monitor.read_countdown = lambda: pending.pop(0)
+    monitor.pending_reads = pending
+    return monitor
+
+
+@pytest.fixture(autouse=True)
+def ocr_available(monkeypatch):
+    # read_countdown được thay bằng stub nên không cần Tesseract thật
+    monkeypatch.setattr(monitor_game, "OCR_AVAILABLE", True)
+
+
+def test_estimate_agreeing_reads_takes_earliest_end():
+    monitor = make_monitor([(100, 1000.0), (99, 1001.5)])
+    assert monitor.estimate_countdown_end() == 1100.0
+    assert monitor.pending_reads == []
+
+    # Lần đọc hỏng bị bỏ qua, các lần còn lại vẫn khớp nhau
+    monitor = make_monitor([(None, 1000.0), (60, 1001.0), (59, 1002.0)], reads=3)
+    assert monitor.estimate_countdown_end() == 1061.0
+
+
+def test_estimate_disagreeing_reads_rejected():
+    # Lần 2 đọc sai 1 chữ số => thời điểm kết thúc lệch quá max_drift
+    monitor = make_monitor([(100, 1000.0), (95, 1001.0)])
+    assert 1100.0 - 1096.0 > COUNTDOWN_MAX_DRIFT
+    assert monitor.estimate_countdown_end() is None
+
+    monitor = make_monitor([(100, 1000.0), (95, 1001.0)], max_drift=5)
+    assert monitor.estimate_countdown_end() == 1096.0
+
+
+def test_estimate_without_reads_or_config():
+    assert make_monitor([(None, 1000.0), (None, 1001.0)]).estimate_countdown_end() is None
+
+    monitor = make_monitor([(100, 1000.0)], countdown=False)
+    assert monitor.estimate_countdown_end() is None
+    assert monitor.pending_reads == [(100, 1000.0)]  # Không cấu hình countdown => không chụp
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
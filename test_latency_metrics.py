@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test cho latency_metrics - bucket HDR, count_below và đếm tham chiếu endpoint/snapshot
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+from latency_metrics import (
+    HISTOGRAM_HALF,
+    LatencyHistogram,
+    LatencyMetrics,
+    bucket_bounds,
+    bucket_index,
+)
+
+VALUES = list(range(0, 300)) + [1000, 4095, 4096, 65535, 1_000_000, 123_456_789]
+
+
+def test_bucket_index_is_monotonic_and_bounds_contain_value():
+    previous = -1
+    for value in range(0, 20000):
+        index = bucket_index(value)
+        assert index >= previous, value
+        previous = index
+    for value in VALUES:
+        low, high = bucket_bounds(bucket_index(value))
+        assert low <= value < high, (value, low, high)
+
+
+def test_bucket_bounds_are_contiguous():
+    # Bucket liền nhau không chồng, không hở
+    for index in range(0, 40 * HISTOGRAM_HALF):
+        assert bucket_bounds(index)[1] == bucket_bounds(index + 1)[0], index
+        assert bucket_index(bucket_bounds(index)[0]) == index
+
+
+def test_bucket_relative_error():
+    # Giá trị nhỏ được lưu chính xác, còn lại độ rộng bucket <= 1/HISTOGRAM_HALF giá trị
+    for value in range(0, 2 * HISTOGRAM_HALF):
+        assert bucket_bounds(bucket_index(value)) == (value, value + 1)
+    for value in VALUES:
+        low, high = bucket_bounds(bucket_index(value))
+        assert (high - low) <= max(1, low / HISTOGRAM_HALF), value
+
+
+def test_count_below():
+    histogram = LatencyHistogram()
+    for micros in (100, 100, 900, 5000, 250_000):
+        histogram.record(micros)
+    assert histogram.count_below(0) == 0
+    assert histogram.count_below(1000) == 3
+    assert histogram.count_below(5000) == 3  # Bucket chứa 5000 có cận trên > 5000
+    assert histogram.count_below(10_000) == 4
+    assert histogram.count_below(10_000_000) == 5
+    # Bucket chính xác (< 2 * HISTOGRAM_HALF) tính cả giá trị bằng đúng cận
+    histogram = LatencyHistogram()
+    histogram.record(10)
+    assert histogram.count_below(10) == 1
+    assert histogram.count_below(9) == 0
+
+
+def test_shared_metrics_only_last_owner_stops():
+    metrics = LatencyMetrics()
+    handle, path = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    os.remove(path)
+    try:
+        address = metrics.serve(0)
+        assert metrics.serve(0) == address  # Monitor thứ 2 dùng chung endpoint
+        metrics.start_snapshots(path, interval=3600)
+        metrics.start_snapshots(path, interval=3600)
+
+        metrics.stop_server()
+        metrics.stop_snapshots()
+        assert metrics._server is not None, "monitor đầu tiên dừng không được đóng endpoint"
+        assert metrics._snapshot_thread is not None
+        assert not os.path.exists(path)
+
+        metrics.record("ocr", 0.01, "dev")
+        metrics.stop_server()
+        metrics.stop_snapshots()
+        assert metrics._server is None
+        assert metrics._snapshot_thread is None
+        with open(path) as f:
+            assert json.load(f)["stages"][0]["stage"] == "ocr"
+
+        # Trả thừa không làm hỏng lần dùng sau
+        metrics.stop_server()
+        metrics.serve(0)
+        metrics.stop()
+        assert metrics._server is None
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
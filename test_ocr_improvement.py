@@ -2,118 +2,339 @@
 # -*- coding: utf-8 -*-
 
 """
-Script test để kiểm tra cải tiến OCR
+Đánh giá hàng loạt cấu hình OCR: độ chính xác phát hiện target vs thời gian mỗi frame
+
+Chạy mọi tổ hợp tiền xử lý (contrast, sharpen, nhị phân hóa, scale) x cấu hình Tesseract
+(PSM, OEM, whitelist ký tự, user-words) trên corpus screenshot đã gán nhãn, song song trên
+mọi core, rồi in bảng Pareto (các cấu hình không bị cấu hình khác vừa chính xác hơn vừa
+nhanh hơn). Chọn mặc định cho get_screen_content_ocr từ bảng này thay vì đoán.
+
+Corpus giống benchmark_ocr_scale.py: ảnh + labels.json
+    {"001.png": {"targets": ["Dig Up Treasure"]}, "002.png": {"targets": []}, ...}
+Vùng OCR lấy theo workflow (như GameMonitor).
+
+Cách dùng:
+    python3 test_ocr_improvement.py corpus/
+    python3 test_ocr_improvement.py corpus/ --psm 6 7 11 --scale 1.0 0.5 --binarize none otsu
+    python3 test_ocr_improvement.py corpus/ --user-words no yes --jobs 8 --json matrix.json
 """
 
-import subprocess
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import namedtuple
+
 from PIL import Image, ImageEnhance
-import pytesseract
-import numpy as np
 
+try:
+    import numpy as np
+    import pytesseract
 
-def test_ocr():
-    print("🔍 Kiểm tra cải tiến OCR...")
-    print("=" * 60)
+    OCR_AVAILABLE = True
+except ImportError:
+    OCR_AVAILABLE = False
 
-    # Chụp screenshot
-    print("\n1️⃣ Chụp screenshot...")
-    subprocess.run(
-        "adb shell screencap -p /sdcard/screenshot.png", shell=True, check=True
-    )
-    subprocess.run(
-        "adb pull /sdcard/screenshot.png /tmp/screenshot.png 2>/dev/null",
-        shell=True,
-        check=True,
-    )
-    print("✅ Đã chụp screenshot")
-
-    # Load image
-    img = Image.open("/tmp/screenshot.png")
-    width, height = img.size
-    print(f"📐 Kích thước: {width}x{height}px")
-
-    # Crop vùng OCR (70% phần dưới)
-    top = int(height * 0.7)
-    img_crop = img.crop((0, top, width, height))
-    print(f"✂️  Đã crop vùng OCR: (0,{top}) -> ({width},{height})")
-
-    # Preprocessing
-    print("\n2️⃣ Preprocessing ảnh...")
-
-    # Grayscale
-    img_gray = img_crop.convert("L")
-    print("   ✅ Chuyển sang grayscale")
-
-    # Tăng contrast
-    img_array = np.array(img_gray)
-    img_array = np.clip(img_array * 1.2, 0, 255).astype(np.uint8)
-    img_enhanced = Image.fromarray(img_array)
-    print("   ✅ Tăng contrast")
-
-    # Sharpen
-    sharpener = ImageEnhance.Sharpness(img_enhanced)
-    img_final = sharpener.enhance(2.0)
-    print("   ✅ Sharpen")
-
-    # Lưu ảnh để xem
-    img_final.save("/tmp/ocr_test_preprocessed.png")
-    print(f"\n💾 Đã lưu ảnh preprocessing: /tmp/ocr_test_preprocessed.png")
-
-    # Test với nhiều PSM modes
-    print("\n3️⃣ Thử nhiều PSM modes...")
-    print("=" * 60)
-
-    psm_modes = [
-        ("--oem 3 --psm 6", "Single uniform block"),
-        ("--oem 3 --psm 11", "Sparse text"),
-        ("--oem 3 --psm 3", "Fully automatic"),
+from benchmark_ocr_scale import load_corpus, percentile
+from ocr_profile import target_words, whitelist_chars
+from text_matcher import TargetMatcher
+from workflow import WorkflowError, load_workflow
+
+Preprocess = namedtuple("Preprocess", "contrast sharpen binarize scale")
+TesseractConfig = namedtuple("TesseractConfig", "psm oem whitelist user_words")
+
+DEFAULT_MAX_EDITS = 2  # Giống OCR_MAX_TOKEN_EDITS của monitor_game
+ACCURACY_TOLERANCE = 0.01  # Cấu hình đề xuất: nhanh nhất trong khoảng 1% so với chính xác nhất
+
+_worker = {}  # Trạng thái của mỗi process worker (ảnh đã crop, matcher, ...)
+
+
+def otsu_threshold(gray):
+    """Ngưỡng Otsu của ảnh xám uint8 (tối đa phương sai giữa 2 lớp)"""
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = gray.size
+    weight_bg = np.cumsum(histogram)
+    weight_fg = total - weight_bg
+    cumulative = np.cumsum(histogram * np.arange(256))
+    mean_bg = cumulative / np.maximum(weight_bg, 1)
+    mean_fg = (cumulative[-1] - cumulative) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+def preprocess_image(crop, preprocess):
+    """Crop RGB(A) -> grayscale -> resize -> contrast -> sharpen -> nhị phân hóa (tùy chọn)
+
+    Với contrast 1.2, sharpen 2.0, không nhị phân, scale 1.0 là đúng pipeline hiện tại
+    của GameMonitor.
+    """
+    gray = crop.convert("L")
+    if preprocess.scale != 1.0:
+        size = (
+            max(1, int(round(gray.width * preprocess.scale))),
+            max(1, int(round(gray.height * preprocess.scale))),
+        )
+        gray = gray.resize(size, Image.Resampling.BOX)
+    if preprocess.contrast != 1.0:
+        array = np.clip(np.asarray(gray) * preprocess.contrast, 0, 255).astype(np.uint8)
+        gray = Image.fromarray(array)
+    if preprocess.sharpen != 1.0:
+        gray = ImageEnhance.Sharpness(gray).enhance(preprocess.sharpen)
+    if preprocess.binarize != "none":
+        array = np.asarray(gray)
+        threshold = (
+            otsu_threshold(array) if preprocess.binarize == "otsu" else int(preprocess.binarize)
+        )
+        gray = Image.fromarray(np.where(array > threshold, 255, 0).astype(np.uint8))
+    return gray
+
+
+def tesseract_args(config, whitelist, user_words_path):
+    """Chuỗi config Tesseract của 1 cấu hình"""
+    args = [f"--oem {config.oem}", f"--psm {config.psm}"]
+    if config.user_words:
+        args.append(f"--user-words {user_words_path}")
+    if config.whitelist != "none":
+        chars = whitelist if config.whitelist == "targets" else config.whitelist
+        args.append(f"-c tessedit_char_whitelist={chars}")
+    return " ".join(args)
+
+
+def init_worker(items, targets, max_edits, configs, whitelist, user_words_path):
+    # Mỗi worker chỉ chạy 1 luồng Tesseract để đo đúng ms/frame khi chạy song song
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    _worker["items"] = items
+    _worker["matcher"] = TargetMatcher(targets, max_edits=max_edits)
+    _worker["configs"] = [
+        tesseract_args(config, whitelist, user_words_path) for config in configs
     ]
+    _worker["crop"] = (None, None)  # (index ảnh, crop) - task được xếp theo ảnh
+
+
+def evaluate_task(task):
+    """OCR 1 ảnh với 1 cách tiền xử lý và mọi cấu hình Tesseract
+
+    Returns:
+        (pre_index, image_index, preprocess_ms, [(ocr_ms, targets tìm thấy), ...])
+    """
+    pre_index, preprocess, image_index = task
+    cached_index, crop = _worker["crop"]
+    if cached_index != image_index:
+        path, box = _worker["items"][image_index]
+        crop = Image.open(path).convert("RGB").crop(box)
+        _worker["crop"] = (image_index, crop)
 
-    results = {}
+    start = time.perf_counter()
+    processed = preprocess_image(crop, preprocess)
+    preprocess_ms = (time.perf_counter() - start) * 1000
 
-    for config, desc in psm_modes:
-        print(f"\n📝 Mode: {desc} ({config})")
+    results = []
+    for config in _worker["configs"]:
+        start = time.perf_counter()
         try:
-            text = pytesseract.image_to_string(img_final, lang="eng", config=config)
-            results[desc] = text
+            text = pytesseract.image_to_string(processed, lang="eng", config=config)
+        except Exception:
+            text = ""
+        ocr_ms = (time.perf_counter() - start) * 1000
+        results.append((ocr_ms, _worker["matcher"].search_text(text)))
+    return pre_index, image_index, preprocess_ms, results
 
-            # Hiển thị kết quả
-            print(f"   Text nhận được ({len(text)} chars):")
-            print("   " + "-" * 56)
-            for line in text.strip().split("\n")[:10]:  # Chỉ hiển thị 10 dòng đầu
-                print(f"   {line}")
-            print("   " + "-" * 56)
 
-            # Kiểm tra target texts
-            target_texts = ["Test Flight Failure", "Dig Up Treasure"]
-            found = []
-            for target in target_texts:
-                if target.lower() in text.lower():
-                    found.append(target)
+def pareto_front(rows):
+    """Các dòng không bị dòng khác trội hơn (accuracy cao hơn hoặc bằng mà nhanh hơn)
 
-            if found:
-                print(f"   ✅ Tìm thấy: {', '.join(found)}")
-            else:
-                print(f"   ❌ Không tìm thấy target texts")
+    Returns:
+        List dòng trên front, sắp xếp theo ms tăng dần
+    """
+    front = []
+    best_accuracy = -1.0
+    for row in sorted(rows, key=lambda r: (r["ms_mean"], -r["accuracy"])):
+        if row["accuracy"] > best_accuracy:
+            front.append(row)
+            best_accuracy = row["accuracy"]
+    return front
 
-        except Exception as e:
-            print(f"   ❌ Lỗi: {e}")
 
-    # So sánh
-    print("\n" + "=" * 60)
-    print("📊 KẾT QUẢ TỔNG HỢP:")
-    print("=" * 60)
+def parse_binarize(value):
+    if value in ("none", "otsu"):
+        return value
+    threshold = int(value)
+    if not 0 <= threshold <= 255:
+        raise argparse.ArgumentTypeError("ngưỡng nhị phân phải trong 0-255")
+    return str(threshold)
 
-    for desc, text in results.items():
-        target_texts = ["Test Flight Failure", "Dig Up Treasure"]
-        found = [t for t in target_texts if t.lower() in text.lower()]
 
-        status = "✅" if found else "❌"
-        print(f"{status} {desc:30s} - Tìm thấy: {found if found else 'Không có'}")
+def parse_yes_no(value):
+    if value not in ("yes", "no"):
+        raise argparse.ArgumentTypeError("chỉ nhận yes/no")
+    return value == "yes"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ma trận độ chính xác vs độ trễ của cấu hình OCR")
+    parser.add_argument("corpus", help="Thư mục screenshot + labels.json")
+    parser.add_argument("--workflow", help="File workflow (vùng OCR, targets)")
+    parser.add_argument("--targets", nargs="+", help="Target texts (mặc định theo workflow)")
+    parser.add_argument("--contrast", nargs="+", type=float, default=[1.0, 1.2, 1.5])
+    parser.add_argument("--sharpen", nargs="+", type=float, default=[1.0, 2.0])
+    parser.add_argument(
+        "--binarize", nargs="+", type=parse_binarize, default=["none", "otsu"],
+        help="none, otsu hoặc ngưỡng cố định 0-255",
+    )
+    parser.add_argument("--scale", nargs="+", type=float, default=[1.0, 0.75, 0.5])
+    parser.add_argument("--psm", nargs="+", type=int, default=[6, 11, 3])
+    parser.add_argument("--oem", nargs="+", type=int, default=[3])
+    parser.add_argument(
+        "--whitelist", nargs="+", default=["none", "targets"],
+        help="none, targets (ký tự của target) hoặc chuỗi ký tự",
+    )
+    parser.add_argument("--user-words", nargs="+", type=parse_yes_no, default=[False])
+    parser.add_argument("--max-edits", type=int, default=DEFAULT_MAX_EDITS)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Số process")
+    parser.add_argument("--top", type=int, default=10, help="Số cấu hình chính xác nhất cần in thêm")
+    parser.add_argument("--json", help="Lưu kết quả mọi cấu hình ra file JSON")
+    args = parser.parse_args()
+
+    if not OCR_AVAILABLE:
+        print("❌ Cần cài numpy, Pillow và pytesseract (pip install -r requirements.txt)")
+        return
+    try:
+        print(f"🔧 Tesseract {pytesseract.get_tesseract_version()}")
+    except Exception as e:
+        print(f"❌ Không chạy được tesseract: {e}")
+        return
+
+    try:
+        workflow = load_workflow(args.workflow)
+    except WorkflowError as e:
+        print(f"❌ {e}")
+        return
+    targets = args.targets or workflow.targets
+
+    corpus = [(path, label) for path, label in load_corpus(args.corpus) if label]
+    if not corpus:
+        print(f"❌ Không có ảnh đã gán nhãn (labels.json) trong: {args.corpus}")
+        return
+    items = []
+    for path, _ in corpus:
+        with Image.open(path) as img:
+            items.append((path, workflow.plan_for(*img.size).ocr_box))
+
+    preprocesses = [
+        Preprocess(*combo)
+        for combo in itertools.product(args.contrast, args.sharpen, args.binarize, args.scale)
+    ]
+    configs = [
+        TesseractConfig(*combo)
+        for combo in itertools.product(args.psm, args.oem, args.whitelist, args.user_words)
+    ]
+    total = len(preprocesses) * len(configs)
+    print(f"📁 Corpus: {len(corpus)} ảnh có nhãn, targets: {targets}")
+    print(
+        f"🧪 {len(preprocesses)} cách tiền xử lý x {len(configs)} cấu hình Tesseract"
+        f" = {total} tổ hợp, {total * len(corpus)} lần OCR trên {args.jobs} process"
+    )
+    print("=" * 100)
+
+    user_words_path = None
+    if any(args.user_words):
+        words = target_words(targets)
+        handle, user_words_path = tempfile.mkstemp(prefix="ocr_user_words_", suffix=".txt")
+        with os.fdopen(handle, "w") as f:
+            f.write("\n".join(words) + "\n")
+
+    # Xếp task theo ảnh để mỗi worker crop 1 ảnh 1 lần cho mọi cách tiền xử lý
+    tasks = [
+        (pre_index, preprocess, image_index)
+        for image_index in range(len(items))
+        for pre_index, preprocess in enumerate(preprocesses)
+    ]
+    timings = {}  # (pre_index, config_index) -> [ms/frame]
+    found = {}  # (pre_index, config_index) -> [targets tìm thấy theo ảnh]
+    start = time.perf_counter()
+    with multiprocessing.Pool(
+        args.jobs,
+        initializer=init_worker,
+        initargs=(items, targets, args.max_edits, configs, whitelist_chars(targets), user_words_path),
+    ) as pool:
+        done = 0
+        for pre_index, image_index, preprocess_ms, results in pool.imap_unordered(
+            evaluate_task, tasks, chunksize=len(preprocesses)
+        ):
+            for config_index, (ocr_ms, hits) in enumerate(results):
+                key = (pre_index, config_index)
+                timings.setdefault(key, []).append(preprocess_ms + ocr_ms)
+                found.setdefault(key, [None] * len(items))[image_index] = hits
+            done += 1
+            if done % max(1, len(tasks) // 20) == 0 or done == len(tasks):
+                print(f"   ⏳ {done}/{len(tasks)} ({time.perf_counter() - start:.0f}s)", flush=True)
+    if user_words_path:
+        os.remove(user_words_path)
+
+    rows = []
+    for (pre_index, config_index), ms in timings.items():
+        correct = hits_total = expected_total = false_positives = 0
+        for (_, label), hits in zip(corpus, found[(pre_index, config_index)]):
+            expected = set(label["targets"])
+            hits = set(hits)
+            correct += hits == expected
+            hits_total += len(hits & expected)
+            expected_total += len(expected)
+            false_positives += len(hits - expected)
+        rows.append(
+            {
+                "preprocess": preprocesses[pre_index]._asdict(),
+                "tesseract": configs[config_index]._asdict(),
+                "accuracy": correct / len(corpus),
+                "recall": hits_total / expected_total if expected_total else 1.0,
+                "false_positives": false_positives,
+                "ms_mean": sum(ms) / len(ms),
+                "ms_p95": percentile(ms, 95),
+            }
+        )
+
+    def print_rows(title, selected):
+        print(f"\n{title}")
+        print(
+            f"{'Contrast':>8} {'Sharpen':>7} {'Binarize':>8} {'Scale':>5} {'PSM':>4} {'OEM':>4}"
+            f" {'Whitelist':>9} {'Words':>5} {'Accuracy':>9} {'Recall':>7} {'FP':>4} {'ms/frame':>9} {'p95':>8}"
+        )
+        print("-" * 100)
+        for row in selected:
+            p, t = row["preprocess"], row["tesseract"]
+            whitelist = t["whitelist"] if len(t["whitelist"]) <= 9 else t["whitelist"][:8] + "…"
+            print(
+                f"{p['contrast']:>8.2f} {p['sharpen']:>7.2f} {p['binarize']:>8} {p['scale']:>5.2f}"
+                f" {t['psm']:>4} {t['oem']:>4} {whitelist:>9} {'yes' if t['user_words'] else 'no':>5}"
+                f" {row['accuracy']*100:>8.1f}% {row['recall']*100:>6.1f}% {row['false_positives']:>4}"
+                f" {row['ms_mean']:>9.1f} {row['ms_p95']:>8.1f}"
+            )
+
+    front = pareto_front(rows)
+    print_rows("📈 PARETO (độ chính xác vs ms/frame, nhanh -> chậm):", front)
+    ranked = sorted(rows, key=lambda r: (-r["accuracy"], -r["recall"], r["ms_mean"]))
+    print_rows(f"🏆 TOP {args.top} CHÍNH XÁC NHẤT:", ranked[: args.top])
+
+    best = max(row["accuracy"] for row in rows)
+    pick = min(
+        (row for row in rows if row["accuracy"] >= best - ACCURACY_TOLERANCE - 1e-9),
+        key=lambda r: r["ms_mean"],
+    )
+    print("\n" + "=" * 100)
+    print(
+        f"💡 Đề xuất: {dict(pick['preprocess'])} + {dict(pick['tesseract'])}"
+        f" -> accuracy {pick['accuracy']*100:.1f}%, {pick['ms_mean']:.1f} ms/frame"
+    )
+    print(f"⏱️  Tổng thời gian: {time.perf_counter() - start:.1f}s")
 
-    print("\n✨ Hoàn tất kiểm tra!")
-    print(f"📁 Xem ảnh preprocessing tại: /tmp/ocr_test_preprocessed.png")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": len(corpus), "targets": targets, "results": ranked}, f, indent=2)
+        print(f"💾 Đã lưu kết quả: {args.json}")
 
 
 if __name__ == "__main__":
-    test_ocr()
+    main()
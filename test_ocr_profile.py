@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test cho ocr_profile - whitelist, user-words, user-patterns và config Tesseract
+"""
+
+import os
+import shlex
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+from ocr_profile import DICTIONARY_PARAMS, OcrProfile, target_words, whitelist_chars, word_pattern
+
+
+def test_whitelist_chars():
+    assert whitelist_chars(["Dig Up"]) == "DGIPUdgipu"
+    # Dấu câu / số giữ nguyên, khoảng trắng bị bỏ, không lặp ký tự
+    assert whitelist_chars(["A-1 a", "a-1"]) == "-1Aa"
+    assert whitelist_chars([]) == ""
+
+
+def test_target_words():
+    words = target_words(["Dig Up Treasure"])
+    for word in ("Dig", "dig", "DIG", "Up", "up", "UP", "Treasure", "treasure", "TREASURE"):
+        assert word in words, word
+    assert words == sorted(set(words))
+    assert "" not in words
+
+
+def test_word_pattern():
+    assert word_pattern("Dig") == "\\A\\a\\a"
+    assert word_pattern("UP") == "\\A\\A"
+    assert word_pattern("x2") == "\\a\\d"
+    assert word_pattern("a-b") == "\\a\\p\\a"
+    assert word_pattern("a\\b") == "\\a\\\\\\a"
+
+
+def test_config_survives_shlex_split():
+    directory = tempfile.mkdtemp(prefix="ocr profile ")  # Có khoảng trắng trong đường dẫn
+    try:
+        profile = OcrProfile(["Dig Up Treasure", "Don't Stop"], directory=directory)
+        args = shlex.split(profile.config(psm=11, oem=1))
+
+        assert args[args.index("--psm") + 1] == "11"
+        assert args[args.index("--oem") + 1] == "1"
+        assert args[args.index("--user-words") + 1] == profile.user_words_path
+        assert args[args.index("--user-patterns") + 1] == profile.user_patterns_path
+        assert "tessedit_char_whitelist=" + profile.whitelist in args
+        assert "'" in profile.whitelist
+        for name, value in DICTIONARY_PARAMS:
+            assert f"{name}={value}" in args
+
+        with open(profile.user_words_path, encoding="utf-8") as f:
+            assert f.read().split() == profile.words
+        with open(profile.user_patterns_path, encoding="utf-8") as f:
+            assert f.read().split() == profile.patterns
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_profile_path_depends_on_targets():
+    directory = tempfile.mkdtemp()
+    try:
+        first = OcrProfile(["Dig Up Treasure"], directory=directory)
+        same = OcrProfile(["Dig Up Treasure"], directory=directory)
+        other = OcrProfile(["Test Flight Failure"], directory=directory)
+        assert first.user_words_path == same.user_words_path
+        assert first.user_words_path != other.user_words_path
+        assert len(os.listdir(directory)) == 4
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
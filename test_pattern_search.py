@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test cho search_pattern_frames - tìm lại pattern bị dịch vài px và pattern sát mép ảnh
+"""
+
+import sys
+
+import numpy as np
+import pytest
+
+from monitor_game import GameMonitor
+from workflow import Workflow
+
+HEIGHT, WIDTH = 80, 100
+BACKGROUND = 128
+RADIUS = 3
+
+# Pattern: 2 pixel ở giữa, 2 pixel sát mép (màu đen không có trên nền xám)
+PATTERN = [
+    ((1, 1), (255, 0, 0)),
+    ((50, 40), (0, 255, 0)),
+    ((WIDTH - 2, HEIGHT - 2), (0, 0, 255)),
+    ((WIDTH - 1, 0), (0, 0, 0)),
+]
+
+
+def make_monitor(radius=RADIUS):
+    steps = {name: {"tap": [10, 10]} for name in ("step2", "step3", "step4", "step5", "reset")}
+    workflow = Workflow(
+        {
+            "targets": ["Dig Up Treasure"],
+            "patterns": {
+                "step4": [
+                    {"coord": list(coord), "color": "#%02X%02X%02X" % color}
+                    for coord, color in PATTERN
+                ]
+            },
+            "steps": steps,
+        }
+    )
+    return GameMonitor("test", workflow.targets, workflow=workflow, pattern_search_radius=radius)
+
+
+def make_frame(dx=0, dy=0):
+    """Frame RGBA có pattern dịch (dx, dy), pixel dịch ra ngoài ảnh bị mất"""
+    frame = np.full((HEIGHT, WIDTH, 4), BACKGROUND, dtype=np.uint8)
+    for (x, y), color in PATTERN:
+        x, y = x + dx, y + dy
+        if 0 <= x < WIDTH and 0 <= y < HEIGHT:
+            frame[y, x, :3] = color
+    return frame
+
+
+def test_recovers_offset():
+    monitor = make_monitor()
+    frames = np.stack([make_frame(), make_frame(-2, 1), make_frame(-3, -1)])
+    ratios, offsets = monitor.search_pattern_frames("step4", frames)
+
+    # Pixel (1, 1) dịch -2/-3 theo x ra ngoài ảnh, 3 pixel còn lại vẫn tìm thấy
+    assert ratios.tolist() == [1.0, 0.75, 0.5]
+    assert offsets.tolist() == [[0, 0], [-2, 1], [-3, -1]]
+    assert monitor.last_pattern_offset == (-3, -1)
+
+    # Không tìm lệch thì frame bị dịch gần như không khớp
+    exact = make_monitor(radius=0).match_pattern_frames("step4", frames)
+    assert exact[0] == 1.0
+    assert exact[1] == exact[2] == 0.0
+
+
+def test_padded_edge_never_matches():
+    monitor = make_monitor()
+    # Dịch ra phía mép phải/dưới: pixel xanh dương và đen rơi vào vùng pad ngoài ảnh
+    ratios, offsets = monitor.search_pattern_frames("step4", make_frame(2, 1)[None])
+    assert ratios.tolist() == [0.5]
+    assert offsets.tolist() == [[2, 1]]
+
+    # Frame toàn đen: pixel đen ở mép khớp trong ảnh, nhưng không bao giờ khớp vùng pad
+    black = np.zeros((1, HEIGHT, WIDTH, 4), dtype=np.uint8)
+    ratios, offsets = monitor.search_pattern_frames("step4", black)
+    assert ratios.tolist() == [0.25]
+    assert offsets.tolist() == [[0, 0]]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test cho session_recorder - ghi/đọc lại keyframe, delta, frame không đổi và khôi phục sau crash
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+from session_recorder import KEYFRAME_INTERVAL, SessionReader, SessionRecorder
+
+HEIGHT, WIDTH = 64, 48
+
+
+def make_frames():
+    """Chuỗi frame: keyframe, delta nhỏ, frame không đổi, thay đổi lớn (=> keyframe), delta"""
+    rng = np.random.default_rng(7)
+    first = rng.integers(0, 256, (HEIGHT, WIDTH, 4), dtype=np.uint8)
+    frames = [first]
+
+    delta = first.copy()
+    delta[10:14] = 0  # 1 dải nhỏ
+    delta[40:42, 5:9] = 255  # dải thứ 2 cách xa
+    frames.append(delta)
+    frames.append(delta.copy())  # Không đổi
+
+    big = rng.integers(0, 256, (HEIGHT, WIDTH, 4), dtype=np.uint8)
+    frames.append(big)
+
+    small = big.copy()
+    small[HEIGHT - 3 :] = 7
+    frames.append(small)
+    frames.append(small.copy())
+    return frames
+
+
+def record(path, frames, close=True):
+    recorder = SessionRecorder(path, meta={"package": "test"})
+    for i, frame in enumerate(frames):
+        recorder.record_frame(frame, "RGBA", timestamp=recorder.start_time + i * 0.1)
+        recorder.record_event("tap", x=i, y=i)
+    if close:
+        recorder.close()
+    return recorder
+
+
+def temp_session():
+    handle, path = tempfile.mkstemp(suffix=".lws")
+    os.close(handle)
+    return path
+
+
+def test_round_trip_key_delta_unchanged_and_random_access():
+    frames = make_frames()
+    path = temp_session()
+    try:
+        record(path, frames)
+        reader = SessionReader(path)
+        assert not reader.recovered
+        assert len(reader) == len(frames)
+        assert reader.meta["package"] == "test"
+        assert [entry["kind"] for entry in reader.frames] == [
+            "key", "delta", "delta", "key", "delta", "delta",
+        ]
+        assert reader.frames[2]["bands"] == []  # Frame không đổi không lưu pixel nào
+        assert len(reader.frames[1]["bands"]) == 2
+
+        # Truy cập ngẫu nhiên (cả lùi lại trước frame đang dựng trong buffer)
+        for i in (1, 5, 2, 4, 0, 3, 5, 1):
+            assert np.array_equal(reader.frame(i), frames[i]), i
+        assert [t for t, _, _ in reader.iter_frames()] == [
+            round(i * 0.1, 4) for i in range(len(frames))
+        ]
+        assert [event["x"] for event in reader.events_of("tap")] == list(range(len(frames)))
+        reader.close()
+    finally:
+        os.remove(path)
+
+
+def test_keyframe_interval():
+    frame = np.zeros((HEIGHT, WIDTH, 4), dtype=np.uint8)
+    frames = []
+    for i in range(KEYFRAME_INTERVAL + 3):
+        frame = frame.copy()
+        frame[i % HEIGHT] = i % 256
+        frames.append(frame)
+    path = temp_session()
+    try:
+        record(path, frames)
+        reader = SessionReader(path)
+        kinds = [entry["kind"] for entry in reader.frames]
+        assert kinds[0] == kinds[KEYFRAME_INTERVAL + 1] == "key"
+        assert kinds.count("key") == 2
+        assert np.array_equal(reader.frame(len(frames) - 1), frames[-1])
+        reader.close()
+    finally:
+        os.remove(path)
+
+
+def test_recover_without_close():
+    frames = make_frames()
+    path = temp_session()
+    try:
+        recorder = record(path, frames, close=False)
+        # Giả lập crash khi đang ghi event cuối: không có index, record cuối ghi dở
+        recorder._file.close()
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 5)
+
+        reader = SessionReader(path)
+        assert reader.recovered
+        assert reader.meta["package"] == "test"
+        # Event cuối bị cắt, frame cuối vẫn còn đủ
+        assert len(reader) == len(frames)
+        assert len(reader.events) == len(frames) - 1
+        for i in reversed(range(len(frames))):
+            assert np.array_equal(reader.frame(i), frames[i]), i
+        torn_offset = reader.frames[4]["bands"][0][2] + 10
+        reader.close()
+
+        # Cắt giữa dữ liệu pixel của frame delta thứ 4 => mất frame đó và mọi thứ sau nó
+        with open(path, "r+b") as f:
+            f.truncate(torn_offset)
+        reader = SessionReader(path)
+        assert reader.recovered
+        assert len(reader) == 4
+        assert len(reader.events) == 4
+        assert np.array_equal(reader.frame(3), frames[3])
+        reader.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test cho text_matcher - so khớp target với các mẫu OCR đọc sai thực tế
+"""
+
+import sys
+
+import pytest
+
+from text_matcher import TargetMatcher, bounded_edit_distance
+
+TARGETS = ["Dig Up Treasure", "Test Flight Failure"]
+
+# Các mẫu Tesseract đọc sai đã gặp trên màn hình game
+MISREAD_SAMPLES = [
+    ("Dig Up Treasurc", "Dig Up Treasure"),
+    ("Dig Up Treasure,", "Dig Up Treasure"),
+    ("Dlg Up Treasure", "Dig Up Treasure"),
+    ("Dig Up Treasuer", "Dig Up Treasure"),
+    ("DIG UP TREASURE", "Dig Up Treasure"),
+    ("Dig Up Trea5ure", "Dig Up Treasure"),
+    ("Test Fiight Failure", "Test Flight Failure"),
+    ("Test Flight Fallure", "Test Flight Failure"),
+    ("Tesl Flight Failurc", "Test Flight Failure"),
+    ("» Test Flight Failure «", "Test Flight Failure"),
+]
+
+# Text không được phép khớp nhầm
+NEGATIVE_SAMPLES = [
+    "Dig Up",
+    "Treasure Chest",
+    "Big Cup Measure",
+    "Test Fight Fail",
+    "Dig\nUp Treasure",  # Không khớp xuyên dòng
+]
+
+
+def make_ocr_data(lines):
+    """Tạo dữ liệu giống image_to_data: mỗi dòng bắt đầu bằng 1 entry rỗng"""
+    data = {"text": [], "left": [], "top": [], "width": [], "height": [], "conf": []}
+    for row, line in enumerate(lines):
+        entries = [("", 0, -1)]
+        left = 10
+        for word in line.split():
+            entries.append((word, left, 90))
+            left += len(word) * 20 + 10
+        for text, x, conf in entries:
+            data["text"].append(text)
+            data["left"].append(x)
+            data["top"].append(100 + row * 50)
+            data["width"].append(len(text) * 20)
+            data["height"].append(30 if text else 0)
+            data["conf"].append(conf)
+    return data
+
+
+def test_bounded_edit_distance():
+    assert bounded_edit_distance("treasure", "treasure", 2) == 0
+    assert bounded_edit_distance("treasurc", "treasure", 2) == 1
+    assert bounded_edit_distance("treasuer", "treasure", 2) == 2
+    assert bounded_edit_distance("treasure", "measure", 2) == 2
+    assert bounded_edit_distance("treasure", "pleasures", 2) is None
+    assert bounded_edit_distance("dig", "digging", 2) is None
+
+
+def test_misread_samples_match():
+    matcher = TargetMatcher(TARGETS, max_edits=2)
+    for text, expected in MISREAD_SAMPLES:
+        assert matcher.search_text(text) == [expected], text
+
+
+def test_negative_samples_do_not_match():
+    matcher = TargetMatcher(TARGETS, max_edits=2)
+    for text in NEGATIVE_SAMPLES:
+        assert matcher.search_text(text) == [], text
+
+
+def test_exact_mode_rejects_misreads():
+    matcher = TargetMatcher(TARGETS)
+    assert matcher.search_text("Dig Up Treasurc") == []
+    assert matcher.search_text("dig up treasure!") == ["Dig Up Treasure"]
+
+
+def test_ocr_data_hit_has_score_and_center():
+    matcher = TargetMatcher(TARGETS, max_edits=2)
+    data = make_ocr_data(["Reward ready", "Dig Up Treasurc"])
+    hits = matcher.match_ocr_data(data)
+
+    assert len(hits) == 1
+    hit = hits[0]
+    assert hit.target == "Dig Up Treasure"
+    assert 0.8 <= hit.score < 1.0
+    # Box là hợp của 3 từ "Dig", "Up", "Treasurc" ở dòng thứ 2
+    assert hit.box == (10, 150, 10 + 70 + 50 + 160, 180)
+    assert hit.center == ((hit.box[0] + hit.box[2]) // 2, 165)
+
+
+def test_exact_hit_preferred_over_fuzzy():
+    matcher = TargetMatcher(TARGETS, max_edits=2)
+    data = make_ocr_data(["Dig Up Treasurc", "Dig Up Treasure"])
+    hits = matcher.match_ocr_data(data)
+
+    assert [hit.score for hit in hits] == sorted(
+        (hit.score for hit in hits), reverse=True
+    )
+    assert hits[0].score == 1.0
+    assert hits[0].center[1] == 165
+
+
+def test_low_confidence_word_ignored():
+    matcher = TargetMatcher(TARGETS, max_edits=2)
+    data = make_ocr_data(["Dig Up Treasure"])
+    data["conf"][1] = 0
+    assert matcher.match_ocr_data(data) == []
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test cho workflow - chuyển tọa độ pixel / normalized sang pixel của từng thiết bị
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+from workflow import (
+    DEFAULT_WORKFLOW_FILE,
+    Workflow,
+    WorkflowError,
+    load_pattern_file,
+    load_workflow,
+    normalize_patterns,
+)
+
+# Thiết bị có notch: insets (left, top, right, bottom)
+SIZE = (1080, 2400)
+INSETS = (0, 96, 0, 48)
+PIXELS = [(0, 96), (550, 1136), (1079, 2351), (17, 2000)]
+
+
+def make_workflow_data(coordinates="pixels", tap=(540, 1200), patterns=None, **extra):
+    """Workflow tối thiểu hợp lệ: đủ các bước bắt buộc, cùng 1 tọa độ tap"""
+    data = {
+        "targets": ["Dig Up Treasure"],
+        "coordinates": coordinates,
+        "patterns": patterns or {"step4": [{"coord": list(tap), "color": "#10B2FB"}]},
+        "steps": {
+            name: {"tap": list(tap)} for name in ("step2", "step3", "step4", "step5", "reset")
+        },
+    }
+    data.update(extra)
+    return data
+
+
+def write_pattern_file(data, directory=None):
+    handle, path = tempfile.mkstemp(suffix=".json", dir=directory)
+    with os.fdopen(handle, "w") as f:
+        if isinstance(data, str):
+            f.write(data)
+        else:
+            json.dump(data, f)
+    return path
+
+
+def assert_workflow_error(data, expected):
+    """load_workflow phải báo WorkflowError có chứa `expected` và đường dẫn file"""
+    path = write_pattern_file(data)
+    try:
+        load_workflow(path)
+        assert False, f"workflow phải bị từ chối ({expected})"
+    except WorkflowError as e:
+        assert expected in str(e), str(e)
+        assert path in str(e), str(e)
+    finally:
+        os.remove(path)
+
+
+def test_normalized_pattern_round_trip_with_insets():
+    path = write_pattern_file(
+        {
+            "resolution": list(SIZE),
+            "insets": list(INSETS),
+            "patterns": {"p": [{"coord": list(xy), "color": "#FFFFFF"} for xy in PIXELS]},
+        }
+    )
+    try:
+        patterns = load_pattern_file(path, normalized=True)
+    finally:
+        os.remove(path)
+
+    workflow = Workflow(
+        make_workflow_data("normalized", tap=(0.5, 0.5), patterns=patterns)
+    )
+    plan = workflow.plan_for(*SIZE, insets=INSETS)
+    # pixel -> normalized -> plan trên chính thiết bị đó = đúng pixel ban đầu
+    assert [pixel[0] for pixel in plan.patterns["p"].pixels] == PIXELS
+    assert list(plan.patterns["p"].xs) == [x for x, _ in PIXELS]
+
+
+def test_normalized_round_trip_other_insets_stays_in_content():
+    patterns = {"p": [{"coord": [0.0, 0.0], "color": "#FFFFFF"}]}
+    workflow = Workflow(make_workflow_data("normalized", tap=(0.9999, 0.9999), patterns=patterns))
+    plan = workflow.plan_for(1440, 3200, insets=(0, 120, 0, 0))
+    assert plan.patterns["p"].pixels[0][0] == (0, 120)
+    assert plan.steps["step2"]["tap"] == (1439, 3199)
+
+
+def test_pattern_pixel_inside_inset_rejected():
+    path = write_pattern_file(
+        {
+            "resolution": list(SIZE),
+            "insets": list(INSETS),
+            "patterns": {"p": [{"coord": [10, 40], "color": "#FFFFFF"}]},
+        }
+    )
+    try:
+        load_pattern_file(path, normalized=True)
+        assert False, "pixel trong vùng notch phải bị từ chối"
+    except WorkflowError as e:
+        assert "vùng nội dung" in str(e)
+    finally:
+        os.remove(path)
+
+
+def test_resolution_scaling_rounds_to_pixel_centers():
+    workflow = Workflow(make_workflow_data(tap=(1439, 3199), resolution=[1440, 3200]))
+    plan = workflow.plan_for(720, 1600)
+    assert plan.steps["step2"]["tap"] == (719, 1599)
+    plan = workflow.plan_for(1080, 2400)
+    assert plan.steps["step2"]["tap"] == (1079, 2399)
+    assert Workflow(make_workflow_data(tap=(600, 1300), resolution=[1200, 2600])).plan_for(
+        1080, 2340
+    ).steps["step2"]["tap"] == (540, 1170)
+
+
+def test_out_of_range_coordinates_rejected():
+    try:
+        Workflow(make_workflow_data(tap=(1440, 100), resolution=[1440, 3200]))
+        assert False, "tap ngoài resolution phải bị từ chối"
+    except WorkflowError as e:
+        assert "ngoài màn hình" in str(e)
+
+    try:
+        Workflow(make_workflow_data("normalized", tap=(1.0, 0.5)))
+        assert False, "tọa độ normalized 1.0 phải bị từ chối"
+    except WorkflowError:
+        pass
+
+    # Workflow pixel không có resolution: chỉ biết khi compile cho thiết bị
+    workflow = Workflow(make_workflow_data(tap=(1000, 2300)))
+    assert workflow.plan_for(*SIZE).steps["step2"]["tap"] == (1000, 2300)
+    try:
+        workflow.plan_for(720, 1600)
+        assert False, "tap ngoài màn hình thiết bị phải báo lỗi, không kẹp về mép"
+    except WorkflowError as e:
+        assert "ngoài màn hình 720x1600" in str(e)
+
+
+def test_load_workflow_errors():
+    assert_workflow_error("{not json", "Không đọc được workflow")
+    assert_workflow_error(["targets"], "JSON object")
+    assert_workflow_error(make_workflow_data(targets=[]), "targets")
+    assert_workflow_error(make_workflow_data("inches"), "coordinates")
+
+    data = make_workflow_data()
+    del data["steps"]["step4"]
+    assert_workflow_error(data, "Thiếu các bước: ['step4']")
+
+    data = make_workflow_data()
+    data["steps"]["step3"]["pattern"] = "missing"
+    assert_workflow_error(data, "steps.step3.pattern 'missing'")
+
+    data = make_workflow_data()
+    data["steps"]["step2"]["wait_after"] = -1
+    assert_workflow_error(data, "steps.step2.wait_after")
+
+    assert_workflow_error(
+        make_workflow_data(patterns={"p": [{"coord": [1, 2], "color": "blue"}]}), "#RRGGBB"
+    )
+    assert_workflow_error(make_workflow_data(tap=(0.5, 0.5)), "số nguyên")
+    assert_workflow_error(make_workflow_data(resolution=[1080, 0]), "resolution")
+
+    # Lỗi của pattern file chỉ ra chính pattern file
+    path = write_pattern_file(make_workflow_data(pattern_file="missing_patterns.json"))
+    try:
+        load_workflow(path)
+        assert False, "pattern file không tồn tại phải báo lỗi"
+    except WorkflowError as e:
+        assert "Không đọc được pattern file" in str(e) and "missing_patterns.json" in str(e)
+    finally:
+        os.remove(path)
+
+    try:
+        load_workflow("/nonexistent/workflow.json")
+        assert False, "file không tồn tại phải báo lỗi"
+    except WorkflowError as e:
+        assert "Không đọc được workflow" in str(e)
+
+
+def test_load_workflow_with_pattern_file():
+    directory = tempfile.mkdtemp()
+    pattern_path = write_pattern_file(
+        {"resolution": list(SIZE), "patterns": {"extra": [{"coord": [540, 1200], "color": "#000000"}]}},
+        directory,
+    )
+    path = write_pattern_file(
+        make_workflow_data(
+            "normalized", tap=(0.5, 0.5), pattern_file=os.path.basename(pattern_path)
+        ),
+        directory,
+    )
+    try:
+        workflow = load_workflow(path)
+        assert set(workflow.patterns) == {"step4", "extra"}
+        # Pattern pixel của file được chuyển sang normalized theo resolution của file
+        assert workflow.plan_for(*SIZE).patterns["extra"].pixels[0][0] == (540, 1200)
+        assert workflow.plan_for(540, 1200).patterns["extra"].pixels[0][0] == (270, 600)
+    finally:
+        os.remove(path)
+        os.remove(pattern_path)
+        os.rmdir(directory)
+
+    # Workflow đi kèm repo luôn phải hợp lệ
+    assert load_workflow(DEFAULT_WORKFLOW_FILE).targets
+
+
+def test_plan_for_scaling_and_cache():
+    workflow = Workflow(
+        make_workflow_data(
+            tap=(540, 1200),
+            resolution=list(SIZE),
+            density=420,
+            ocr_region={"top": "25%", "height": "50%"},
+        )
+    )
+    plan = workflow.plan_for(*SIZE)
+    assert workflow.plan_for(*SIZE) is plan  # Compile 1 lần cho mỗi thiết bị
+    assert workflow.plan_for(*SIZE, density=420) is not plan
+    assert plan.steps["step2"]["tap"] == (540, 1200)
+    assert plan.ocr_box == (0, 600, 1080, 1800)
+    assert plan.image_scale == 1.0
+    assert plan.scale_length(3) == 3  # Không biết density thiết bị => giữ nguyên
+
+    small = workflow.plan_for(720, 1600, density=280)
+    assert small.steps["step2"]["tap"] == (360, 800)
+    assert small.patterns["step4"].pixels[0][0] == (360, 800)
+    assert small.ocr_box == (0, 400, 720, 1200)
+    assert abs(small.image_scale - 720 / 1080) < 1e-9
+    assert small.scale_length(3) == 2
+    assert small.scale_length(0) == 0
+
+
+def test_pixel_and_normalized_workflows_agree():
+    taps = {"step2": (540, 1200), "step3": (100, 2300), "step4": (1079, 0), "step5": (0, 2399)}
+    pixel_data = make_workflow_data(resolution=list(SIZE))
+    for name, tap in taps.items():
+        pixel_data["steps"][name]["tap"] = list(tap)
+    pixel_workflow = Workflow(pixel_data)
+
+    normalized_data = make_workflow_data(
+        "normalized",
+        tap=(0.5, 0.5),
+        patterns=normalize_patterns(pixel_workflow.patterns, *SIZE),
+    )
+    for name, tap in taps.items():
+        normalized_data["steps"][name]["tap"] = [(tap[0] + 0.5) / SIZE[0], (tap[1] + 0.5) / SIZE[1]]
+    normalized_workflow = Workflow(normalized_data)
+
+    # Cùng tọa độ pixel trên thiết bị gốc và trên thiết bị khác tỷ lệ
+    for size in (SIZE, (720, 1600), (1440, 3200)):
+        pixel_plan = pixel_workflow.plan_for(*size)
+        normalized_plan = normalized_workflow.plan_for(*size)
+        for name in taps:
+            assert pixel_plan.steps[name]["tap"] == normalized_plan.steps[name]["tap"], (size, name)
+        assert (
+            pixel_plan.patterns["step4"].pixels[0][0]
+            == normalized_plan.patterns["step4"].pixels[0][0]
+        )
+
+    # Khác nhau khi thiết bị có insets: normalized tính trong vùng nội dung, pixel thì không
+    assert pixel_workflow.plan_for(*SIZE, insets=INSETS).steps["step2"]["tap"] == (540, 1200)
+    assert normalized_workflow.plan_for(*SIZE, insets=INSETS).steps["step2"]["tap"] == (540, 1224)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__]))
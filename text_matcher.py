@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+So khớp nhiều target text cùng lúc trên token OCR đã chuẩn hóa
+
+Danh sách target được compile 1 lần thành automaton Aho-Corasick theo token,
+sau đó 1 lần duyệt qua các từ OCR trả về mọi target xuất hiện kèm box của cụm từ.
+Chi phí so khớp không tăng theo số lượng target.
+
+Chế độ fuzzy (max_edits > 0) chấp nhận lỗi OCR kiểu "Treasurc" / "Dlg":
+mỗi token được phép sai tối đa 1 số ký tự theo độ dài (edit distance có giới hạn),
+ứng viên được lọc trước bằng index bigram trên từ vựng của target.
+"""
+
+import re
+import unicodedata
+from collections import deque, namedtuple
+
+# Kết quả khớp 1 target: vị trí token [start, end), box (x0, y0, x1, y1), tâm,
+# confidence OCR và score (1.0 = khớp chính xác, giảm theo số ký tự phải sửa)
+TargetHit = namedtuple("TargetHit", "target index start end box center conf score")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+DEFAULT_MIN_SCORE = 0.8  # Score tối thiểu của cả cụm từ khi so khớp fuzzy
+_ALTERNATIVES_CACHE_SIZE = 4096  # Số token OCR được cache kết quả tra từ vựng
+
+
+def tokenize(text):
+    """Chuẩn hóa và tách text thành token (chữ thường, bỏ dấu câu)"""
+    return _TOKEN_RE.findall(unicodedata.normalize("NFC", text).lower())
+
+
+def token_edit_budget(token, max_edits):
+    """Số ký tự được phép sai của 1 token: token ngắn phải khớp chính xác hơn"""
+    if len(token) <= 2:
+        return 0
+    if len(token) <= 5:
+        return min(1, max_edits)
+    return max_edits
+
+
+def bounded_edit_distance(a, b, limit):
+    """Levenshtein distance giữa a và b, trả về None nếu vượt quá limit
+
+    Chỉ tính trong dải đường chéo rộng 2*limit+1 và dừng sớm khi cả hàng vượt limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if limit == 0:
+        return 0 if a == b else None
+
+    over = limit + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        row_min = current[0]
+        for j in range(low, high + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            current[j] = value if value <= limit else over
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > limit:
+            return None
+        previous = current
+
+    return previous[len(b)] if previous[len(b)] <= limit else None
+
+
+def _bigrams(token):
+    padded = f"^{token}$"
+    return [padded[i : i + 2] for i in range(len(padded) - 1)]
+
+
+class TargetMatcher:
+    """Automaton Aho-Corasick trên token cho danh sách target text"""
+
+    def __init__(self, targets, max_edits=0, min_score=DEFAULT_MIN_SCORE):
+        """
+        Args:
+            targets: List target text theo thứ tự ưu tiên
+            max_edits: Số ký tự sai tối đa mỗi token (0 = chỉ khớp chính xác)
+            min_score: Score tối thiểu của cả cụm từ khi so khớp fuzzy (0.0-1.0)
+        """
+        self.targets = list(targets)
+        self.max_edits = max_edits
+        self.min_score = min_score
+        self._goto = [{}]  # state -> {token: state tiếp theo}
+        self._fail = [0]  # state -> state fallback khi không khớp token
+        self._output = [[]]  # state -> [(target index, số token)] kết thúc tại state
+        self._terminal = [[]]  # state -> [target index] kết thúc đúng tại state (không qua fail)
+        self._target_chars = {}  # target index -> tổng số ký tự của các token
+        self._vocabulary = {}  # token của target -> set bigram
+        self._bigram_index = {}  # bigram -> set token của target chứa bigram đó
+        self._alternatives_cache = {}
+
+        for index, target in enumerate(self.targets):
+            tokens = tokenize(target)
+            if not tokens:
+                continue
+            self._target_chars[index] = sum(len(token) for token in tokens)
+            for token in tokens:
+                if token not in self._vocabulary:
+                    self._vocabulary[token] = set(_bigrams(token))
+                    for gram in self._vocabulary[token]:
+                        self._bigram_index.setdefault(gram, set()).add(token)
+            state = 0
+            for token in tokens:
+                next_state = self._goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._terminal.append([])
+                    self._goto[state][token] = next_state
+                state = next_state
+            self._output[state].append((index, len(tokens)))
+            self._terminal[state].append(index)
+
+        # Tính fail link theo BFS (các state ở độ sâu 1 fallback về root)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(token, 0)
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def scan(self, tokens):
+        """Duyệt 1 lần qua dãy token, None = ngắt dòng (không khớp xuyên qua)
+
+        Returns:
+            List (target index, start, end) - end không bao gồm
+        """
+        matches = []
+        state = 0
+        for position, token in enumerate(tokens):
+            if token is None:
+                state = 0
+                continue
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for index, length in self._output[state]:
+                matches.append((index, position - length + 1, position + 1))
+        return matches
+
+    def token_alternatives(self, token):
+        """Các token của target gần với token OCR (trong giới hạn edit distance)
+
+        Returns:
+            List (token của target, số ký tự phải sửa)
+        """
+        if token in self._vocabulary:
+            return [(token, 0)]
+
+        cached = self._alternatives_cache.get(token)
+        if cached is not None:
+            return cached
+
+        budget = token_edit_budget(token, self.max_edits)
+        alternatives = []
+        if budget:
+            # Lọc trước bằng bigram: mỗi lần sửa 1 ký tự làm mất tối đa 2 bigram
+            shared = {}
+            for gram in _bigrams(token):
+                for candidate in self._bigram_index.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            for candidate, count in shared.items():
+                limit = min(budget, token_edit_budget(candidate, self.max_edits))
+                if count < max(len(token), len(candidate)) + 1 - 2 * limit:
+                    continue
+                distance = bounded_edit_distance(token, candidate, limit)
+                if distance is not None:
+                    alternatives.append((candidate, distance))
+
+        if len(self._alternatives_cache) >= _ALTERNATIVES_CACHE_SIZE:
+            self._alternatives_cache.clear()
+        self._alternatives_cache[token] = alternatives
+        return alternatives
+
+    def scan_fuzzy(self, tokens):
+        """Duyệt 1 lần qua dãy token, mỗi token có thể khớp gần đúng với token của target
+
+        Returns:
+            List (target index, start, end, score) - end không bao gồm
+        """
+        matches = []
+        active = []  # Các cụm đang khớp dở: (state, start, số ký tự đã sửa)
+        for position, token in enumerate(tokens):
+            if token is None:
+                active = []
+                continue
+            alternatives = self.token_alternatives(token)
+            if not alternatives:
+                active = []
+                continue
+
+            next_active = []
+            for state, start, edits in active + [(0, position, 0)]:
+                for candidate, distance in alternatives:
+                    next_state = self._goto[state].get(candidate)
+                    if next_state is None:
+                        continue
+                    next_active.append((next_state, start, edits + distance))
+                    for index in self._terminal[next_state]:
+                        score = 1.0 - (edits + distance) / self._target_chars[index]
+                        if score >= self.min_score:
+                            matches.append((index, start, position + 1, score))
+            active = next_active
+        return matches
+
+    def find_matches(self, tokens):
+        """Khớp chính xác hoặc fuzzy tùy max_edits
+
+        Returns:
+            List (target index, start, end, score)
+        """
+        if self.max_edits:
+            return self.scan_fuzzy(tokens)
+        return [(index, start, end, 1.0) for index, start, end in self.scan(tokens)]
+
+    def search_text(self, text):
+        """Tìm các target có trong text (không khớp xuyên dòng)
+
+        Returns:
+            List target tìm thấy, theo thứ tự ưu tiên trong danh sách target
+        """
+        tokens = []
+        for line in text.splitlines():
+            tokens.extend(tokenize(line))
+            tokens.append(None)
+        found = {match[0] for match in self.find_matches(tokens)}
+        return [self.targets[index] for index in sorted(found)]
+
+    def match_ocr_data(self, ocr_data):
+        """Tìm tất cả target trong dữ liệu image_to_data của Tesseract
+
+        Từ rỗng (các dòng/khối của Tesseract) và từ chỉ có ký tự nhiễu được coi là ngắt dòng.
+
+        Returns:
+            List TargetHit, sắp xếp theo thứ tự ưu tiên target rồi vị trí trên màn hình
+        """
+        tokens = []
+        owners = []  # token -> index của từ OCR chứa token đó
+        for word_index, word in enumerate(ocr_data["text"]):
+            word_tokens = tokenize(word) or [None]
+            tokens.extend(word_tokens)
+            owners.extend([word_index] * len(word_tokens))
+
+        hits = []
+        for index, start, end, score in self.find_matches(tokens):
+            first_word = owners[start]
+            # Giống logic cũ: bỏ qua cụm từ có confidence của từ đầu tiên <= 0
+            if float(ocr_data["conf"][first_word]) <= 0:
+                continue
+
+            words = range(first_word, owners[end - 1] + 1)
+            x0 = min(ocr_data["left"][i] for i in words)
+            y0 = min(ocr_data["top"][i] for i in words)
+            x1 = max(ocr_data["left"][i] + ocr_data["width"][i] for i in words)
+            y1 = max(ocr_data["top"][i] + ocr_data["height"][i] for i in words)
+            hits.append(
+                TargetHit(
+                    self.targets[index],
+                    index,
+                    first_word,
+                    owners[end - 1] + 1,
+                    (x0, y0, x1, y1),
+                    ((x0 + x1) // 2, (y0 + y1) // 2),
+                    float(ocr_data["conf"][first_word]),
+                    score,
+                )
+            )
+
+        # Cùng target: ưu tiên cụm khớp chính xác hơn, rồi vị trí trên màn hình
+        hits.sort(key=lambda hit: (hit.index, -hit.score, hit.start))
+        return hits
@@ -0,0 +1,695 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Workflow khai báo cho chuỗi click (steps, vùng OCR, pixel patterns, targets, thời gian chờ)
+
+File workflow (JSON) được validate 1 lần khi load, sau đó compile thành ExecutionPlan
+cho từng độ phân giải thiết bị: vùng crop OCR, mảng index/màu của pattern và bảng
+route target -> pattern đều được tính trước, vòng lặp chính không phải parse gì nữa.
+
+Thứ tự tìm file workflow:
+    1. Đường dẫn truyền vào load_workflow()
+    2. ~/.lastwar_monitor_workflow.json (workflow riêng của người dùng)
+    3. workflow.json đi kèm tool
+
+Tọa độ (tap, pixel pattern) có 2 dạng, chọn bằng trường "coordinates":
+    - "pixels" (mặc định): pixel tuyệt đối; nếu khai báo "resolution" thì được scale
+      theo độ phân giải thiết bị
+    - "normalized": tỷ lệ [0, 1) trong vùng hiển thị nội dung (màn hình trừ phần khuyết
+      camera/notch), 1 workflow dùng chung cho mọi thiết bị. Pixel (x, y) ứng với tâm
+      pixel ((x + 0.5) / rộng, (y + 0.5) / cao) của vùng nội dung
+Mỗi thiết bị (kích thước, insets, density) được chuyển thành bảng pixel 1 lần và cache.
+
+"detection" khai báo thứ tự các stage kiểm tra rẻ chạy trước OCR (detection_cascade.py).
+
+Workflow có thể trỏ tới 1 pattern file ("pattern_file", đường dẫn tương đối với
+file workflow), vd: file do extract_pixel_patterns.py sinh ra. Pattern trong file đó
+ghi đè pattern cùng tên khai báo trực tiếp trong workflow.
+"""
+
+import copy
+import json
+import os
+import re
+from collections import namedtuple
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+DEFAULT_WORKFLOW_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "workflow.json"
+)
+USER_WORKFLOW_FILE = os.path.expanduser("~/.lastwar_monitor_workflow.json")
+
+# Các bước bắt buộc và trường số (giây/lần) của từng bước
+REQUIRED_STEPS = ("step2", "step3", "step4", "step5", "reset")
+STEP_NUMBER_FIELDS = (
+    "wait_before",
+    "wait_after",
+    "retries",
+    "retry_wait",
+    "timeout",
+    "check_interval",
+    "gift_check_interval",
+)
+
+# Các loại stage của detection cascade (xem detection_cascade.py), "ocr" luôn ở cuối
+DETECTION_STAGE_TYPES = ("unchanged", "screen", "color", "pattern", "template", "ocr")
+DEFAULT_DETECTION = [{"type": "unchanged"}, {"type": "ocr"}]
+
+_HEX_COLOR_RE = re.compile(r"^#[0-9A-Fa-f]{6}$")
+
+# Pattern đã compile: pixels = list (coord, r, g, b, hex) cho vòng lặp từng pixel,
+# xs/ys/rgb_array dạng numpy cho các phép tính vector hóa
+CompiledPattern = namedtuple("CompiledPattern", "pixels xs ys rgb_array")
+
+
+class WorkflowError(ValueError):
+    """Workflow không hợp lệ"""
+
+
+def parse_dimension(value, total):
+    """Parse dimension value - hỗ trợ % và px
+
+    Args:
+        value: Giá trị string (vd: '30%', '500', '0.3') hoặc số
+        total: Tổng kích thước (width hoặc height) để tính %
+
+    Returns:
+        int: Giá trị pixel
+    """
+    if value is None:
+        return None
+
+    # Nếu là số thực trong khoảng 0-1, coi như phần trăm
+    if isinstance(value, (int, float)):
+        if 0 <= value <= 1:
+            return int(value * total)
+        return int(value)
+
+    # Nếu là string
+    value_str = str(value).strip()
+
+    # Kiểm tra %
+    if value_str.endswith("%"):
+        percent = float(value_str[:-1]) / 100
+        return int(percent * total)
+
+    # Kiểm tra số thực 0-1
+    try:
+        num = float(value_str)
+        if 0 <= num <= 1:
+            return int(num * total)
+        return int(num)
+    except ValueError:
+        return None
+
+
+def compute_ocr_box(region, width, height):
+    """Tính vùng OCR (left, top, right, bottom) theo region - hỗ trợ % và px"""
+    if not region:
+        return 0, 0, width, height
+
+    top = parse_dimension(region.get("top", 0), height) or 0
+    left = parse_dimension(region.get("left", 0), width) or 0
+    ocr_width = parse_dimension(region.get("width"), width)
+    ocr_height = parse_dimension(region.get("height"), height)
+
+    # Nếu không có width/height, dùng toàn bộ từ left/top đến cuối
+    if ocr_width is None:
+        ocr_width = width - left
+    if ocr_height is None:
+        ocr_height = height - top
+
+    # Tính bottom và right, đảm bảo không vượt quá kích thước ảnh
+    right = min(left + ocr_width, width)
+    bottom = min(top + ocr_height, height)
+    return left, top, right, bottom
+
+
+def normalize_ocr_region(region):
+    """Chuẩn hóa ocr_region về dict {top, left, width, height}
+
+    Chấp nhận cả dạng cũ (top, bottom) theo tỷ lệ màn hình, vd: (0.7, 1.0).
+    """
+    if not region:
+        return {}
+    if isinstance(region, (list, tuple)):
+        if len(region) != 2:
+            raise WorkflowError(f"ocr_region dạng (top, bottom) cần 2 giá trị: {region}")
+        top, bottom = (float(v) for v in region)
+        if not 0 <= top < bottom <= 1:
+            raise WorkflowError(f"ocr_region (top, bottom) phải trong 0-1: {region}")
+        return {
+            "top": f"{top * 100:g}%",
+            "left": "0",
+            "width": "100%",
+            "height": f"{(bottom - top) * 100:g}%",
+        }
+    if not isinstance(region, dict):
+        raise WorkflowError(f"ocr_region không hợp lệ: {region!r}")
+
+    unknown = set(region) - {"top", "left", "width", "height"}
+    if unknown:
+        raise WorkflowError(f"ocr_region có trường lạ: {sorted(unknown)}")
+    for key, value in region.items():
+        if value is not None and parse_dimension(value, 100) is None:
+            raise WorkflowError(f"ocr_region.{key} không hợp lệ: {value!r}")
+    return dict(region)
+
+
+def _validate_coord(value, where, normalized=False):
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise WorkflowError(f"{where}: tọa độ phải là [x, y], nhận {value!r}")
+    if normalized:
+        if not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) and 0 <= v < 1
+            for v in value
+        ):
+            raise WorkflowError(f"{where}: tọa độ normalized phải trong [0, 1), nhận {value!r}")
+        return (float(value[0]), float(value[1]))
+    if not all(isinstance(v, int) and v >= 0 for v in value):
+        raise WorkflowError(f"{where}: tọa độ phải là [x, y] số nguyên >= 0, nhận {value!r}")
+    return tuple(value)
+
+
+def _check_in_frame(coord, width, height, where):
+    """Tọa độ pixel phải nằm trong ảnh width x height (không kẹp về mép)"""
+    if not (0 <= coord[0] < width and 0 <= coord[1] < height):
+        raise WorkflowError(
+            f"{where}: tọa độ {list(coord)} nằm ngoài màn hình {width}x{height}"
+        )
+
+
+def content_rect(width, height, insets=(0, 0, 0, 0)):
+    """Vùng nội dung (left, top, rộng, cao) của màn hình trừ insets (notch/camera)"""
+    left, top, right, bottom = insets
+    content_width, content_height = width - left - right, height - top - bottom
+    if content_width <= 0 or content_height <= 0:
+        raise WorkflowError(f"insets {list(insets)} lớn hơn màn hình {width}x{height}")
+    return left, top, content_width, content_height
+
+
+def normalize_patterns(patterns, width, height, insets=(0, 0, 0, 0)):
+    """Chuyển patterns tọa độ pixel (ảnh width x height) sang tọa độ normalized
+
+    Dùng cùng vùng nội dung (trừ insets) với ExecutionPlan nên pixel -> normalized -> plan
+    của chính thiết bị đó trả về đúng pixel ban đầu. Pixel nằm ngoài vùng nội dung bị từ chối.
+    """
+    left, top, content_width, content_height = content_rect(width, height, insets)
+    normalized = {}
+    for name, pixels in patterns.items():
+        normalized[name] = []
+        for i, p in enumerate(pixels):
+            x, y = p["coord"][0] - left, p["coord"][1] - top
+            if not (0 <= x < content_width and 0 <= y < content_height):
+                raise WorkflowError(
+                    f"patterns.{name}[{i}]: tọa độ {list(p['coord'])} nằm ngoài vùng nội dung"
+                    f" {width}x{height} (insets {list(insets)})"
+                )
+            normalized[name].append(
+                {
+                    "coord": (
+                        round((x + 0.5) / content_width, 6),
+                        round((y + 0.5) / content_height, 6),
+                    ),
+                    "color": p["color"],
+                }
+            )
+    return normalized
+
+
+def _validate_patterns(patterns, normalized=False):
+    if not isinstance(patterns, dict):
+        raise WorkflowError("patterns phải là dict tên -> list pixel")
+
+    validated = {}
+    for name, pixels in patterns.items():
+        if not isinstance(pixels, (list, tuple)) or not pixels:
+            raise WorkflowError(f"Pattern '{name}' phải có ít nhất 1 pixel")
+        validated[name] = []
+        for i, pixel in enumerate(pixels):
+            where = f"patterns.{name}[{i}]"
+            color = pixel.get("color") if isinstance(pixel, dict) else None
+            if not isinstance(color, str) or not _HEX_COLOR_RE.match(color):
+                raise WorkflowError(f"{where}: màu phải có dạng #RRGGBB, nhận {color!r}")
+            validated[name].append(
+                {
+                    "coord": _validate_coord(pixel.get("coord"), where, normalized),
+                    "color": color.upper(),
+                }
+            )
+    return validated
+
+
+def _validate_steps(steps, patterns, normalized=False):
+    if not isinstance(steps, dict):
+        raise WorkflowError("steps phải là dict tên bước -> cấu hình")
+
+    missing = [name for name in REQUIRED_STEPS if name not in steps]
+    if missing:
+        raise WorkflowError(f"Thiếu các bước: {missing}")
+
+    validated = {}
+    for name, step in steps.items():
+        if not isinstance(step, dict):
+            raise WorkflowError(f"Bước '{name}' phải là dict")
+        step = dict(step)
+        step["tap"] = _validate_coord(step.get("tap"), f"steps.{name}.tap", normalized)
+
+        for field in STEP_NUMBER_FIELDS:
+            value = step.get(field)
+            if value is not None and (
+                not isinstance(value, (int, float)) or value < 0
+            ):
+                raise WorkflowError(f"steps.{name}.{field} phải là số >= 0, nhận {value!r}")
+
+        if "pattern" in step and step["pattern"] not in patterns:
+            raise WorkflowError(
+                f"steps.{name}.pattern '{step['pattern']}' không có trong patterns"
+            )
+
+        if "routes" in step:
+            routes = step["routes"]
+            if not isinstance(routes, list) or not routes:
+                raise WorkflowError(f"steps.{name}.routes phải là list không rỗng")
+            step["routes"] = []
+            for i, route in enumerate(routes):
+                keywords = route.get("keywords", [])
+                if not isinstance(keywords, list) or not all(
+                    isinstance(k, str) for k in keywords
+                ):
+                    raise WorkflowError(f"steps.{name}.routes[{i}].keywords phải là list chuỗi")
+                if route.get("pattern") not in patterns:
+                    raise WorkflowError(
+                        f"steps.{name}.routes[{i}].pattern '{route.get('pattern')}' không có trong patterns"
+                    )
+                step["routes"].append(
+                    {"keywords": list(keywords), "pattern": route["pattern"]}
+                )
+
+        if "waits" in step:
+            waits = step["waits"]
+            if not isinstance(waits, list) or not all(
+                isinstance(w, (int, float)) and w >= 0 for w in waits
+            ):
+                raise WorkflowError(f"steps.{name}.waits phải là list số >= 0")
+
+        if "countdown" in step:
+            countdown = step["countdown"]
+            if not isinstance(countdown, dict) or not countdown.get("region"):
+                raise WorkflowError(f"steps.{name}.countdown phải là dict có 'region'")
+            countdown = dict(countdown)
+            countdown["region"] = normalize_ocr_region(countdown["region"])
+            for field in ("lead_time", "reads", "read_interval", "max_drift"):
+                value = countdown.get(field)
+                if value is not None and (not isinstance(value, (int, float)) or value < 0):
+                    raise WorkflowError(
+                        f"steps.{name}.countdown.{field} phải là số >= 0, nhận {value!r}"
+                    )
+            step["countdown"] = countdown
+
+        validated[name] = step
+    return validated
+
+
+def _validate_fraction(stage, where, field, default, upper=1):
+    value = stage.get(field, default)
+    if not isinstance(value, (int, float)) or not 0 <= value <= upper:
+        raise WorkflowError(f"{where}.{field} phải là số trong 0-{upper}, nhận {value!r}")
+    return value
+
+
+def _validate_detection(stages, patterns):
+    if not isinstance(stages, list) or not stages:
+        raise WorkflowError("detection phải là list stage không rỗng")
+
+    validated, names = [], set()
+    for i, stage in enumerate(stages):
+        where = f"detection[{i}]"
+        if not isinstance(stage, dict) or stage.get("type") not in DETECTION_STAGE_TYPES:
+            raise WorkflowError(f"{where}.type phải là 1 trong {DETECTION_STAGE_TYPES}")
+        kind = stage["type"]
+        if kind == "ocr" and i != len(stages) - 1:
+            raise WorkflowError(f"{where}: stage 'ocr' phải ở cuối detection")
+
+        stage = dict(stage)
+        stage["region"] = normalize_ocr_region(stage.get("region"))
+        if kind == "unchanged":
+            stage["threshold"] = _validate_fraction(stage, where, "threshold", 1.0, 765)
+        elif kind == "color":
+            colors = stage.get("colors")
+            if not isinstance(colors, list) or not colors or not all(
+                isinstance(c, str) and _HEX_COLOR_RE.match(c) for c in colors
+            ):
+                raise WorkflowError(f"{where}.colors phải là list màu '#RRGGBB'")
+            stage["tolerance"] = _validate_fraction(stage, where, "tolerance", 30, 255)
+            stage["min_fraction"] = _validate_fraction(stage, where, "min_fraction", 0.001)
+        elif kind == "pattern":
+            pattern_names = stage.get("patterns")
+            if not isinstance(pattern_names, list) or not pattern_names:
+                raise WorkflowError(f"{where}.patterns phải là list tên pattern")
+            missing = [n for n in pattern_names if n not in patterns]
+            if missing:
+                raise WorkflowError(f"{where}.patterns {missing} không có trong patterns")
+        elif kind == "screen":
+            reject = stage.get("reject")
+            if not isinstance(reject, list) or not all(isinstance(r, str) for r in reject):
+                raise WorkflowError(f"{where}.reject phải là list nhãn màn hình")
+        elif kind == "template":
+            if not isinstance(stage.get("image"), str) or not stage["image"]:
+                raise WorkflowError(f"{where}.image phải là đường dẫn ảnh template")
+            stage["threshold"] = _validate_fraction(stage, where, "threshold", 0.8)
+            stage["scale"] = _validate_fraction(stage, where, "scale", 0.5)
+            if stage["scale"] == 0:
+                raise WorkflowError(f"{where}.scale phải > 0")
+
+        # Tên stage dùng trong báo cáo thống kê, phải duy nhất
+        name = stage.get("name") or kind
+        suffix = 2
+        while name in names:
+            name = f"{stage.get('name') or kind}_{suffix}"
+            suffix += 1
+        names.add(name)
+        stage["name"] = name
+        validated.append(stage)
+
+    if validated[-1]["type"] != "ocr":
+        validated.append({"type": "ocr", "name": "ocr", "region": {}})
+    return validated
+
+
+def validate_workflow(data):
+    """Validate và chuẩn hóa dữ liệu workflow
+
+    Returns:
+        Dict workflow đã chuẩn hóa
+
+    Raises:
+        WorkflowError: nếu workflow không hợp lệ
+    """
+    if not isinstance(data, dict):
+        raise WorkflowError("Workflow phải là 1 JSON object")
+
+    targets = data.get("targets")
+    if isinstance(targets, str):
+        targets = [targets]
+    if not isinstance(targets, list) or not targets or not all(
+        isinstance(t, str) and t.strip() for t in targets
+    ):
+        raise WorkflowError("targets phải là list chuỗi không rỗng")
+
+    coordinates = data.get("coordinates", "pixels")
+    if coordinates not in ("pixels", "normalized"):
+        raise WorkflowError(f"coordinates phải là 'pixels' hoặc 'normalized', nhận {coordinates!r}")
+    normalized = coordinates == "normalized"
+
+    resolution = data.get("resolution")
+    if resolution is not None:
+        resolution = _validate_coord(resolution, "resolution")
+        if 0 in resolution:
+            raise WorkflowError("resolution phải > 0")
+
+    density = data.get("density")
+    if density is not None and (not isinstance(density, int) or density <= 0):
+        raise WorkflowError(f"density phải là số nguyên > 0, nhận {density!r}")
+
+    patterns = _validate_patterns(data.get("patterns", {}), normalized)
+    steps = _validate_steps(data.get("steps", {}), patterns, normalized)
+    if resolution is not None and not normalized:
+        # Tọa độ pixel phải nằm trong resolution gốc, nếu không scale sẽ ra ngoài màn hình
+        for name, pixels in patterns.items():
+            for i, p in enumerate(pixels):
+                _check_in_frame(p["coord"], *resolution, f"patterns.{name}[{i}]")
+        for name, step in steps.items():
+            _check_in_frame(step["tap"], *resolution, f"steps.{name}.tap")
+    return {
+        "version": data.get("version", 1),
+        "targets": list(targets),
+        "coordinates": coordinates,
+        "resolution": resolution,
+        "density": density,
+        "ocr_region": normalize_ocr_region(data.get("ocr_region")),
+        "patterns": patterns,
+        "steps": steps,
+        "detection": _validate_detection(
+            data.get("detection", copy.deepcopy(DEFAULT_DETECTION)), patterns
+        ),
+    }
+
+
+class ExecutionPlan:
+    """Workflow đã compile cho 1 thiết bị - chỉ chứa giá trị pixel đã tính sẵn
+
+    Args:
+        workflow: Dict workflow đã validate
+        width, height: Kích thước màn hình (screenshot) của thiết bị
+        insets: (left, top, right, bottom) phần khuyết màn hình (notch/camera), px
+        density: DPI của thiết bị (None = không biết)
+    """
+
+    def __init__(self, workflow, width, height, insets=(0, 0, 0, 0), density=None):
+        self.size = (width, height)
+        self.insets = tuple(insets)
+        self.ocr_box = compute_ocr_box(workflow["ocr_region"], width, height)
+
+        if workflow["coordinates"] == "normalized":
+            # Tỷ lệ [0, 1) trong vùng nội dung (trừ insets) -> tâm pixel gần nhất
+            offset_x, offset_y, content_width, content_height = content_rect(
+                width, height, self.insets
+            )
+
+            def scale(coord, where):
+                return (
+                    offset_x + round(coord[0] * content_width - 0.5),
+                    offset_y + round(coord[1] * content_height - 0.5),
+                )
+
+        elif workflow["resolution"] and workflow["resolution"] != (width, height):
+            # Tọa độ pixel ứng với resolution gốc, scale theo tâm pixel
+            scale_x = width / workflow["resolution"][0]
+            scale_y = height / workflow["resolution"][1]
+
+            def scale(coord, where):
+                return (
+                    round((coord[0] + 0.5) * scale_x - 0.5),
+                    round((coord[1] + 0.5) * scale_y - 0.5),
+                )
+
+        else:
+
+            def scale(coord, where):
+                # Workflow pixel không có resolution: tọa độ phải nằm trong màn hình
+                _check_in_frame(coord, width, height, where)
+                return tuple(coord)
+
+        # Độ dài theo dp (vd: bán kính tìm pattern) scale theo density thiết bị
+        if workflow["density"] and density:
+            self.length_scale = density / workflow["density"]
+        else:
+            self.length_scale = 1.0
+
+        # Ảnh (template) chụp ở resolution gốc của workflow được scale theo chiều rộng thiết bị
+        if workflow["resolution"]:
+            self.image_scale = width / workflow["resolution"][0]
+        else:
+            self.image_scale = 1.0
+
+        # Detection cascade: vùng của từng stage (mặc định = vùng OCR) và màu đã parse
+        self.detection = []
+        for stage in workflow["detection"]:
+            compiled = dict(stage)
+            compiled["box"] = (
+                compute_ocr_box(stage["region"], width, height)
+                if stage["region"]
+                else self.ocr_box
+            )
+            if stage["type"] == "color":
+                compiled["rgb"] = [
+                    tuple(int(c[i : i + 2], 16) for i in (1, 3, 5)) for c in stage["colors"]
+                ]
+            self.detection.append(compiled)
+
+        self.patterns = {}
+        for name, pixels in workflow["patterns"].items():
+            compiled = [
+                (scale(p["coord"], f"patterns.{name}[{i}]"),)
+                + tuple(int(p["color"][i : i + 2], 16) for i in (1, 3, 5))
+                + (p["color"],)
+                for i, p in enumerate(pixels)
+            ]
+            if NUMPY_AVAILABLE:
+                xs = np.array([p[0][0] for p in compiled], dtype=np.intp)
+                ys = np.array([p[0][1] for p in compiled], dtype=np.intp)
+                rgb_array = np.array([p[1:4] for p in compiled], dtype=np.int16)
+            else:
+                xs = ys = rgb_array = None
+            self.patterns[name] = CompiledPattern(compiled, xs, ys, rgb_array)
+
+        self.steps = {}
+        for name, step in workflow["steps"].items():
+            compiled = dict(step)
+            compiled["tap"] = scale(step["tap"], f"steps.{name}.tap")
+            if "countdown" in step:
+                compiled["countdown_box"] = compute_ocr_box(
+                    step["countdown"]["region"], width, height
+                )
+            if "routes" in step:
+                compiled["routes"] = [
+                    (tuple(route["keywords"]), route["pattern"]) for route in step["routes"]
+                ]
+            self.steps[name] = compiled
+
+    def scale_length(self, pixels):
+        """Chuyển độ dài pixel ở density gốc của workflow sang pixel của thiết bị"""
+        return max(0, round(pixels * self.length_scale))
+
+    def route_pattern(self, step_name, target_text):
+        """Chọn pattern của bước theo target text (route đầu tiên có keyword khớp)"""
+        step = self.steps[step_name]
+        for keywords, pattern_name in step.get("routes", ()):
+            if not keywords or any(k in (target_text or "") for k in keywords):
+                return pattern_name
+        return step.get("pattern")
+
+
+class Workflow:
+    """Workflow đã validate, cache ExecutionPlan theo độ phân giải"""
+
+    def __init__(self, data, path=None):
+        self.data = validate_workflow(data)
+        self.path = path
+        self._plans = {}
+
+    @property
+    def targets(self):
+        return list(self.data["targets"])
+
+    @property
+    def ocr_region(self):
+        return dict(self.data["ocr_region"])
+
+    @property
+    def patterns(self):
+        return self.data["patterns"]
+
+    @property
+    def normalized(self):
+        return self.data["coordinates"] == "normalized"
+
+    def plan_for(self, width, height, insets=(0, 0, 0, 0), density=None):
+        """ExecutionPlan cho thiết bị (kích thước, insets, density), compile 1 lần rồi cache"""
+        key = (width, height, tuple(insets), density)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = ExecutionPlan(self.data, width, height, insets, density)
+            self._plans[key] = plan
+        return plan
+
+    def override(self, targets=None, ocr_region=None, patterns=None):
+        """Tạo Workflow mới với targets / ocr_region / patterns thay thế (đã validate lại)"""
+        data = copy.deepcopy(self.data)
+        if targets is not None:
+            data["targets"] = [targets] if isinstance(targets, str) else list(targets)
+        if ocr_region is not None:
+            data["ocr_region"] = ocr_region
+        if patterns is not None:
+            data["patterns"] = patterns
+        return Workflow(data, self.path)
+
+
+def load_pattern_file(path, normalized=False):
+    """Load và validate pattern file ({"patterns": {tên: [pixel, ...]}, ...})
+
+    Args:
+        normalized: True = trả về tọa độ normalized (pattern file pixel phải có "resolution",
+            "insets" tùy chọn là phần khuyết của thiết bị chụp screenshot)
+
+    Returns:
+        Dict tên pattern -> list pixel đã chuẩn hóa
+
+    Raises:
+        WorkflowError: nếu file không đọc được hoặc pattern không hợp lệ
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise WorkflowError(f"Không đọc được pattern file {path}: {e}")
+
+    if not isinstance(data, dict) or "patterns" not in data:
+        raise WorkflowError(f"{path}: pattern file phải có trường 'patterns'")
+    try:
+        if data.get("coordinates") == "normalized":
+            if not normalized:
+                raise WorkflowError("pattern file normalized chỉ dùng được với workflow normalized")
+            return _validate_patterns(data["patterns"], normalized=True)
+
+        patterns = _validate_patterns(data["patterns"])
+        if normalized:
+            resolution = data.get("resolution")
+            if not resolution:
+                raise WorkflowError("cần 'resolution' để chuyển pattern sang tọa độ normalized")
+            insets = data.get("insets", [0, 0, 0, 0])
+            if (
+                not isinstance(insets, (list, tuple))
+                or len(insets) != 4
+                or not all(isinstance(v, int) and v >= 0 for v in insets)
+            ):
+                raise WorkflowError(f"insets phải là [left, top, right, bottom] >= 0, nhận {insets!r}")
+            patterns = normalize_patterns(patterns, *resolution, insets=tuple(insets))
+        return patterns
+    except WorkflowError as e:
+        raise WorkflowError(f"{path}: {e}")
+
+
+def load_workflow(path=None):
+    """Load và validate workflow từ file JSON
+
+    Args:
+        path: Đường dẫn file, None = workflow của người dùng hoặc workflow mặc định
+
+    Raises:
+        WorkflowError: nếu file không đọc được hoặc workflow không hợp lệ
+    """
+    if path is None:
+        path = (
+            USER_WORKFLOW_FILE
+            if os.path.exists(USER_WORKFLOW_FILE)
+            else DEFAULT_WORKFLOW_FILE
+        )
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise WorkflowError(f"Không đọc được workflow {path}: {e}")
+
+    pattern_file = data.get("pattern_file") if isinstance(data, dict) else None
+    if pattern_file:
+        pattern_path = os.path.join(
+            os.path.dirname(os.path.abspath(path)), os.path.expanduser(pattern_file)
+        )
+        normalized = data.get("coordinates") == "normalized"
+        data["patterns"] = {
+            **data.get("patterns", {}),
+            **load_pattern_file(pattern_path, normalized),
+        }
+
+    # Ảnh template của detection cascade: đường dẫn tương đối với file workflow
+    detection = data.get("detection") if isinstance(data, dict) else None
+    if isinstance(detection, list):
+        base_dir = os.path.dirname(os.path.abspath(path))
+        for stage in detection:
+            if isinstance(stage, dict) and isinstance(stage.get("image"), str):
+                stage["image"] = os.path.join(base_dir, os.path.expanduser(stage["image"]))
+
+    try:
+        return Workflow(data, path)
+    except WorkflowError as e:
+        raise WorkflowError(f"{path}: {e}")